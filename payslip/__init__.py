@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
 __version__ = '0.3.2'
+
+default_app_config = 'payslip.apps.PayslipConfig'
@@ -1,12 +1,50 @@
 """Admin classes for the payslip app."""
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.urlresolvers import reverse
+from django.http import HttpResponseRedirect
+from django.utils.translation import ugettext, ugettext_lazy as _
 
 from . import models
 
 
-admin.site.register(models.Company)
+class CompanyAdmin(admin.ModelAdmin):
+    """Custom admin for the ``Company`` model."""
+    actions = ['download_payslips']
+
+    def download_payslips(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(
+                request, _('Please select exactly one company.'),
+                level=messages.ERROR)
+            return
+        return HttpResponseRedirect('{0}?company={1}'.format(
+            reverse('payslip_archive'), queryset.get().pk))
+    download_payslips.short_description = _('Download payslips')
+
+
+class PayslipJobAdmin(admin.ModelAdmin):
+    """Custom admin for the ``PayslipJob`` model."""
+    list_display = ['__str__', 'status', 'worker', 'created', 'started',
+                    'finished']
+    list_filter = ['status']
+    readonly_fields = ['status', 'worker', 'filename', 'error', 'started',
+                       'finished']
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status=models.PayslipJob.PENDING).update(
+            status=models.PayslipJob.PENDING, worker='', error='',
+            started=None, finished=None)
+        self.message_user(request, ugettext(
+            '{0} jobs enqueued again.').format(count))
+    retry_jobs.short_description = _('Enqueue again')
+
+
+admin.site.register(models.Company, CompanyAdmin)
 admin.site.register(models.Employee)
 admin.site.register(models.ExtraField)
 admin.site.register(models.ExtraFieldType)
 admin.site.register(models.Payment)
 admin.site.register(models.PaymentType)
+admin.site.register(models.Payslip)
+admin.site.register(models.PayslipJob, PayslipJobAdmin)
@@ -2,3 +2,22 @@
 from django.conf import settings
 
 CURRENCY = getattr(settings, 'PAYSLIP_CURRENCY', 'EUR')
+
+PDF_WORKERS = getattr(settings, 'PAYSLIP_PDF_WORKERS', 2)
+
+JOB_TIMEOUT = getattr(settings, 'PAYSLIP_JOB_TIMEOUT', 3600)
+
+CACHE_BACKEND = getattr(settings, 'PAYSLIP_CACHE_BACKEND',
+                        'payslip.cache.DjangoCacheBackend')
+
+CACHE_OPTIONS = getattr(settings, 'PAYSLIP_CACHE_OPTIONS', {})
+
+DASHBOARD_PAGINATE_BY = getattr(settings, 'PAYSLIP_DASHBOARD_PAGINATE_BY', 25)
+
+CATALOGUE_CACHE = getattr(settings, 'PAYSLIP_CATALOGUE_CACHE', 'default')
+
+SERVER_TIMING = getattr(settings, 'PAYSLIP_SERVER_TIMING', False)
+
+PROFILING = getattr(settings, 'PAYSLIP_PROFILING', False)
+
+PROFILING_DIR = getattr(settings, 'PAYSLIP_PROFILING_DIR', None)
@@ -0,0 +1,16 @@
+"""App configuration of the ``payslip`` app."""
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+class PayslipConfig(AppConfig):
+    name = 'payslip'
+
+    def ready(self):
+        from .catalogue import invalidate_catalogue
+        for model_name in ('ExtraFieldType', 'PaymentType'):
+            model = self.get_model(model_name)
+            post_save.connect(invalidate_catalogue, sender=model,
+                              dispatch_uid='payslip_catalogue_save')
+            post_delete.connect(invalidate_catalogue, sender=model,
+                                dispatch_uid='payslip_catalogue_delete')
@@ -0,0 +1,260 @@
+"""Benchmarks of the hot paths of the ``payslip`` app."""
+import platform
+from contextlib import contextmanager
+from timeit import default_timer
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localtime
+
+from . import app_settings, cache
+from .engine import PayrollRun
+from .forms import EmployeeForm, PaymentForm
+from .models import Company, Employee, ExtraField
+from .seeding import Seeder
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+#: Version of the format of the results.
+VERSION = 1
+
+#: Datasets of increasing size as ``(name, arguments of the Seeder)``.
+DATASETS = (
+    ('small', {'companies': 1, 'employees': 10}),
+    ('medium', {'companies': 2, 'employees': 100}),
+    ('large', {'companies': 5, 'employees': 400}),
+)
+
+#: Names of the benchmarks. Every name is a ``bench_<name>`` method of the
+#: ``BenchmarkSuite``.
+BENCHMARKS = (
+    'payslip_html',
+    'payslip_pdf',
+    'dashboard',
+    'employee_form',
+    'payment_form',
+    'payroll_run',
+)
+
+
+@contextmanager
+def payslip_cache(enabled):
+    """Enables or disables the cache of the rendered payslips temporarily."""
+    backend = app_settings.CACHE_BACKEND
+    if not enabled:
+        app_settings.CACHE_BACKEND = None
+    cache._cache = None
+    try:
+        yield
+    finally:
+        app_settings.CACHE_BACKEND = backend
+        cache._cache = None
+
+
+def measure(func, repeat=5):
+    """
+    Calls a function once to warm up and returns the number of queries,
+    the best and median wall time of ``repeat`` calls and the peak memory
+    of one call in bytes.
+
+    The peak memory is measured in a separate call, since tracing the memory
+    slows down the function. It is ``None`` without ``tracemalloc``.
+
+    """
+    func()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    # The captured queries are sliced from the log of the connection, which
+    # the next request resets, so they are counted right away
+    query_count = len(queries)
+    timings = []
+    for i in range(repeat):
+        started = default_timer()
+        func()
+        timings.append(default_timer() - started)
+    timings.sort()
+    peak_memory = None
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        try:
+            func()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        'queries': query_count,
+        'best': timings[0],
+        'median': timings[len(timings) // 2],
+        'peak_memory': peak_memory,
+    }
+
+
+class BenchmarkSuite(object):
+    """
+    Measures the benchmarks against the seeded data of the database.
+
+    The benchmarks use a staff user, who manages the first company, so the
+    views show what a manager sees.
+
+    :year: Year of the calculated payslips.
+    :month: Month of the calculated payslips.
+
+    """
+    def __init__(self, year, month):
+        self.year = year
+        self.month = month
+        self.company = Company.objects.order_by('pk')[0]
+        self.employee = self.company.employees.select_related('user') \
+            .order_by('pk')[0]
+        self.payment = self.employee.payments.filter(
+            extra_fields__isnull=False).order_by('pk')[0]
+        user = get_user_model().objects.create(
+            username='benchmark', is_staff=True)
+        Employee.objects.create(user=user, company=self.company,
+                                is_manager=True)
+        self.client = Client()
+        self.client.force_login(user)
+        self.calls = 0
+
+    def get_value(self, field_type_name):
+        """
+        Returns another fixed value of the given field type on every call, so
+        every save changes the extra fields.
+
+        """
+        values = ExtraField.objects.filter(
+            field_type__name=field_type_name).order_by('pk').values_list(
+                'value', flat=True)
+        self.calls += 1
+        return values[self.calls % len(values)]
+
+    def post_payslip(self, **data):
+        data.update({'employee': self.employee.pk, 'year': self.year,
+                     'month': self.month})
+        response = self.client.post(reverse('payslip_generator'), data)
+        assert response.status_code == 200, response.status_code
+
+    def bench_payslip_html(self):
+        self.post_payslip()
+
+    def bench_payslip_pdf(self):
+        self.post_payslip(download=1)
+
+    def bench_dashboard(self):
+        response = self.client.get(reverse('payslip_dashboard'))
+        assert response.status_code == 200, response.status_code
+
+    def bench_employee_form(self):
+        user = self.employee.user
+        form = EmployeeForm(self.company, instance=self.employee, data={
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+            'hr_number': self.employee.hr_number,
+            'title': self.employee.title,
+            'Tax class': self.get_value('Tax class'),
+            'Personnel file': 'PF-{0}'.format(self.calls),
+        })
+        assert form.is_valid(), form.errors
+        form.save()
+
+    def bench_payment_form(self):
+        date_format = '%Y-%m-%d %H:%M:%S'
+        form = PaymentForm(instance=self.payment, data={
+            'payment_type': self.payment.payment_type_id,
+            'employee': self.payment.employee_id,
+            'amount': self.payment.amount,
+            'date': localtime(self.payment.date).strftime(date_format),
+            'description': 'Benchmark {0}'.format(self.calls),
+            'Cost centre': self.get_value('Cost centre'),
+        })
+        assert form.is_valid(), form.errors
+        form.save()
+
+    def bench_payroll_run(self):
+        PayrollRun(self.company, self.year, self.month).run()
+
+    def run(self, benchmarks=BENCHMARKS, repeat=5):
+        """Yields the name and the measurements of every benchmark."""
+        for name in benchmarks:
+            yield name, measure(getattr(self, 'bench_{0}'.format(name)),
+                                repeat=repeat)
+
+
+def run_benchmarks(datasets=DATASETS, benchmarks=BENCHMARKS, repeat=5,
+                   use_cache=False, seed=0):
+    """
+    Seeds every dataset into an empty database, measures the benchmarks and
+    returns the results as a dictionary, which can be serialised as JSON.
+
+    Run it against a test database, since it deletes all data of the
+    database.
+
+    :use_cache: Whether the payslips are taken from the cache of the
+      ``PAYSLIP_CACHE_BACKEND`` setting, which makes all but the first
+      rendering cache hits.
+
+    """
+    results = []
+    for dataset, arguments in datasets:
+        call_command('flush', interactive=False, verbosity=0)
+        seeder = Seeder(seed=seed, **arguments)
+        seeded = seeder.run()
+        suite = BenchmarkSuite(seeder.end_year, 1)
+        with payslip_cache(use_cache):
+            for name, measurements in suite.run(benchmarks, repeat):
+                measurements.update({
+                    'dataset': dataset,
+                    'benchmark': name,
+                    'employees': seeded.employees,
+                    'payments': seeded.payments,
+                })
+                results.append(measurements)
+    return {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'cache': use_cache,
+        'results': results,
+    }
+
+
+def compare(baseline, results, threshold=1.25):
+    """
+    Returns a message for every benchmark of the results, which regressed
+    compared to the baseline results.
+
+    A benchmark regressed, if it needs more queries or if its median time or
+    peak memory grew by more than the ``threshold`` factor.
+
+    """
+    baseline = dict(((result['dataset'], result['benchmark']), result)
+                    for result in baseline['results'])
+    regressions = []
+    for result in results['results']:
+        old = baseline.get((result['dataset'], result['benchmark']))
+        if old is None:
+            continue
+        name = '{0}/{1}'.format(result['dataset'], result['benchmark'])
+        if result['queries'] > old['queries']:
+            regressions.append('{0}: {1} queries instead of {2}'.format(
+                name, result['queries'], old['queries']))
+        if result['median'] > old['median'] * threshold:
+            regressions.append('{0}: {1:.4f}s instead of {2:.4f}s'.format(
+                name, result['median'], old['median']))
+        if (result['peak_memory'] and old['peak_memory'] and
+                result['peak_memory'] > old['peak_memory'] * threshold):
+            regressions.append(
+                '{0}: {1} bytes of memory instead of {2}'.format(
+                    name, result['peak_memory'], old['peak_memory']))
+    return regressions
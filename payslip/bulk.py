@@ -0,0 +1,129 @@
+"""Helpers to insert many objects of the ``payslip`` app at once."""
+import multiprocessing
+import os
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import Case, Value, When
+
+#: Number of objects or values per query. SQLite allows 999 variables in
+#: one statement.
+BATCH_SIZE = 500
+
+
+def batched(values, size=BATCH_SIZE):
+    """Yields the given list in slices of ``size`` items."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def can_return_pks():
+    """
+    Returns ``True``, if the database returns the primary keys of bulk
+    inserts, e.g. PostgreSQL.
+
+    """
+    return getattr(connection.features, 'can_return_ids_from_bulk_insert',
+                   False)
+
+
+def bulk_create(model, objs, key=None, batch_size=BATCH_SIZE):
+    """
+    Inserts the given objects with as few queries as possible and returns
+    them with their primary keys.
+
+    Databases, which don't return the primary keys of bulk inserts, fetch
+    them afterwards by ``key``, the name of a field, which is unique among
+    the objects and the existing rows. Without ``key`` the objects are saved
+    one by one on these databases.
+
+    :model: The model of the objects.
+    :objs: The unsaved objects.
+    :key: Name of the unique field, e.g. ``username``.
+    :batch_size: Number of objects per query.
+
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    if can_return_pks():
+        return model.objects.bulk_create(objs, batch_size=batch_size)
+    if key is None:
+        for obj in objs:
+            obj.save(force_insert=True)
+        return objs
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    pks = {}
+    for values in batched([getattr(obj, key) for obj in objs], batch_size):
+        pks.update(model.objects.filter(**{
+            '{0}__in'.format(key): values}).order_by().values_list(
+                key, 'pk'))
+    for obj in objs:
+        obj.pk = pks[getattr(obj, key)]
+    return objs
+
+
+def bulk_update(model, objs, fields, batch_size=BATCH_SIZE):
+    """
+    Writes the given fields of existing objects with one query per batch.
+
+    Uses ``QuerySet.bulk_update`` of Django 2.2 and newer. Older versions
+    update each field with a ``CASE`` expression over the primary keys.
+
+    :model: The model of the objects.
+    :objs: The changed objects.
+    :fields: Names of the fields, which are written.
+    :batch_size: Number of objects per query.
+
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    if hasattr(model.objects, 'bulk_update'):
+        model.objects.bulk_update(objs, fields, batch_size=batch_size)
+        return
+    fields = [model._meta.get_field(name) for name in fields]
+    # Every object adds two parameters per field to the query
+    batch_size = max(1, batch_size // (2 * len(fields)))
+    for batch in batched(objs, batch_size):
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**dict(
+            (field.name, Case(*[
+                When(pk=obj.pk, then=Value(
+                    getattr(obj, field.attname), output_field=field))
+                for obj in batch], output_field=field))
+            for field in fields))
+
+
+def hash_password(password):
+    """
+    Hashes a password like ``make_password`` in a worker of a process pool.
+
+    Workers, which are spawned instead of forked (the default on Windows and
+    macOS), start without a configured Django, so it is set up first. This
+    module doesn't import any models, so the workers can import it before.
+
+    """
+    if not apps.ready:
+        django.setup()
+    return make_password(password)
+
+
+def workers_find_settings(start_method=None):
+    """
+    Returns whether the workers of a process pool find the settings. Forked
+    workers inherit them, spawned workers only find a settings module, which
+    is named by the ``DJANGO_SETTINGS_MODULE`` environment variable.
+
+    :start_method: The start method of the workers. Defaults to the one of
+      ``multiprocessing``.
+
+    """
+    if start_method is None:
+        if hasattr(multiprocessing, 'get_start_method'):
+            start_method = multiprocessing.get_start_method()
+        else:  # Python 2
+            start_method = 'fork' if os.name == 'posix' else 'spawn'
+    return (start_method == 'fork' or
+            bool(os.environ.get('DJANGO_SETTINGS_MODULE')))
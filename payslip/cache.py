@@ -0,0 +1,144 @@
+"""Cache of rendered payslips of the ``payslip`` app."""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.template.loader import get_template
+from django.utils import timezone, translation
+from django.utils.module_loading import import_string
+
+from . import __version__, app_settings
+from .engine import (
+    prefetch_employee_extra_fields,
+    prefetch_extra_field_values,
+)
+
+_cache = None
+
+
+class DjangoCacheBackend(object):
+    """
+    Stores the rendered payslips in one of Django's caches.
+
+    :alias: Alias of the cache in the ``CACHES`` setting.
+    :timeout: Timeout of the cache entries.
+
+    """
+    def __init__(self, alias='default', timeout=DEFAULT_TIMEOUT):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get('payslip:{0}'.format(key))
+
+    def set(self, key, value):
+        self.cache.set('payslip:{0}'.format(key), value, self.timeout)
+
+
+class FileSystemCacheBackend(object):
+    """
+    Stores the rendered payslips as files in a local directory.
+
+    :location: Path of the directory.
+
+    """
+    def __init__(self, location):
+        self.location = location
+
+    def get_path(self, key):
+        return os.path.join(self.location, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self.get_path(key), 'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def set(self, key, value):
+        path = self.get_path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # Write to a temporary file first, so no process ever reads a
+        # partially written file
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as f:
+            f.write(value)
+        os.rename(tmp_path, path)
+
+
+def get_cache():
+    """
+    Returns the backend configured by ``PAYSLIP_CACHE_BACKEND`` or ``None``,
+    if caching is disabled.
+
+    """
+    global _cache
+    if _cache is None and app_settings.CACHE_BACKEND:
+        _cache = import_string(app_settings.CACHE_BACKEND)(
+            **app_settings.CACHE_OPTIONS)
+    return _cache
+
+
+def get_template_source(template_name):
+    """Returns the source of a template or its name, if it is unknown."""
+    template = get_template(template_name)
+    return getattr(getattr(template, 'template', template), 'source',
+                   template_name)
+
+
+def get_payslip_digest(result, payment_extra_fields, kind, stylesheet=b''):
+    """
+    Returns a digest of everything a rendered payslip depends on, including
+    the active language and time zone.
+
+    :result: The ``PayslipResult``.
+    :payment_extra_fields: The ``ExtraFieldType`` columns of the payments.
+    :kind: What is rendered, e.g. ``pdf`` or ``html``.
+    :stylesheet: The stylesheet, which is applied to the rendering.
+
+    """
+    employee = result.employee
+    prefetch_employee_extra_fields([employee])
+    prefetch_extra_field_values(result.payments)
+    data = {
+        'kind': kind,
+        'version': __version__,
+        # The payslip shows the date it was printed
+        'today': timezone.localtime(timezone.now()).date(),
+        'currency': app_settings.CURRENCY,
+        # The texts, dates and numbers are localised
+        'locale': [translation.get_language(), settings.USE_L10N,
+                   settings.USE_THOUSAND_SEPARATOR,
+                   timezone.get_current_timezone_name()],
+        'templates': [
+            get_template_source('payslip/payslip.html'),
+            get_template_source('payslip/partials/payslip_content.html'),
+        ],
+        'stylesheet': hashlib.sha256(stylesheet).hexdigest(),
+        'company': [employee.company.pk, employee.company.name,
+                    employee.company.address],
+        'employee': [
+            employee.pk, employee.user.first_name, employee.user.last_name,
+            employee.hr_number, employee.address, employee.title,
+            sorted((field.field_type.name, field.value)
+                   for field in employee.extra_fields.all()),
+        ],
+        'period': [result.date_start, result.date_end],
+        'sums': [result.sum, result.sum_neg, result.sum_year,
+                 result.sum_year_neg],
+        'payment_extra_fields': [
+            [field_type.pk, field_type.name]
+            for field_type in payment_extra_fields],
+        'payments': [
+            [payment.pk, payment.payment_type.name,
+             payment.payment_type.rrule, payment.amount, payment.date,
+             sorted(payment.extra_field_values.items())]
+            for payment in result.payments],
+    }
+    return hashlib.sha256(json.dumps(
+        data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
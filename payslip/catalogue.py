@@ -0,0 +1,109 @@
+"""Process-local catalogue of the field and payment types of the ``payslip``
+app."""
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from . import app_settings
+from .models import ExtraFieldType, PaymentType
+
+VERSION_KEY = 'payslip:catalogue:version'
+
+_catalogue = None
+
+
+class Catalogue(object):
+    """
+    Snapshot of all ``ExtraFieldType`` and ``PaymentType`` objects.
+
+    Every table is loaded, when it is used for the first time.
+
+    :version: Version of the catalogue it has been loaded for.
+
+    """
+    def __init__(self, version):
+        self.version = version
+
+    @cached_property
+    def extra_field_types(self):
+        return tuple(ExtraFieldType.objects.all())
+
+    @cached_property
+    def payment_types(self):
+        return tuple(PaymentType.objects.all())
+
+    @cached_property
+    def payment_types_by_pk(self):
+        return dict((payment_type.pk, payment_type)
+                    for payment_type in self.payment_types)
+
+    def get_extra_field_types(self, model, include_general=False):
+        """
+        Returns the extra field types of a model, e.g. ``'Payment'``.
+
+        :include_general: Include the types, which are not limited to a
+          model.
+
+        """
+        return [extra_field_type
+                for extra_field_type in self.extra_field_types
+                if extra_field_type.model == model or (
+                    include_general and not extra_field_type.model)]
+
+
+def get_version_cache():
+    return caches[app_settings.CATALOGUE_CACHE]
+
+
+def get_version():
+    """
+    Returns the current version of the catalogue, which is shared by all
+    processes through the Django cache.
+
+    """
+    cache = get_version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_catalogue():
+    """
+    Returns the ``Catalogue`` of the current process and reloads it, if its
+    version is outdated.
+
+    Without a working cache, e.g. the ``DummyCache``, the catalogue is loaded
+    from the database on every call.
+
+    """
+    global _catalogue
+    version = get_version()
+    if version is None:
+        return Catalogue(None)
+    if _catalogue is None or _catalogue.version != version:
+        _catalogue = Catalogue(version)
+    return _catalogue
+
+
+def bump_version():
+    get_version_cache().set(VERSION_KEY, uuid4().hex, None)
+
+
+def invalidate_catalogue(**kwargs):
+    """
+    Makes all processes reload the catalogue. Connected to the ``post_save``
+    and ``post_delete`` signals of the catalogue models.
+
+    The version changes once more after the transaction is committed, so
+    processes, which reloaded the catalogue before, load the committed
+    state.
+
+    """
+    global _catalogue
+    _catalogue = None
+    bump_version()
+    transaction.on_commit(bump_version)
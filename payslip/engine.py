@@ -0,0 +1,538 @@
+"""Payslip calculation engine of the ``payslip`` app."""
+from calendar import monthrange
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby, islice
+from operator import attrgetter
+from timeit import default_timer
+
+import django
+from django.db.models import (
+    BooleanField,
+    Case,
+    DecimalField,
+    Prefetch,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.utils.timezone import get_default_timezone, make_aware
+
+from dateutil import relativedelta, rrule
+
+from .catalogue import get_catalogue
+from .models import ExtraField, Payment
+from .timing import StageTimer
+
+try:
+    from django.db.models import prefetch_related_objects
+except ImportError:  # Django < 1.10
+    from django.db.models.query import prefetch_related_objects as _prefetch
+
+    def prefetch_related_objects(model_instances, *related_lookups):
+        return _prefetch(model_instances, related_lookups)
+
+#: Number of payments, whose extra fields are fetched with one query. Keeps
+#: the ``IN`` clause below the variable limit of SQLite.
+PREFETCH_BATCH_SIZE = 500
+
+#: Number of rows, which ``iterate`` fetches from the database at once.
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def iterate(queryset, chunk_size=ITERATOR_CHUNK_SIZE):
+    """
+    Iterates over a queryset without caching its results, so the memory
+    doesn't grow with the number of rows.
+
+    Django 2.0 and newer fetch ``chunk_size`` rows at once, older versions
+    use their fixed chunk size.
+
+    """
+    if django.VERSION >= (2, 0):
+        return queryset.iterator(chunk_size=chunk_size)
+    return queryset.iterator()
+
+
+def _leap_years(year):
+    """Returns the number of leap years from year 1 until ``year``."""
+    return year // 4 - year // 100 + year // 400
+
+
+def _months_with_day(index, day):
+    """
+    Returns the number of months, which have the given ``day``, before the
+    month ``index``. The index counts the months since January of year 1.
+
+    """
+    years, months = divmod(index, 12)
+    # Every month but February has at least 30 days, seven have 31 days
+    count = years * (7 if day == 31 else 11)
+    if day <= 28:
+        count += years
+    elif day == 29:
+        count += _leap_years(years)
+    for month in range(1, months + 1):
+        if monthrange(years + 1, month)[1] >= day:
+            count += 1
+    return count
+
+
+def count_occurrences(freq, start, until):
+    """
+    Returns the number of occurrences of a recurring rule.
+
+    The result is the same as the one of
+    ``rrule.rrule(freq, dtstart=start, until=until).count()``, but the
+    ``MONTHLY`` and ``YEARLY`` rules are counted in constant time instead of
+    iterating over every single occurrence.
+
+    :freq: The ``rrule`` value of a ``PaymentType``.
+    :start: Naive datetime of the first occurrence.
+    :until: Naive datetime after which no occurrence is counted.
+
+    """
+    # Like dateutil we ignore the microseconds of the start
+    start = start.replace(microsecond=0)
+    if start > until:
+        return 0
+    # Does the occurrence in the last month or year lie after ``until``?
+    after_until = (start.day, start.time()) > (until.day, until.time())
+    if freq == 'MONTHLY':
+        # Months without the day of the start (e.g. the 31st) are skipped
+        first = (start.year - 1) * 12 + start.month - 1
+        last = (until.year - 1) * 12 + until.month - 1
+        if after_until:
+            last -= 1
+        return max(_months_with_day(last + 1, start.day) -
+                   _months_with_day(first, start.day), 0)
+    if freq == 'YEARLY':
+        last_year = until.year
+        if start.month > until.month or (
+                start.month == until.month and after_until):
+            last_year -= 1
+        if start.month == 2 and start.day == 29:
+            # Occurs in leap years only
+            return max(_leap_years(last_year) - _leap_years(start.year - 1),
+                       0)
+        return max(last_year - start.year + 1, 0)
+    return rrule.rrule(
+        rrule._rrulestr._freq_map.get(freq), dtstart=start, until=until,
+    ).count()
+
+
+def prefetch_extra_field_values(payments):
+    """
+    Sets ``extra_field_values`` of the given payments to a dictionary of
+    their extra field values keyed by the ID of the field type.
+
+    Fetches the extra fields of up to ``PREFETCH_BATCH_SIZE`` payments with
+    one query and skips payments, which already have their values.
+
+    """
+    pending = [payment for payment in payments
+               if not hasattr(payment, 'extra_field_values')]
+    for index in range(0, len(pending), PREFETCH_BATCH_SIZE):
+        batch = pending[index:index + PREFETCH_BATCH_SIZE]
+        prefetch_related_objects(batch, Prefetch(
+            'extra_fields', queryset=ExtraField.objects.order_by(),
+            to_attr='prefetched_extra_fields'))
+        for payment in batch:
+            payment.extra_field_values = dict(
+                (field.field_type_id, field.value)
+                for field in payment.prefetched_extra_fields)
+
+
+def prefetch_employee_extra_fields(employees):
+    """
+    Prefetches the extra fields of the given employees with their field
+    types, so ``employee.extra_fields.all()`` needs no further queries.
+
+    Fetches the extra fields of up to ``PREFETCH_BATCH_SIZE`` employees with
+    one query and skips employees, whose extra fields are prefetched already.
+
+    """
+    pending = [employee for employee in employees
+               if 'extra_fields' not in getattr(
+                   employee, '_prefetched_objects_cache', {})]
+    for index in range(0, len(pending), PREFETCH_BATCH_SIZE):
+        prefetch_related_objects(
+            pending[index:index + PREFETCH_BATCH_SIZE], Prefetch(
+                'extra_fields',
+                queryset=ExtraField.objects.select_related('field_type')))
+
+
+def resolve_payment_types(payments, catalogue=None):
+    """
+    Sets the payment types of the given payments from the catalogue, so the
+    payment queries don't need to select them.
+
+    """
+    if catalogue is None:
+        catalogue = get_catalogue()
+    for payment in payments:
+        # Types, which are missing in an outdated catalogue, are fetched by
+        # the payment itself
+        payment_type = catalogue.payment_types_by_pk.get(
+            payment.payment_type_id)
+        if payment_type is not None:
+            payment.payment_type = payment_type
+
+
+def iter_prefetched(payslips, batch_size=PREFETCH_BATCH_SIZE):
+    """
+    Yields the given ``PayslipResult`` objects after the extra fields of
+    their employees and payments have been fetched in batches of
+    ``batch_size`` payslips.
+
+    """
+    payslips = iter(payslips)
+    while True:
+        batch = list(islice(payslips, batch_size))
+        if not batch:
+            return
+        prefetch_employee_extra_fields(
+            [payslip.employee for payslip in batch])
+        prefetch_extra_field_values(
+            [payment for payslip in batch for payment in payslip.payments])
+        for payslip in batch:
+            yield payslip
+
+
+def _sum_amount(condition):
+    """Returns an aggregate of the amounts matching the given condition."""
+    return Sum(Case(When(condition, then='amount'), default=None,
+                    output_field=DecimalField()))
+
+
+class PayslipResult(namedtuple('PayslipResult', [
+        'employee', 'date_start', 'date_end', 'payments', 'sum', 'sum_neg',
+        'sum_year', 'sum_year_neg'])):
+    """
+    Immutable result of a payslip calculation.
+
+    :employee: The employee the payslip belongs to.
+    :date_start: First day of the period.
+    :date_end: Last day of the period.
+    :payments: Tuple of the payments, which are part of the period.
+    :sum: Sum of the positive payments of the period.
+    :sum_neg: Sum of the negative payments of the period.
+    :sum_year: Sum of the positive payments from January 1st until the end of
+      the period.
+    :sum_year_neg: Sum of the negative payments from January 1st until the end
+      of the period.
+
+    """
+    __slots__ = ()
+
+    @property
+    def sum_year_net(self):
+        """Returns the net total of the year until the end of the period."""
+        return self.sum_year + self.sum_year_neg
+
+
+class PayslipCalculator(object):
+    """
+    Calculates the payslip of one employee for one month.
+
+    Usage::
+
+        result = PayslipCalculator(employee, 2016, 3).calculate()
+
+    """
+    def __init__(self, employee, year, month):
+        self.employee = employee
+        self.date_start = datetime(int(year), int(month), 1)
+        self.january_1st = datetime(int(year), 1, 1)
+        self.date_end = self.date_start + relativedelta.relativedelta(
+            months=1) - relativedelta.relativedelta(days=1)
+        # Bounds of the queries. Like the period keys, they are in the default
+        # time zone, so the result doesn't depend on the active one.
+        self.aware_start = make_aware(self.date_start, get_default_timezone())
+        self.aware_end = make_aware(self.date_end, get_default_timezone())
+        # Period keys as stored in ``Payment.start_period`` and ``end_period``
+        self.period = int(year) * 12 + int(month)
+        self.january_period = int(year) * 12 + 1
+        self.december_period = int(year) * 12 + 12
+
+    def get_year_condition(self):
+        """Returns the condition for the payments of the selected year."""
+        single = Q(payment_type__rrule__exact='')
+        return ~single & (
+            # Recurring payments with past date and end_date in the selected
+            # year or later
+            Q(date__lte=self.aware_end, end_period__gte=self.january_period) |
+            # Recurring payments with past date in period and open end
+            Q(date__lte=self.aware_end, end_date__isnull=True,
+              payment_type__rrule__isnull=False)
+        ) | single & Q(
+            # Single payments in this year
+            start_period__gte=self.january_period,
+            start_period__lte=self.december_period,
+        )
+
+    def get_payments_year(self):
+        """Returns all payments, which are relevant for the selected year."""
+        return self.employee.payments.filter(self.get_year_condition())
+
+    def get_period_condition(self):
+        """Returns the condition for the payments of the selected period."""
+        return ~(
+            # Exclude single payments not transferred in the period
+            (Q(date__lt=self.aware_start) | Q(date__gt=self.aware_end)) &
+            Q(payment_type__rrule__exact='')
+        ) & (
+            # Recurring payments with past date and end_date in the period
+            Q(end_date__gte=self.aware_end, date__lte=self.aware_end) |
+            # Recurring payments with past date in period and open end
+            Q(date__lte=self.aware_end, end_date__isnull=True)
+        )
+
+    def count_recurrences(self, payment):
+        """
+        Returns how often a recurring payment accrued in the selected year
+        until the end of the period.
+
+        """
+        return self._count_recurrences(
+            payment.payment_type.rrule, payment.get_date_without_tz(),
+            payment.end_date and payment.get_end_date_without_tz())
+
+    def _count_recurrences(self, rrule_value, date, end_date):
+        # If the recurring payment started in a year before, let's take
+        # January 1st as a start, otherwise take the original date
+        start = date
+        if start.year < self.date_start.year:
+            start = self.january_1st
+        # If the payments ends before the period's end date, let's take this
+        # date, otherwise we can take the period's end
+        end = self.date_end
+        if end_date:
+            end = min(end_date, end)
+        return count_occurrences(rrule_value, start, end)
+
+    def calculate(self, timer=None):
+        """
+        Returns the ``PayslipResult`` of the selected period.
+
+        Needs two queries: One conditional aggregation for the sums of the
+        period and the single payments of the year and one for the payments of
+        the period together with the recurring payments of the year. The
+        payment types are taken from the catalogue.
+
+        :timer: Optional ``StageTimer``, which gets the durations of the
+          ``query`` and ``calculate`` stages.
+
+        """
+        if timer is None:
+            timer = StageTimer()
+        payments_year = self.get_payments_year()
+        period = self.get_period_condition()
+        single = Q(payment_type__rrule__exact='')
+
+        with timer.stage('query'):
+            totals = payments_year.aggregate(
+                # Period summaries
+                sum=_sum_amount(period & Q(amount__gt=0)),
+                sum_neg=_sum_amount(period & Q(amount__lt=0)),
+                # Yearly summaries of single payments
+                sum_year=_sum_amount(single & Q(amount__gt=0)),
+                sum_year_neg=_sum_amount(single & Q(amount__lt=0)),
+            )
+            # The default ordering of the payments would join the users
+            rows = list(payments_year.filter(period | ~single).annotate(
+                in_period=Case(When(period, then=Value(True)),
+                               default=Value(False),
+                               output_field=BooleanField())).order_by('-date'))
+            resolve_payment_types(rows)
+        with timer.stage('calculate'):
+            return self._calculate(totals, rows)
+
+    def _calculate(self, totals, rows):
+        sum_year = totals['sum_year'] or 0
+        sum_year_neg = totals['sum_year_neg'] or 0
+
+        payments = []
+        for payment in rows:
+            if payment.in_period:
+                payments.append(payment)
+            if not payment.payment_type.rrule:
+                continue
+            # Yearly summary of recurring payments, multiply amount with
+            # recurrings
+            if payment.amount > 0:
+                sum_year += payment.amount * self.count_recurrences(payment)
+            else:
+                sum_year_neg += payment.amount * self.count_recurrences(
+                    payment)
+
+        return PayslipResult(
+            employee=self.employee,
+            date_start=self.date_start,
+            date_end=self.date_end,
+            payments=tuple(payments),
+            sum=totals['sum'] or 0,
+            sum_neg=totals['sum_neg'] or 0,
+            sum_year=sum_year,
+            sum_year_neg=sum_year_neg,
+        )
+
+    def calculate_from_payments(self, payments):
+        """
+        Returns the ``PayslipResult`` calculated from already fetched
+        payments without any further query.
+
+        Applies the same conditions as ``calculate`` in Python, so the given
+        payments only need to include the employee's payments of the year.
+        Their payment types should be set with ``resolve_payment_types``.
+
+        """
+        payments_period = []
+        sums = {'sum': 0, 'sum_neg': 0, 'sum_year': 0, 'sum_year_neg': 0}
+        for payment in payments:
+            rrule_value = payment.payment_type.rrule
+            if rrule_value:
+                # The period keys rule out most payments before their dates
+                # need to be converted
+                if payment.start_period > self.period or (
+                        payment.end_period and
+                        payment.end_period < self.january_period):
+                    continue
+                date = payment.get_date_without_tz()
+                if date > self.date_end:
+                    continue
+                end_date = payment.end_date and \
+                    payment.get_end_date_without_tz()
+                amount = payment.amount * self._count_recurrences(
+                    rrule_value, date, end_date)
+            elif self.january_period <= payment.start_period <= \
+                    self.december_period:
+                amount = payment.amount
+            else:
+                continue
+            key = 'sum_year' if payment.amount > 0 else 'sum_year_neg'
+            sums[key] += amount
+
+            if not rrule_value:
+                if payment.start_period != self.period:
+                    continue
+                date = payment.get_date_without_tz()
+                end_date = payment.end_date and \
+                    payment.get_end_date_without_tz()
+            if date <= self.date_end and (
+                    not end_date or end_date >= self.date_end):
+                payments_period.append(payment)
+                if payment.amount > 0:
+                    sums['sum'] += payment.amount
+                elif payment.amount < 0:
+                    sums['sum_neg'] += payment.amount
+
+        payments_period.sort(key=lambda payment: payment.date, reverse=True)
+        return PayslipResult(
+            employee=self.employee,
+            date_start=self.date_start,
+            date_end=self.date_end,
+            payments=tuple(payments_period),
+            **sums
+        )
+
+
+class PayrollRunResult(namedtuple('PayrollRunResult', [
+        'company', 'date_start', 'date_end', 'payslips', 'payment_count',
+        'duration'])):
+    """
+    Immutable result of a payroll run.
+
+    :company: The company the payroll run belongs to.
+    :date_start: First day of the period.
+    :date_end: Last day of the period.
+    :payslips: Tuple of the ``PayslipResult`` of every employee.
+    :payment_count: Number of payments, which have been considered.
+    :duration: Duration of the run in seconds.
+
+    """
+    __slots__ = ()
+
+
+class PayrollRun(object):
+    """
+    Calculates the payslips of all employees of a company for one month.
+
+    Needs two queries regardless of the number of employees: One for the
+    employees and one for the payments of all employees of the year. The
+    payment types are taken from the catalogue.
+
+    Usage::
+
+        result = PayrollRun(company, 2016, 3).run()
+
+    """
+    def __init__(self, company, year, month):
+        self.company = company
+        self.year = int(year)
+        self.month = int(month)
+
+    def get_employees(self):
+        return self.company.employees.select_related('user', 'company')
+
+    def get_payments(self, period):
+        # Ordering by ``employee`` would join the company and user of the
+        # default ordering of the employees
+        return Payment.objects.filter(
+            period.get_year_condition(),
+            employee__company=self.company,
+        ).order_by('employee_id', '-date')
+
+    def iter_payslips(self, chunk_size=ITERATOR_CHUNK_SIZE):
+        """
+        Yields the ``PayslipResult`` of every employee ordered by the primary
+        key of the employees.
+
+        Uses the same two queries as ``run``, but streams both of them, so
+        only the payments of one employee are held in memory.
+
+        """
+        period = PayslipCalculator(None, self.year, self.month)
+        catalogue = get_catalogue()
+        payments = groupby(iterate(self.get_payments(period), chunk_size),
+                           attrgetter('employee_id'))
+        employee_id, group = next(payments, (None, None))
+        for employee in iterate(self.get_employees().order_by('pk'),
+                                chunk_size):
+            # Skip the payments of employees, which the employee query
+            # didn't return, e.g. because they have been added meanwhile
+            while employee_id is not None and employee_id < employee.pk:
+                employee_id, group = next(payments, (None, None))
+            employee_payments = []
+            if employee_id == employee.pk:
+                employee_payments = list(group)
+                resolve_payment_types(employee_payments, catalogue)
+                employee_id, group = next(payments, (None, None))
+            yield PayslipCalculator(
+                employee, self.year, self.month).calculate_from_payments(
+                    employee_payments)
+
+    def run(self):
+        """Returns the ``PayrollRunResult`` of the selected period."""
+        started = default_timer()
+        period = PayslipCalculator(None, self.year, self.month)
+        payments = {}
+        payment_count = 0
+        catalogue = get_catalogue()
+        for payment in self.get_payments(period):
+            resolve_payment_types([payment], catalogue)
+            payments.setdefault(payment.employee_id, []).append(payment)
+            payment_count += 1
+        payslips = tuple(
+            PayslipCalculator(employee, self.year, self.month)
+            .calculate_from_payments(payments.get(employee.pk, []))
+            for employee in self.get_employees())
+        return PayrollRunResult(
+            company=self.company,
+            date_start=period.date_start,
+            date_end=period.date_end,
+            payslips=payslips,
+            payment_count=payment_count,
+            duration=default_timer() - started,
+        )
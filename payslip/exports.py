@@ -0,0 +1,127 @@
+"""Streaming exports of the ``payslip`` app."""
+import csv
+import json
+from decimal import Decimal
+
+from django.utils import six
+from django.utils.timezone import localtime
+
+from .engine import ITERATOR_CHUNK_SIZE, PayrollRun
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+JOURNAL_FIELDS = (
+    'kind', 'year', 'month', 'hr_number', 'employee', 'payment_type', 'date',
+    'description', 'amount', 'earnings', 'deductions')
+
+#: Number of lines, which are joined to one chunk of the response.
+LINES_PER_CHUNK = 200
+
+
+def to_amount(value):
+    """Returns a sum of the engine, which may be ``0``, as a decimal."""
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def iter_months(start, end):
+    """Yields the ``(year, month)`` tuples from ``start`` until ``end``."""
+    year, month = start
+    while (year, month) <= tuple(end):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def get_journal_filename(company, start, end, format):
+    return 'journal_{0}_{1}_{2:02d}-{3}_{4:02d}.{5}'.format(
+        company.pk, start[0], start[1], end[0], end[1], format)
+
+
+def iter_journal(company, start, end, chunk_size=ITERATOR_CHUNK_SIZE):
+    """
+    Yields the payroll journal of a company as dictionaries with the keys of
+    ``JOURNAL_FIELDS``.
+
+    Every month yields one ``payment`` row per employee and payment of the
+    period, so recurring payments appear in every month they are paid, and
+    one ``total`` row per employee. The last row is the ``total`` of all
+    months and employees. The payroll runs are streamed, so the memory
+    doesn't grow with the size of the journal.
+
+    :company: The ``Company``.
+    :start: First month as ``(year, month)``.
+    :end: Last month as ``(year, month)``.
+
+    """
+    earnings = deductions = 0
+    for year, month in iter_months(start, end):
+        for payslip in PayrollRun(company, year, month).iter_payslips(
+                chunk_size):
+            employee = payslip.employee
+            employee_row = {
+                'year': year,
+                'month': month,
+                'hr_number': employee.hr_number,
+                'employee': six.text_type(employee),
+            }
+            for payment in payslip.payments:
+                yield dict(
+                    employee_row,
+                    kind='payment',
+                    payment_type=payment.payment_type.name,
+                    date=localtime(payment.date).date(),
+                    description=payment.description or '',
+                    amount=payment.amount,
+                )
+            yield dict(employee_row, kind='total',
+                       amount=to_amount(payslip.sum + payslip.sum_neg),
+                       earnings=to_amount(payslip.sum),
+                       deductions=to_amount(payslip.sum_neg))
+            earnings += payslip.sum
+            deductions += payslip.sum_neg
+    yield {'kind': 'total', 'amount': to_amount(earnings + deductions),
+           'earnings': to_amount(earnings),
+           'deductions': to_amount(deductions)}
+
+
+class Echo(object):
+    """File-like object, which returns what is written to it."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """Yields the given journal rows as CSV lines with a header row."""
+    writer = csv.DictWriter(Echo(), JOURNAL_FIELDS)
+    yield writer.writerow(dict(zip(JOURNAL_FIELDS, JOURNAL_FIELDS)))
+    for row in rows:
+        if six.PY2:
+            row = dict((key, six.text_type(value).encode('utf-8'))
+                       for key, value in row.items())
+        yield writer.writerow(row)
+
+
+def iter_jsonl(rows):
+    """Yields the given journal rows as JSON lines."""
+    for row in rows:
+        yield json.dumps(row, default=str, sort_keys=True) + '\n'
+
+
+def iter_journal_export(company, start, end, format):
+    """
+    Yields the payroll journal in the given format in chunks of
+    ``LINES_PER_CHUNK`` lines.
+
+    """
+    rows = iter_journal(company, start, end)
+    lines = iter_csv(rows) if format == 'csv' else iter_jsonl(rows)
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == LINES_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
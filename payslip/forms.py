@@ -3,13 +3,16 @@ import hashlib
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models import Q
+from django.db import models
+from django.db.models import Case, Value, When
 from django import forms
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from dateutil.relativedelta import relativedelta
 
+from .bulk import batched, bulk_create
+from .catalogue import get_catalogue
 from .models import (
     Company,
     Employee,
@@ -19,6 +22,13 @@ from .models import (
 )
 
 
+#: Number of usernames, which are checked with one query.
+USERNAME_CANDIDATES = 10
+
+#: Number of attempts to insert users with generated usernames.
+USERNAME_ATTEMPTS = 5
+
+
 def get_md5_hexdigest(email):
     """
     Returns an md5 hash for a given email.
@@ -31,46 +41,87 @@ def get_md5_hexdigest(email):
     return h.hexdigest()[0:30]
 
 
-def generate_username(email):
+def generate_username(email, exclude=()):
     """
     Generates a unique username for the given email.
 
     The username will be an md5 hash of the given email. If the username exists
-    we just append `a` to the email until we get a unique md5 hash.
+    we append `a` to the email until we get a unique md5 hash. The candidates
+    are checked in batches of ``USERNAME_CANDIDATES`` with one query each.
+
+    :exclude: Usernames, which must not be returned, e.g. because a
+      concurrent request just took them.
 
     """
-    username = get_md5_hexdigest(email)
-    found_unique_username = False
-    while not found_unique_username:
-        try:
-            get_user_model().objects.get(username=username)
-            email = '{0}a'.format(email)
-            username = get_md5_hexdigest(email)
-        except get_user_model().DoesNotExist:
-            found_unique_username = True
-            return username
+    offset = 0
+    while True:
+        candidates = [
+            get_md5_hexdigest('{0}{1}'.format(email, 'a' * index))
+            for index in range(offset, offset + USERNAME_CANDIDATES)]
+        taken = set(get_user_model().objects.filter(
+            username__in=candidates).values_list('username', flat=True))
+        for username in candidates:
+            if username not in taken and username not in exclude:
+                return username
+        offset += USERNAME_CANDIDATES
+
+
+def generate_usernames(emails, exclude=()):
+    """
+    Generates unique usernames for several emails at once.
+
+    Only the first candidate of each email is checked in bulk, the emails,
+    whose first candidate is taken, fall back to ``generate_username``.
+    Returns the usernames in the order of the emails.
+
+    """
+    candidates = [get_md5_hexdigest(email) for email in emails]
+    taken = set(exclude)
+    for values in batched(candidates):
+        taken.update(get_user_model().objects.filter(
+            username__in=values).values_list('username', flat=True))
+    usernames = []
+    for email, username in zip(emails, candidates):
+        if username in taken:
+            username = generate_username(email, exclude=taken)
+        taken.add(username)
+        usernames.append(username)
+    return usernames
 
 
 class ExtraFieldFormMixin(object):
-    """Mixin to handle extra field related functions."""
+    """
+    Mixin to handle extra field related functions.
+
+    The extra fields of the instance and the choices of all fixed value types
+    are loaded with one query each, so the number of queries does not grow
+    with the number of extra field types.
+
+    """
     def __init__(self, *args, **kwargs):
-        self.extra_field_types = ExtraFieldType.objects.filter(
-            Q(model=self.Meta.model.__name__) | Q(model__isnull=True))
-        if kwargs.get('instance'):
-            for extra_field_type in self.extra_field_types:
-                try:
-                    field = kwargs.get('instance').extra_fields.get(
-                        field_type__name=extra_field_type.name)
-                except ExtraField.DoesNotExist:
-                    pass
-                else:
-                    kwargs['initial'].update({'{0}'.format(
-                        extra_field_type.name): field.value})
+        self.extra_field_types = get_catalogue().get_extra_field_types(
+            self.Meta.model.__name__, include_general=True)
+        if kwargs.get('instance') and self.extra_field_types:
+            initial = kwargs.setdefault('initial', {})
+            names = dict((extra_field_type.pk, extra_field_type.name)
+                         for extra_field_type in self.extra_field_types)
+            for field in kwargs.get('instance').extra_fields.filter(
+                    field_type__in=list(names)).order_by():
+                initial.update({names[field.field_type_id]: field.value})
         super(ExtraFieldFormMixin, self).__init__(*args, **kwargs)
+        fixed_values = {}
+        fixed_types = [extra_field_type
+                       for extra_field_type in self.extra_field_types
+                       if extra_field_type.fixed_values]
+        if fixed_types:
+            for field_type_id, value in ExtraField.objects.filter(
+                    field_type__in=fixed_types).order_by().values_list(
+                        'field_type', 'value'):
+                fixed_values.setdefault(field_type_id, []).append(value)
         for extra_field_type in self.extra_field_types:
             if extra_field_type.fixed_values:
-                choices = [(x.value, x.value)
-                           for x in extra_field_type.extra_fields.all()]
+                choices = [(x, x) for x in fixed_values.get(
+                    extra_field_type.pk, [])]
                 choices.append(('', '-----'))
                 self.fields[extra_field_type.name] = forms.ChoiceField(
                     required=False,
@@ -82,39 +133,69 @@ class ExtraFieldFormMixin(object):
 
     def save(self, *args, **kwargs):
         resp = super(ExtraFieldFormMixin, self).save(*args, **kwargs)
+        if not self.extra_field_types:
+            return resp
+        current = {}
+        for field in self.instance.extra_fields.filter(
+                field_type__in=self.extra_field_types).order_by():
+            current.setdefault(field.field_type_id, field)
+
+        # Fixed values are shared, so they are exchanged instead of changed
+        fixed_values = dict(
+            (extra_field_type.pk, self.data.get(extra_field_type.name))
+            for extra_field_type in self.extra_field_types
+            if extra_field_type.fixed_values)
+        selected = {}
+        if fixed_values:
+            for field in ExtraField.objects.filter(
+                    field_type__in=list(fixed_values),
+                    value__in=[value for value in fixed_values.values()
+                               if value is not None]).order_by():
+                if fixed_values[field.field_type_id] == field.value:
+                    selected.setdefault(field.field_type_id, field)
+        to_remove = [current[pk] for pk in fixed_values
+                     if pk in current and current[pk] != selected.get(pk)]
+        to_add = [field for pk, field in selected.items()
+                  if current.get(pk) != field]
+
+        changed, new_fields = {}, []
         for extra_field_type in self.extra_field_types:
-            try:
-                field_to_save = self.instance.extra_fields.get(
-                    field_type__name=extra_field_type.name)
-            except ExtraField.DoesNotExist:
-                field_to_save = None
-            if extra_field_type.fixed_values:
-                if field_to_save:
-                    self.instance.extra_fields.remove(
-                        self.instance.extra_fields.get(
-                            field_type__name=extra_field_type.name))
-                try:
-                    field_to_save = ExtraField.objects.get(
-                        field_type__name=extra_field_type.name,
-                        value=self.data.get(extra_field_type.name))
-                except ExtraField.DoesNotExist:
-                    pass
-                else:
-                    self.instance.extra_fields.add(field_to_save)
-            else:
-                if field_to_save and self.data.get(extra_field_type.name):
-                    field_to_save.value = self.data[extra_field_type.name]
-                    field_to_save.save()
-                elif self.data.get(extra_field_type.name):
-                    new_field = ExtraField(
-                        field_type=extra_field_type,
-                        value=self.data.get(extra_field_type.name),
-                    )
-                    new_field.save()
-                    self.instance.extra_fields.add(new_field)
+            value = self.data.get(extra_field_type.name)
+            if extra_field_type.fixed_values or not value:
+                continue
+            field = current.get(extra_field_type.pk)
+            if field is None:
+                new_fields.append(ExtraField(field_type=extra_field_type,
+                                             value=value))
+            elif field.value != value:
+                changed[field.pk] = value
+        if changed:
+            ExtraField.objects.filter(pk__in=changed).update(value=Case(
+                *[When(pk=pk, then=Value(value))
+                  for pk, value in changed.items()],
+                output_field=models.CharField()))
+        if new_fields:
+            to_add += bulk_create(ExtraField, new_fields)
+        if to_remove:
+            self.instance.extra_fields.remove(*to_remove)
+        if to_add:
+            self.instance.extra_fields.add(*to_add)
         return resp
 
 
+class CompanyForm(forms.ModelForm):
+    """Form to create or update a Company instance."""
+    def __init__(self, *args, **kwargs):
+        super(CompanyForm, self).__init__(*args, **kwargs)
+        # The choices show the field types of the extra fields
+        self.fields['extra_fields'].queryset = \
+            self.fields['extra_fields'].queryset.select_related('field_type')
+
+    class Meta:
+        model = Company
+        fields = '__all__'
+
+
 class EmployeeForm(ExtraFieldFormMixin, forms.ModelForm):
     """Form to create a new Employee instance."""
     first_name = forms.CharField(max_length=30)
@@ -201,14 +282,59 @@ class EmployeeForm(ExtraFieldFormMixin, forms.ModelForm):
         fields = ('company', 'hr_number', 'address', 'title', 'is_manager')
 
 
+class EmployeeImportForm(forms.Form):
+    """
+    Form to validate one row of an employee import.
+
+    It doesn't query the database, the uniqueness of the emails and the
+    extra fields are checked for all rows at once by the importer.
+
+    """
+    first_name = forms.CharField(max_length=30)
+    last_name = forms.CharField(max_length=30)
+    email = forms.EmailField()
+    password = forms.CharField(max_length=128)
+    hr_number = forms.IntegerField(min_value=0, required=False)
+    address = forms.CharField(required=False)
+    title = forms.ChoiceField(
+        choices=Employee._meta.get_field('title').choices)
+    is_manager = forms.BooleanField(required=False)
+
+
 class PaymentForm(ExtraFieldFormMixin, forms.ModelForm):
     """Form to create a new Payment instance."""
+    def __init__(self, *args, **kwargs):
+        super(PaymentForm, self).__init__(*args, **kwargs)
+        # The choices show the names of the users
+        self.fields['employee'].queryset = \
+            self.fields['employee'].queryset.select_related('user')
+        field = self.fields['payment_type']
+        field.choices = [('', field.empty_label)] + [
+            (payment_type.pk, field.label_from_instance(payment_type))
+            for payment_type in get_catalogue().payment_types]
+
     class Meta:
         model = Payment
         fields = ('payment_type', 'employee', 'amount', 'date', 'end_date',
                   'description')
 
 
+class PaymentImportForm(forms.Form):
+    """
+    Form to validate one row of a payment import.
+
+    The employee is referenced by its HR number and the payment type by its
+    name, the importer resolves both without querying the database.
+
+    """
+    hr_number = forms.IntegerField(min_value=0)
+    payment_type = forms.CharField(max_length=100)
+    amount = forms.DecimalField(max_digits=10, decimal_places=2)
+    date = forms.DateTimeField()
+    end_date = forms.DateTimeField(required=False)
+    description = forms.CharField(max_length=100, required=False)
+
+
 class ExtraFieldForm(forms.ModelForm):
     """Form to create a new ExtraField instance."""
     def __init__(self, *args, **kwargs):
@@ -221,14 +347,13 @@ class ExtraFieldForm(forms.ModelForm):
         fields = '__all__'
 
 
-class PayslipForm(forms.Form):
-    """Form to create a custom payslip."""
+class PeriodForm(forms.Form):
+    """Form to select a month."""
     year = forms.ChoiceField()
     month = forms.ChoiceField()
-    employee = forms.ChoiceField()
 
-    def __init__(self, company, *args, **kwargs):
-        super(PayslipForm, self).__init__(*args, **kwargs)
+    def __init__(self, *args, **kwargs):
+        super(PeriodForm, self).__init__(*args, **kwargs)
         last_month = timezone.now().replace(day=1) - relativedelta(months=1)
         self.fields['month'].choices = (
             (1, _('January')),
@@ -249,10 +374,66 @@ class PayslipForm(forms.Form):
         self.fields['year'].choices = [
             (current_year - x, current_year - x) for x in range(0, 20)]
         self.fields['year'].initial = last_month.year
+
+
+class PayslipForm(PeriodForm):
+    """Form to create a custom payslip."""
+    employee = forms.ChoiceField()
+
+    def __init__(self, company, *args, **kwargs):
+        super(PayslipForm, self).__init__(*args, **kwargs)
         self.company = company
         if self.company:
             self.fields['employee'].choices = [(
-                x.id, x) for x in self.company.employees.all()]
+                x.id, x) for x in self.company.employees.select_related(
+                    'user')]
         else:
             self.fields['employee'].choices = [(
-                x.id, x) for x in Employee.objects.all()]
+                x.id, x) for x in Employee.objects.select_related('user')]
+
+
+class PayrollRunForm(PeriodForm):
+    """Form to calculate the payslips of all employees of a company."""
+    company = forms.ModelChoiceField(queryset=Company.objects.all())
+
+    def __init__(self, company, *args, **kwargs):
+        super(PayrollRunForm, self).__init__(*args, **kwargs)
+        self.company = company
+        if self.company:
+            self.fields['company'].queryset = Company.objects.filter(
+                pk=self.company.pk)
+            self.fields['company'].initial = self.company
+
+
+class JournalExportForm(PayrollRunForm):
+    """Form to export the payroll journal of a company for several months."""
+    end_year = forms.ChoiceField()
+    end_month = forms.ChoiceField()
+    format = forms.ChoiceField(choices=(
+        ('csv', _('CSV')),
+        ('jsonl', _('JSON Lines')),
+    ))
+
+    def __init__(self, *args, **kwargs):
+        super(JournalExportForm, self).__init__(*args, **kwargs)
+        for name in ('year', 'month'):
+            end_field = self.fields['end_{0}'.format(name)]
+            end_field.choices = self.fields[name].choices
+            end_field.initial = self.fields[name].initial
+
+    def clean(self):
+        data = super(JournalExportForm, self).clean()
+        if all(name in data for name in (
+                'year', 'month', 'end_year', 'end_month')):
+            data['start'] = (int(data['year']), int(data['month']))
+            data['end'] = (int(data['end_year']), int(data['end_month']))
+            if data['end'] < data['start']:
+                raise forms.ValidationError(
+                    _('The last month must not lie before the first one.'))
+        return data
+
+
+class PaymentUploadForm(forms.Form):
+    """Form to upload a CSV file with the payments of a company."""
+    company = forms.ModelChoiceField(queryset=Company.objects.all())
+    file = forms.FileField()
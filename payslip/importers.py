@@ -0,0 +1,603 @@
+"""Bulk imports of the ``payslip`` app."""
+import csv
+import json
+import operator
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import six
+from django.utils.six.moves import map
+from django.utils.translation import ugettext as _
+
+from .bulk import (
+    BATCH_SIZE,
+    batched,
+    bulk_create,
+    bulk_update,
+    can_return_pks,
+    hash_password,
+    workers_find_settings,
+)
+from .catalogue import get_catalogue
+from .forms import (
+    USERNAME_ATTEMPTS,
+    EmployeeImportForm,
+    PaymentImportForm,
+    generate_usernames,
+)
+from .models import Employee, ExtraField, Payment
+
+FORMATS = ('csv', 'json')
+
+#: Number of natural keys per query, which looks up existing payments.
+#: Each key takes three parameters.
+KEY_BATCH_SIZE = BATCH_SIZE // 3
+
+ImportResult = namedtuple('ImportResult', ['count', 'duration'])
+
+PaymentImportResult = namedtuple(
+    'PaymentImportResult',
+    ['rows', 'created', 'updated', 'skipped', 'errors', 'duration'])
+
+
+def get_format(filename):
+    """Returns the import format of a file by its extension or ``None``."""
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    return extension if extension in FORMATS else None
+
+
+class DecodedLines(object):
+    """
+    Iterates over the lines of a file as text. Bytes are decoded as UTF-8, a
+    ``ValidationError`` names the first line, which isn't.
+
+    :number: Number of the current line.
+
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.number = 0
+
+    def __iter__(self):
+        for line in self.lines:
+            self.number += 1
+            if isinstance(line, six.binary_type):
+                try:
+                    line = line.decode('utf-8-sig')
+                except UnicodeDecodeError:
+                    raise ValidationError(_(
+                        'Line {0} is not encoded as UTF-8.').format(
+                            self.number))
+            yield line
+
+
+def iter_csv_rows(lines):
+    """
+    Yields the rows of a CSV file with a header row as dictionaries.
+
+    Raises a ``ValidationError``, if the file is not encoded as UTF-8 or
+    can't be parsed.
+
+    :lines: Iterable of the lines as bytes or text, e.g. an open file or an
+      uploaded file, so big files are parsed one line at a time.
+
+    """
+    lines = DecodedLines(lines)
+    if six.PY2:
+        reader = csv.DictReader(line.encode('utf-8') for line in lines)
+    else:
+        reader = csv.DictReader(lines)
+    try:
+        for row in reader:
+            if six.PY2:
+                row = dict((key.decode('utf-8'), (value or b'').decode(
+                    'utf-8')) for key, value in row.items()
+                    if key is not None)
+            yield dict((key, value or '') for key, value in row.items()
+                       if key is not None)
+    except csv.Error as exc:
+        raise ValidationError(_('Line {0}: {1}').format(lines.number, exc))
+
+
+def read_rows(fileobj, format):
+    """
+    Returns the rows of a CSV file with a header row or of a JSON list of
+    objects as a list of dictionaries.
+
+    """
+    content = fileobj.read()
+    if format == 'json':
+        if isinstance(content, six.binary_type):
+            try:
+                content = content.decode('utf-8-sig')
+            except UnicodeDecodeError as exc:
+                raise ValidationError(_(
+                    'Line {0} is not encoded as UTF-8.').format(
+                        content[:exc.start].count(b'\n') + 1))
+        try:
+            rows = json.loads(content)
+        except ValueError as exc:
+            raise ValidationError(_('Invalid JSON: {0}').format(exc))
+        if not isinstance(rows, list) or not all(
+                isinstance(row, dict) for row in rows):
+            raise ValidationError(_('The JSON must be a list of objects.'))
+        return rows
+    return list(iter_csv_rows(content.splitlines(True)))
+
+
+def clean_form_data(form_class, data):
+    """
+    Returns the cleaned data of a row like a bound ``form_class`` would.
+
+    The fields of the form class are used directly, since creating a form
+    copies all of its fields, which dominates the validation of big files.
+    Raises a ``ValidationError`` with one message per invalid field.
+
+    """
+    cleaned, errors = {}, []
+    for name, field in form_class.base_fields.items():
+        try:
+            cleaned[name] = field.clean(
+                field.widget.value_from_datadict(data, {}, name))
+        except ValidationError as exc:
+            errors.append('{0}: {1}'.format(name, ' '.join(exc.messages)))
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+def get_fixed_values(field_types):
+    """
+    Returns the existing values of the fixed value types among the given
+    extra field types as ``{(field_type_id, value): ExtraField}``.
+
+    """
+    fixed_values = {}
+    fixed_types = [field_type for field_type in field_types
+                   if field_type.fixed_values]
+    if fixed_types:
+        for field in ExtraField.objects.filter(
+                field_type__in=fixed_types).order_by('pk'):
+            fixed_values.setdefault((field.field_type_id, field.value), field)
+    return fixed_values
+
+
+def clean_employee_rows(rows, company=None):
+    """
+    Validates the rows of an employee import and returns their cleaned data.
+
+    Each row is validated by ``EmployeeImportForm``, columns named after an
+    extra field type of employees set its value. The checks against the
+    database are done for all rows at once. Raises a ``ValidationError``
+    with the errors of all rows.
+
+    :company: The ``Company`` of the employees. Its employees must not use
+      the HR numbers of the rows already.
+
+    """
+    field_types = dict(
+        (field_type.name, field_type)
+        for field_type in get_catalogue().get_extra_field_types(
+            'Employee', include_general=True))
+    columns = set(EmployeeImportForm.base_fields) | set(field_types)
+    errors, cleaned, emails, hr_numbers = [], [], {}, {}
+    for number, row in enumerate(rows, 1):
+        for column in sorted(set(row) - columns):
+            errors.append((number, _('Unknown column "{0}".').format(column)))
+        try:
+            data = clean_form_data(EmployeeImportForm, row)
+        except ValidationError as exc:
+            errors += [(number, message) for message in exc.messages]
+            continue
+        email = data['email'].lower()
+        if email in emails:
+            errors.append((number, _(
+                'The email is already used in row {0}.').format(
+                    emails[email])))
+            continue
+        hr_number = data['hr_number']
+        if hr_number is not None:
+            if hr_number in hr_numbers:
+                errors.append((number, _(
+                    'The HR number is already used in row {0}.').format(
+                        hr_numbers[hr_number])))
+                continue
+            hr_numbers[hr_number] = number
+        emails[email] = number
+        data['number'] = number
+        data['extra_fields'] = dict(
+            (field_type, six.text_type(row[name]))
+            for name, field_type in field_types.items()
+            if row.get(name) not in (None, ''))
+        cleaned.append(data)
+
+    for values in batched(list(emails)):
+        for email in get_user_model().objects.annotate(
+                email_lower=Lower('email')).filter(
+                    email_lower__in=values).values_list(
+                        'email_lower', flat=True):
+            errors.append((emails[email], _(
+                'A user with that email already exists.')))
+
+    if company is not None:
+        for values in batched(list(hr_numbers)):
+            existing = Employee.objects.filter(
+                company=company, hr_number__in=values).order_by()
+            for hr_number in existing.values_list(
+                    'hr_number', flat=True).distinct():
+                errors.append((hr_numbers[hr_number], _(
+                    'An employee with the HR number {0} already exists.'
+                ).format(hr_number)))
+
+    # Fixed values are shared by all employees, so they must exist
+    fixed_values = get_fixed_values(field_types.values())
+    max_length = ExtraField._meta.get_field('value').max_length
+    for data in cleaned:
+        extra_fields = {}
+        for field_type, value in data['extra_fields'].items():
+            if field_type.fixed_values:
+                value = fixed_values.get((field_type.pk, value))
+                if value is None:
+                    errors.append((data['number'], _(
+                        '"{0}" is not a valid choice for {1}.').format(
+                            data['extra_fields'][field_type],
+                            field_type.name)))
+            elif len(value) > max_length:
+                errors.append((data['number'], _(
+                    '{0} has more than {1} characters.').format(
+                        field_type.name, max_length)))
+            extra_fields[field_type] = value
+        data['extra_fields'] = extra_fields
+
+    if errors:
+        raise ValidationError([
+            _('Row {0}: {1}').format(number, message)
+            for number, message in sorted(errors, key=lambda x: x[0])])
+    return cleaned
+
+
+def create_employees(company, rows, passwords):
+    """
+    Inserts the users, employees and extra fields of cleaned rows with bulk
+    inserts in one transaction.
+
+    The usernames are generated for all rows at once. If another request
+    takes one of them first, the whole chunk is retried.
+
+    :company: The ``Company`` of the employees.
+    :rows: The cleaned rows.
+    :passwords: The hashed passwords of the rows.
+
+    """
+    user_model = get_user_model()
+    through = Employee.extra_fields.through
+    for attempt in range(USERNAME_ATTEMPTS):
+        usernames = generate_usernames([data['email'] for data in rows])
+        try:
+            with transaction.atomic():
+                users = bulk_create(user_model, [
+                    user_model(
+                        username=username,
+                        email=data['email'],
+                        first_name=data['first_name'],
+                        last_name=data['last_name'],
+                        password=password,
+                    )
+                    for username, data, password in zip(
+                        usernames, rows, passwords)], key='username')
+                employees = bulk_create(Employee, [
+                    Employee(
+                        user=user,
+                        company=company,
+                        hr_number=data['hr_number'],
+                        address=data['address'],
+                        title=data['title'],
+                        is_manager=data['is_manager'],
+                    )
+                    for user, data in zip(users, rows)], key='user_id')
+                links, new_fields = [], []
+                for employee, data in zip(employees, rows):
+                    for field_type, value in data['extra_fields'].items():
+                        if not isinstance(value, ExtraField):
+                            value = ExtraField(field_type=field_type,
+                                               value=value)
+                            new_fields.append(value)
+                        links.append((employee, value))
+                bulk_create(ExtraField, new_fields)
+                through.objects.bulk_create([
+                    through(employee_id=employee.pk, extrafield_id=field.pk)
+                    for employee, field in links], batch_size=BATCH_SIZE)
+            return employees
+        except IntegrityError:
+            if attempt + 1 == USERNAME_ATTEMPTS:
+                raise
+
+
+def import_employees(company, rows, chunk_size=BATCH_SIZE, workers=None):
+    """
+    Validates and imports employees and returns an ``ImportResult``.
+
+    The passwords are hashed in a process pool, since the hashers are slow
+    on purpose. The employees are inserted in chunks of ``chunk_size`` rows
+    with one transaction each, while the pool hashes the passwords of the
+    next chunks.
+
+    :company: The ``Company`` of the employees.
+    :rows: The rows as returned by ``read_rows``.
+    :chunk_size: Number of rows per transaction.
+    :workers: Number of hashing processes. ``None`` starts one per CPU,
+      ``0`` hashes the passwords in the current process. They are hashed in
+      the current process as well, if spawned workers wouldn't find the
+      settings, see ``workers_find_settings``.
+
+    """
+    started = time.time()
+    rows = clean_employee_rows(rows, company)
+    passwords = [data['password'] for data in rows]
+    executor = None
+    if workers != 0 and rows and workers_find_settings():
+        executor = ProcessPoolExecutor(max_workers=workers)
+        hashes = executor.map(hash_password, passwords)
+    else:
+        hashes = map(make_password, passwords)
+    try:
+        for chunk in batched(rows, chunk_size):
+            create_employees(company, chunk, list(islice(hashes, len(chunk))))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return ImportResult(len(rows), time.time() - started)
+
+
+class PaymentImporter(object):
+    """
+    Imports the payments of a company from a CSV file.
+
+    The employees are referenced by their HR number, the payment types by
+    their name and columns named after an extra field type of payments set
+    its value. Rows of an HR number, which several employees of the company
+    share, are rejected. A payment is identified by its employee, payment
+    type and date, so importing a file again updates its payments instead of
+    adding them twice. Empty extra field cells leave the extra field
+    unchanged.
+
+    The file is parsed and written in chunks, so its size doesn't matter.
+    Invalid rows are skipped and reported in the result. A file, which can't
+    be read to its end, imports nothing, since all chunks are written in one
+    transaction.
+
+    :company: The ``Company`` of the employees.
+    :chunk_size: Number of rows per bulk write.
+
+    """
+    fields = ('amount', 'end_date', 'description', 'start_period',
+              'end_period')
+
+    def __init__(self, company, chunk_size=BATCH_SIZE):
+        self.company = company
+        self.chunk_size = chunk_size
+        catalogue = get_catalogue()
+        self.payment_types = dict(
+            (payment_type.name, payment_type)
+            for payment_type in catalogue.payment_types)
+        self.field_types = dict(
+            (field_type.name, field_type)
+            for field_type in catalogue.get_extra_field_types(
+                'Payment', include_general=True))
+        self.fixed_values = get_fixed_values(self.field_types.values())
+        self.employees, self.ambiguous = {}, set()
+        employees = Employee.objects.filter(
+            company=company, hr_number__isnull=False).order_by()
+        for hr_number, pk in employees.values_list('hr_number', 'pk'):
+            if hr_number in self.employees:
+                self.ambiguous.add(hr_number)
+            self.employees[hr_number] = pk
+        self.columns = set(PaymentImportForm.base_fields) | set(
+            self.field_types)
+
+    def run(self, lines):
+        """
+        Imports the rows of the given CSV lines and returns a
+        ``PaymentImportResult``.
+
+        """
+        started = time.time()
+        count = created = updated = skipped = 0
+        errors = []
+        rows = enumerate(iter_csv_rows(lines), 1)
+        header_checked = False
+        with transaction.atomic():
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                if not header_checked:
+                    header_checked = True
+                    unknown = sorted(set(chunk[0][1]) - self.columns)
+                    if unknown:
+                        raise ValidationError(_(
+                            'Unknown columns: {0}').format(', '.join(unknown)))
+                count += len(chunk)
+                payments = {}
+                for number, row in chunk:
+                    try:
+                        payment, extra_fields = self.clean_row(row)
+                    except ValidationError as exc:
+                        errors += [
+                            _('Row {0}: {1}').format(number, message)
+                            for message in exc.messages]
+                        skipped += 1
+                        continue
+                    # The last row of a payment wins
+                    payments[self.get_key(payment)] = (payment,
+                                                       extra_fields)
+                chunk_created, chunk_updated = self.write(payments)
+                created += chunk_created
+                updated += chunk_updated
+        return PaymentImportResult(count, created, updated, skipped, errors,
+                                   time.time() - started)
+
+    def clean_row(self, row):
+        """
+        Returns the unsaved ``Payment`` of a row and its extra field values
+        as ``{field_type: value}``. Fixed values are existing ``ExtraField``
+        objects.
+
+        """
+        data = clean_form_data(PaymentImportForm, row)
+        errors = []
+        employee_id = self.employees.get(data['hr_number'])
+        if data['hr_number'] in self.ambiguous:
+            errors.append(_('The HR number {0} is ambiguous.').format(
+                data['hr_number']))
+        elif employee_id is None:
+            errors.append(_('There is no employee with the HR number'
+                            ' {0}.').format(data['hr_number']))
+        payment_type = self.payment_types.get(data['payment_type'])
+        if payment_type is None:
+            errors.append(_('There is no payment type "{0}".').format(
+                data['payment_type']))
+        extra_fields = {}
+        for name, field_type in self.field_types.items():
+            value = row.get(name)
+            if not value:
+                continue
+            if field_type.fixed_values:
+                field = self.fixed_values.get((field_type.pk, value))
+                if field is None:
+                    errors.append(_(
+                        '"{0}" is not a valid choice for {1}.').format(
+                            value, name))
+                value = field
+            extra_fields[field_type] = value
+        if errors:
+            raise ValidationError(errors)
+        payment = Payment(
+            employee_id=employee_id,
+            payment_type=payment_type,
+            amount=data['amount'],
+            date=data['date'],
+            end_date=data['end_date'],
+            description=data['description'] or None,
+        )
+        payment.update_periods()
+        return payment, extra_fields
+
+    def get_key(self, payment):
+        return (payment.employee_id, payment.payment_type_id, payment.date)
+
+    def get_existing(self, keys):
+        """Returns the existing payments of the given keys by their key."""
+        existing = {}
+        if not keys:
+            return existing
+        # Separate lists of employees, types and dates would match all of
+        # their combinations, so every key is looked up on its own
+        for batch in batched(keys, KEY_BATCH_SIZE):
+            for payment in Payment.objects.filter(reduce(operator.or_, [
+                    Q(employee=employee_id, payment_type=payment_type_id,
+                      date=date)
+                    for employee_id, payment_type_id, date in batch])
+            ).order_by('pk'):
+                existing.setdefault(self.get_key(payment), payment)
+        return existing
+
+    def write(self, payments):
+        """
+        Creates or updates the payments of one chunk and returns the number
+        of created and updated payments. Call it inside of a transaction.
+
+        """
+        existing = self.get_existing(list(payments))
+        new, changed, updated = [], [], set()
+        for key, (payment, extra_fields) in payments.items():
+            current = existing.get(key)
+            if current is None:
+                new.append(payment)
+                continue
+            payment.pk = current.pk
+            if any(getattr(payment, name) != getattr(current, name)
+                   for name in self.fields):
+                changed.append(payment)
+                updated.add(payment.pk)
+        Payment.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        if new and not can_return_pks() and any(
+                payments[self.get_key(payment)][1] for payment in new):
+            # The natural key is unique among the new payments
+            created = self.get_existing(
+                [self.get_key(payment) for payment in new])
+            for payment in new:
+                payment.pk = created[self.get_key(payment)].pk
+        bulk_update(Payment, changed, self.fields)
+        updated |= self.write_extra_fields(
+            [(payment, extra_fields, key in existing)
+             for key, (payment, extra_fields) in payments.items()
+             if extra_fields])
+        return len(new), len(updated)
+
+    def write_extra_fields(self, payments):
+        """
+        Sets the extra fields of the given payments and returns the primary
+        keys of the existing payments, whose extra fields have changed.
+
+        :payments: List of ``(payment, extra_fields, exists)`` tuples.
+
+        """
+        through = Payment.extra_fields.through
+        current = {}
+        for pks in batched([payment.pk for payment, extra_fields, exists
+                            in payments if exists]):
+            for link in through.objects.filter(
+                    payment__in=pks).select_related('extrafield'):
+                current.setdefault(
+                    (link.payment_id, link.extrafield.field_type_id), link)
+        links, removed, new_fields, changed_fields = [], [], [], []
+        updated = set()
+        for payment, extra_fields, exists in payments:
+            for field_type, value in extra_fields.items():
+                link = current.get((payment.pk, field_type.pk))
+                if isinstance(value, ExtraField):
+                    # Fixed values are shared, so they are exchanged
+                    if link is not None:
+                        if link.extrafield_id == value.pk:
+                            continue
+                        removed.append(link.pk)
+                    links.append((payment, value))
+                elif link is None:
+                    value = ExtraField(field_type=field_type, value=value)
+                    new_fields.append(value)
+                    links.append((payment, value))
+                elif link.extrafield.value != value:
+                    link.extrafield.value = value
+                    changed_fields.append(link.extrafield)
+                else:
+                    continue
+                if exists:
+                    updated.add(payment.pk)
+        for pks in batched(removed):
+            through.objects.filter(pk__in=pks).delete()
+        bulk_create(ExtraField, new_fields)
+        bulk_update(ExtraField, changed_fields, ['value'])
+        through.objects.bulk_create([
+            through(payment_id=payment.pk, extrafield_id=field.pk)
+            for payment, field in links], batch_size=BATCH_SIZE)
+        return updated
+
+
+def import_payments(company, lines, chunk_size=BATCH_SIZE):
+    """
+    Imports the payments of a company from CSV lines and returns a
+    ``PaymentImportResult``. See ``PaymentImporter``.
+
+    """
+    return PaymentImporter(company, chunk_size=chunk_size).run(lines)
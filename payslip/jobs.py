@@ -0,0 +1,120 @@
+"""Background rendering of payslips of the ``payslip`` app."""
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import app_settings
+from .engine import PayrollRun, PayslipCalculator
+from .models import Payslip, PayslipJob
+from .rendering import (
+    get_archive_filename,
+    get_payslip_filename,
+    iter_payslip_archive,
+    submit_payslip_pdf,
+)
+
+
+def get_worker_name():
+    """Returns a name, which identifies the current worker process."""
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+def enqueue_job(company, year, month, employee=None):
+    """
+    Returns a new ``PayslipJob``, which renders the PDF of one employee or,
+    without an employee, the ZIP archive of all employees of the company.
+
+    """
+    return PayslipJob.objects.create(
+        company=company, employee=employee, year=year, month=month)
+
+
+def get_claimable_condition():
+    """
+    Returns the condition for the jobs, which can be claimed: Pending jobs
+    and running jobs, whose worker claimed them more than
+    ``PAYSLIP_JOB_TIMEOUT`` seconds ago, e.g. because it died meanwhile.
+
+    """
+    condition = Q(status=PayslipJob.PENDING)
+    if app_settings.JOB_TIMEOUT:
+        condition |= Q(status=PayslipJob.RUNNING, started__lt=(
+            timezone.now() - timedelta(seconds=app_settings.JOB_TIMEOUT)))
+    return condition
+
+
+def claim_job(worker=None):
+    """
+    Returns the oldest claimable ``PayslipJob`` after marking it as running
+    or ``None``, if there is no such job. See ``get_claimable_condition``.
+
+    Backends supporting ``SELECT ... FOR UPDATE SKIP LOCKED`` let concurrent
+    workers pass over rows locked by each other. Everywhere else a job is
+    claimed by a conditional update, which only one worker can win.
+
+    """
+    worker = worker or get_worker_name()
+    claimable = get_claimable_condition()
+    pending = PayslipJob.objects.filter(claimable).order_by('pk')
+    if getattr(connection.features, 'has_select_for_update_skip_locked',
+               False):
+        with transaction.atomic():
+            job = pending.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = PayslipJob.RUNNING
+            job.worker = worker
+            job.started = timezone.now()
+            job.save(update_fields=['status', 'worker', 'started'])
+            return job
+    for pk in pending.values_list('pk', flat=True)[:10]:
+        claimed = PayslipJob.objects.filter(claimable, pk=pk).update(
+            status=PayslipJob.RUNNING, worker=worker,
+            started=timezone.now())
+        if claimed:
+            return PayslipJob.objects.get(pk=pk)
+    return None
+
+
+def render_job(job):
+    """Returns the filename and the content of the result of a job."""
+    if job.employee is None:
+        payslips = PayrollRun(job.company, job.year, job.month).iter_payslips()
+        return (get_archive_filename(job.company, job.year, job.month),
+                b''.join(iter_payslip_archive(payslips)))
+    snapshot = Payslip.objects.filter(
+        employee=job.employee, year=job.year, month=job.month).first()
+    if snapshot is not None:
+        return get_payslip_filename(snapshot), bytes(snapshot.pdf)
+    result = PayslipCalculator(job.employee, job.year, job.month).calculate()
+    return (get_payslip_filename(result),
+            submit_payslip_pdf(result).result())
+
+
+def run_job(job):
+    """
+    Renders a claimed job and stores its result or the error.
+
+    The result is only stored, if the job is still claimed by the same
+    worker. Once another worker reclaimed it after the timeout, the result
+    of the first worker is discarded.
+
+    """
+    try:
+        job.filename, job.result = render_job(job)
+        job.status = PayslipJob.DONE
+    except Exception:
+        job.error = traceback.format_exc()
+        job.status = PayslipJob.FAILED
+    job.finished = timezone.now()
+    PayslipJob.objects.filter(
+        pk=job.pk, status=PayslipJob.RUNNING, worker=job.worker,
+        started=job.started).update(
+            filename=job.filename, result=job.result, error=job.error,
+            status=job.status, finished=job.finished)
+    return job
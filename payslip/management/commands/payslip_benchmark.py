@@ -0,0 +1,83 @@
+"""Measures the hot paths of the app against seeded datasets."""
+import io
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+
+from ...benchmarks import BENCHMARKS, DATASETS, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Measures the wall time, queries and peak memory of the payslip'
+            ' views, forms and payroll runs against seeded datasets of'
+            ' increasing size in a test database and prints the results as'
+            ' JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset', action='append', dest='datasets',
+            choices=[name for name, arguments in DATASETS],
+            help='Name of a dataset to seed, defaults to all datasets')
+        parser.add_argument(
+            '--benchmark', action='append', dest='benchmarks',
+            choices=BENCHMARKS,
+            help='Name of a benchmark to run, defaults to all benchmarks')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of timed runs of every benchmark')
+        parser.add_argument(
+            '--cache', action='store_true', default=False,
+            help='Take the payslips from the cache of PAYSLIP_CACHE_BACKEND')
+        parser.add_argument(
+            '--output', help='Path of the JSON file of the results')
+        parser.add_argument(
+            '--compare',
+            help='Path of the JSON results of a previous run. Fails, if a'
+                 ' benchmark regressed.')
+        parser.add_argument(
+            '--threshold', type=float, default=1.25,
+            help='Factor, by which the time or memory of a benchmark may'
+                 ' grow without failing the comparison')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        baseline = None
+        if options['compare']:
+            try:
+                with io.open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (IOError, OSError, ValueError) as exc:
+                raise CommandError(exc)
+        datasets = [dataset for dataset in DATASETS
+                    if not options['datasets'] or
+                    dataset[0] in options['datasets']]
+        # The datasets are seeded into a test database, which is destroyed
+        # afterwards, so the command never touches the data of the project
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            results = run_benchmarks(
+                datasets=datasets,
+                benchmarks=options['benchmarks'] or BENCHMARKS,
+                repeat=options['repeat'],
+                use_cache=options['cache'],
+            )
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with io.open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError('Regressions compared to {0}:\n{1}'.format(
+                    options['compare'], '\n'.join(regressions)))
+            self.stderr.write('No regressions compared to {0}.'.format(
+                options['compare']))
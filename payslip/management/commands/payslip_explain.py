@@ -0,0 +1,74 @@
+"""Prints the query plans and timings of the payslip queries."""
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ...engine import PayrollRun, PayslipCalculator
+from ...models import Company
+
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ANALYZE ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+class Command(BaseCommand):
+    help = ('Prints the query plans and timings of the payslip calculation'
+            ' and the payroll run of a company.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='ID of the company')
+        parser.add_argument('year', type=int)
+        parser.add_argument('month', type=int, choices=range(1, 13))
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of timed runs of every calculation')
+
+    def explain(self, sql):
+        """Returns the rows of the query plan of a SQL statement."""
+        prefix = EXPLAIN.get(connection.vendor)
+        if prefix is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return cursor.fetchall()
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError('Company "{0}" does not exist.'.format(
+                options['company']))
+        employee = company.employees.select_related('user', 'company') \
+            .first()
+        if employee is None:
+            raise CommandError('Company "{0}" has no employees.'.format(
+                company.pk))
+        year, month = options['year'], options['month']
+        calculations = [
+            ('PayslipCalculator', lambda: PayslipCalculator(
+                employee, year, month).calculate()),
+            ('PayrollRun', lambda: PayrollRun(company, year, month).run()),
+        ]
+        for name, calculate in calculations:
+            with CaptureQueriesContext(connection) as queries:
+                calculate()
+            timings = []
+            for i in range(options['repeat']):
+                started = default_timer()
+                calculate()
+                timings.append(default_timer() - started)
+            timings.sort()
+            self.stdout.write(
+                '{0}: {1} queries, best {2:.4f}s, median {3:.4f}s'.format(
+                    name, len(queries), timings[0],
+                    timings[len(timings) // 2]))
+            for query in queries:
+                self.stdout.write('\n  {0}'.format(query['sql']))
+                for row in self.explain(query['sql']):
+                    self.stdout.write('    {0}'.format(
+                        ' '.join(str(column) for column in row)))
+            self.stdout.write('')
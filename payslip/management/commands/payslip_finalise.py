@@ -0,0 +1,24 @@
+"""Finalises the payslips of all employees of a company for one month."""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Company
+from ...snapshots import finalise_payroll_run
+
+
+class Command(BaseCommand):
+    help = 'Stores snapshots of the payslips of all employees of a company.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='ID of the company')
+        parser.add_argument('year', type=int)
+        parser.add_argument('month', type=int, choices=range(1, 13))
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError('Company "{0}" does not exist.'.format(
+                options['company']))
+        count = finalise_payroll_run(
+            company, options['year'], options['month'])
+        self.stdout.write('Finalised {0} payslips.'.format(count))
@@ -0,0 +1,54 @@
+"""Imports the employees of a company from a CSV or JSON file."""
+import io
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ...bulk import BATCH_SIZE
+from ...importers import FORMATS, get_format, import_employees, read_rows
+from ...models import Company
+
+
+class Command(BaseCommand):
+    help = ('Imports employees from a CSV file with a header row or a JSON'
+            ' list of objects. Columns named after an extra field type set'
+            ' its value.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='ID of the company')
+        parser.add_argument('path', help='Path of the CSV or JSON file')
+        parser.add_argument(
+            '--format', choices=FORMATS, default=None,
+            help='Format of the file, defaults to its extension')
+        parser.add_argument(
+            '--chunk-size', type=int, default=BATCH_SIZE,
+            help='Number of employees per transaction')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help=('Number of processes, which hash the passwords. Defaults'
+                  ' to one per CPU, 0 hashes them in the current process.'))
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError('Company "{0}" does not exist.'.format(
+                options['company']))
+        format = options['format'] or get_format(options['path'])
+        if format is None:
+            raise CommandError('Unknown format of "{0}".'.format(
+                options['path']))
+        try:
+            with io.open(options['path'], 'rb') as f:
+                rows = read_rows(f, format)
+            result = import_employees(
+                company, rows, chunk_size=options['chunk_size'],
+                workers=options['workers'])
+        except (IOError, OSError) as exc:
+            raise CommandError(exc)
+        except ValidationError as exc:
+            raise CommandError('\n'.join(exc.messages))
+        self.stdout.write(
+            'Imported {0} employees in {1:.3f}s ({2:.0f} rows/s).'.format(
+                result.count, result.duration,
+                result.count / result.duration if result.duration else 0))
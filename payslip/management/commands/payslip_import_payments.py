@@ -0,0 +1,44 @@
+"""Imports the payments of a company from a CSV file."""
+import io
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ...bulk import BATCH_SIZE
+from ...importers import import_payments
+from ...models import Company
+
+
+class Command(BaseCommand):
+    help = ('Imports payments from a CSV file with a header row. Importing a'
+            ' file again updates its payments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='ID of the company')
+        parser.add_argument('path', help='Path of the CSV file')
+        parser.add_argument(
+            '--chunk-size', type=int, default=BATCH_SIZE,
+            help='Number of rows per bulk write')
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError('Company "{0}" does not exist.'.format(
+                options['company']))
+        try:
+            with io.open(options['path'], 'rb') as f:
+                result = import_payments(company, f,
+                                         chunk_size=options['chunk_size'])
+        except (IOError, OSError) as exc:
+            raise CommandError(exc)
+        except ValidationError as exc:
+            raise CommandError('\n'.join(exc.messages))
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(
+            'Created {0} and updated {1} payments in {2:.3f}s'
+            ' ({3:.0f} rows/s). Skipped {4} invalid rows.'.format(
+                result.created, result.updated, result.duration,
+                result.rows / result.duration if result.duration else 0,
+                result.skipped))
@@ -0,0 +1,29 @@
+"""Calculates the payslips of all employees of a company for one month."""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...engine import PayrollRun
+from ...models import Company
+
+
+class Command(BaseCommand):
+    help = 'Calculates the payslips of all employees of a company.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='ID of the company')
+        parser.add_argument('year', type=int)
+        parser.add_argument('month', type=int, choices=range(1, 13))
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError('Company "{0}" does not exist.'.format(
+                options['company']))
+        result = PayrollRun(company, options['year'], options['month']).run()
+        for payslip in result.payslips:
+            self.stdout.write('{0}\t{1}\t{2:.2f}\t{3:.2f}\t{4:.2f}'.format(
+                payslip.employee.hr_number or '', payslip.employee,
+                payslip.sum, payslip.sum_neg, payslip.sum + payslip.sum_neg))
+        self.stdout.write(
+            'Calculated {0} payslips from {1} payments in {2:.3f}s.'.format(
+                len(result.payslips), result.payment_count, result.duration))
@@ -0,0 +1,57 @@
+"""Seeds the database with synthetic companies, employees and payments."""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...bulk import BATCH_SIZE
+from ...seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ('Generates companies with employees, extra fields and years of'
+            ' payment history for performance tests. The same options'
+            ' generate the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--companies', type=int, default=1,
+            help='Number of companies')
+        parser.add_argument(
+            '--employees', type=int, default=100,
+            help='Number of employees per company')
+        parser.add_argument(
+            '--years', type=int, default=3,
+            help='Number of years of payment history')
+        parser.add_argument(
+            '--end-year', type=int,
+            help='Last year of the payment history, defaults to this year')
+        parser.add_argument(
+            '--payments', type=int, default=12,
+            help='Number of single payments per employee and year')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the random numbers')
+        parser.add_argument(
+            '--chunk-size', type=int, default=BATCH_SIZE,
+            help='Number of objects per bulk insert and transaction')
+
+    def handle(self, *args, **options):
+        for option in ('companies', 'employees', 'years', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError('--{0} must be at least 1.'.format(
+                    option.replace('_', '-')))
+        if options['payments'] < 0:
+            raise CommandError('--payments must not be negative.')
+        result = Seeder(
+            companies=options['companies'],
+            employees=options['employees'],
+            years=options['years'],
+            payments=options['payments'],
+            end_year=options['end_year'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+        ).run()
+        self.stdout.write(
+            'Created {0} companies, {1} employees and {2} payments in'
+            ' {3:.3f}s ({4:.0f} payments/s).'.format(
+                result.companies, result.employees, result.payments,
+                result.duration,
+                result.payments / result.duration if result.duration else 0))
@@ -0,0 +1,39 @@
+"""Renders the queued payslip jobs."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...jobs import claim_job, get_worker_name, run_job
+from ...models import PayslipJob
+
+
+class Command(BaseCommand):
+    help = ('Renders the queued payslip jobs. Start several workers to'
+            ' render in parallel.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit as soon as the queue is empty')
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Seconds to wait for new jobs, if the queue is empty')
+        parser.add_argument(
+            '--name', default=None,
+            help='Name of the worker, defaults to <hostname>:<pid>')
+
+    def handle(self, *args, **options):
+        worker = options['name'] or get_worker_name()
+        while True:
+            job = claim_job(worker)
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            job = run_job(job)
+            self.stdout.write('{0}\t{1}\t{2:.3f}s'.format(
+                job.pk, job.get_status_display(),
+                (job.finished - job.started).total_seconds()))
+            if job.status == PayslipJob.FAILED:
+                self.stderr.write(job.error)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payslip', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payslip',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Month')),
+                ('rows', models.TextField(verbose_name='Rows')),
+                ('sum', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Sum earnings')),
+                ('sum_neg', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Sum deductions')),
+                ('sum_year', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Gross total')),
+                ('sum_year_neg', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Net total')),
+                ('html', models.TextField(verbose_name='HTML')),
+                ('pdf', models.BinaryField(verbose_name='PDF')),
+                ('finalised', models.DateTimeField(auto_now_add=True, verbose_name='Finalised')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payslips', to='payslip.Employee', verbose_name='Employee')),
+            ],
+            options={
+                'ordering': ['-year', '-month'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='payslip',
+            unique_together=set([('employee', 'year', 'month')]),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payslip', '0002_payslip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayslipJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Month')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10, verbose_name='Status')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('filename', models.CharField(blank=True, max_length=100, verbose_name='Filename')),
+                ('result', models.BinaryField(blank=True, null=True, verbose_name='Result')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payslip_jobs', to='payslip.Company', verbose_name='Company')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payslip_jobs', to='payslip.Employee', verbose_name='Employee')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
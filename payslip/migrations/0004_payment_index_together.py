@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payslip', '0003_payslipjob'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='payment',
+            index_together=set([('employee', 'date'), ('employee', 'end_date')]),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+from django.utils.timezone import get_default_timezone, localtime, make_aware
+
+
+def get_month_start(year, month):
+    value = datetime(year, month, 1)
+    if settings.USE_TZ:
+        value = make_aware(value, get_default_timezone())
+    return value
+
+
+def set_periods(apps, schema_editor):
+    # One UPDATE per month and date field instead of one per payment. The
+    # months are taken in the default time zone like in ``get_period``.
+    Payment = apps.get_model('payslip', 'Payment')
+    for field, period_field in (('date', 'start_period'),
+                                ('end_date', 'end_period')):
+        bounds = Payment.objects.aggregate(first=Min(field), last=Max(field))
+        if bounds['first'] is None:
+            continue
+        first, last = bounds['first'], bounds['last']
+        if settings.USE_TZ:
+            first = localtime(first, get_default_timezone())
+            last = localtime(last, get_default_timezone())
+        for key in range(first.year * 12 + first.month,
+                         last.year * 12 + last.month + 1):
+            year, month = divmod(key - 1, 12)
+            next_year, next_month = divmod(key, 12)
+            Payment.objects.filter(**{
+                '{0}__gte'.format(field): get_month_start(year, month + 1),
+                '{0}__lt'.format(field): get_month_start(
+                    next_year, next_month + 1),
+            }).update(**{period_field: key})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payslip', '0004_payment_index_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='start_period',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Start period'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='end_period',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='End period'),
+        ),
+        migrations.RunPython(set_periods, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='start_period',
+            field=models.PositiveIntegerField(editable=False, verbose_name='Start period'),
+        ),
+        migrations.AlterIndexTogether(
+            name='payment',
+            index_together=set([('employee', 'date'), ('employee', 'end_date'), ('employee', 'start_period'), ('employee', 'end_period')]),
+        ),
+    ]
@@ -1,10 +1,32 @@
 """Models for the ``payslip`` application."""
+import json
+from datetime import datetime
+
 from django.conf import settings
 from django.db import models
-from django.utils.timezone import localtime, now
+from django.utils.timezone import (
+    get_default_timezone,
+    is_naive,
+    localtime,
+    now,
+)
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 
+from dateutil import relativedelta
+
+
+def get_period(value):
+    """
+    Returns the period key ``year * 12 + month`` of a datetime in the
+    default time zone. The keys are stored, so they must not depend on the
+    time zone, which is active for the current user.
+
+    """
+    if not is_naive(value):
+        value = localtime(value, get_default_timezone())
+    return value.year * 12 + value.month
+
 
 @python_2_unicode_compatible
 class Company(models.Model):
@@ -231,6 +253,8 @@ class Payment(models.Model):
     :date: Date the payment should accrue.
     :end_date: Optional end date, if payment type has a rrule.
     :extra_fields: Custom fields like e.g. quantity, bonus.
+    :start_period: Period key (``year * 12 + month``) of the date.
+    :end_period: Period key of the end date.
 
     """
     payment_type = models.ForeignKey(
@@ -275,19 +299,253 @@ class Payment(models.Model):
         verbose_name=_('Description'),
     )
 
+    start_period = models.PositiveIntegerField(
+        verbose_name=_('Start period'),
+        editable=False,
+    )
+
+    end_period = models.PositiveIntegerField(
+        verbose_name=_('End period'),
+        editable=False,
+        blank=True, null=True,
+    )
+
     class Meta:
         ordering = ['employee__user__first_name', '-date', ]
+        # Match the payslip queries, which filter the payments of an
+        # employee by date ranges and open or closed end dates
+        index_together = [
+            ('employee', 'date'),
+            ('employee', 'end_date'),
+            ('employee', 'start_period'),
+            ('employee', 'end_period'),
+        ]
 
     def __str__(self):
         return '{0} - {1} ({2})'.format(self.payment_type, self.amount,
                                         self.employee)
 
+    def save(self, *args, **kwargs):
+        self.update_periods()
+        return super(Payment, self).save(*args, **kwargs)
+
+    def update_periods(self):
+        """
+        Sets the period keys of ``date`` and ``end_date``. Call it for
+        payments, which are created with ``bulk_create``.
+
+        """
+        self.start_period = get_period(self.date)
+        self.end_period = self.end_date and get_period(self.end_date)
+
+    # Like the period keys, the dates are compared in the default time zone
     def get_date_without_tz(self):
-        return localtime(self.date).replace(tzinfo=None)
+        return localtime(self.date, get_default_timezone()).replace(
+            tzinfo=None)
 
     def get_end_date_without_tz(self):
-        return localtime(self.end_date).replace(tzinfo=None)
+        return localtime(self.end_date, get_default_timezone()).replace(
+            tzinfo=None)
 
     @property
     def is_recurring(self):
         return self.payment_type.rrule
+
+
+@python_2_unicode_compatible
+class Payslip(models.Model):
+    """
+    Model, which holds the frozen payslip of a finalised period.
+
+    :employee: Connection to the employee.
+    :year: Year of the period.
+    :month: Month of the period.
+    :rows: JSON list of the payments, which have been part of the period.
+    :sum: Sum of the positive payments of the period.
+    :sum_neg: Sum of the negative payments of the period.
+    :sum_year: Sum of the positive payments of the year until the period.
+    :sum_year_neg: Sum of the negative payments of the year until the period.
+    :html: Rendered content of the payslip.
+    :pdf: Rendered PDF document of the payslip.
+    :finalised: Date and time the period has been finalised.
+
+    """
+    employee = models.ForeignKey(
+        'payslip.Employee',
+        verbose_name=_('Employee'),
+        related_name='payslips',
+    )
+
+    year = models.PositiveSmallIntegerField(
+        verbose_name=_('Year'),
+    )
+
+    month = models.PositiveSmallIntegerField(
+        verbose_name=_('Month'),
+    )
+
+    rows = models.TextField(
+        verbose_name=_('Rows'),
+    )
+
+    sum = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        verbose_name=_('Sum earnings'),
+    )
+
+    sum_neg = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        verbose_name=_('Sum deductions'),
+    )
+
+    sum_year = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        verbose_name=_('Gross total'),
+    )
+
+    sum_year_neg = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        verbose_name=_('Net total'),
+    )
+
+    html = models.TextField(
+        verbose_name=_('HTML'),
+    )
+
+    pdf = models.BinaryField(
+        verbose_name=_('PDF'),
+    )
+
+    finalised = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Finalised'),
+    )
+
+    class Meta:
+        ordering = ['-year', '-month', ]
+        unique_together = ('employee', 'year', 'month')
+
+    def __str__(self):
+        return '{0} - {1}/{2:02d}'.format(
+            self.employee, self.year, self.month)
+
+    @property
+    def date_start(self):
+        return datetime(self.year, self.month, 1)
+
+    @property
+    def date_end(self):
+        return self.date_start + relativedelta.relativedelta(
+            months=1) - relativedelta.relativedelta(days=1)
+
+    def get_rows(self):
+        return json.loads(self.rows)
+
+
+@python_2_unicode_compatible
+class PayslipJob(models.Model):
+    """
+    Model, which holds a payslip rendering for the background workers.
+
+    :company: Connection to the company.
+    :employee: Optional employee. Jobs without an employee render a ZIP
+      archive with the payslips of all employees of the company.
+    :year: Year of the period.
+    :month: Month of the period.
+    :status: Current state of the job.
+    :worker: Name of the worker, which claimed the job.
+    :filename: Filename of the result.
+    :result: The rendered PDF document or ZIP archive.
+    :error: Traceback of a failed job.
+    :created: Date and time the job has been enqueued.
+    :started: Date and time a worker claimed the job.
+    :finished: Date and time the job has been finished.
+
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    company = models.ForeignKey(
+        'payslip.Company',
+        verbose_name=_('Company'),
+        related_name='payslip_jobs',
+    )
+
+    employee = models.ForeignKey(
+        'payslip.Employee',
+        verbose_name=_('Employee'),
+        related_name='payslip_jobs',
+        blank=True, null=True,
+    )
+
+    year = models.PositiveSmallIntegerField(
+        verbose_name=_('Year'),
+    )
+
+    month = models.PositiveSmallIntegerField(
+        verbose_name=_('Month'),
+    )
+
+    status = models.CharField(
+        max_length=10,
+        verbose_name=_('Status'),
+        choices=(
+            (PENDING, _('Pending')),
+            (RUNNING, _('Running')),
+            (DONE, _('Done')),
+            (FAILED, _('Failed')),
+        ),
+        default=PENDING,
+        db_index=True,
+    )
+
+    worker = models.CharField(
+        max_length=100,
+        verbose_name=_('Worker'),
+        blank=True,
+    )
+
+    filename = models.CharField(
+        max_length=100,
+        verbose_name=_('Filename'),
+        blank=True,
+    )
+
+    result = models.BinaryField(
+        verbose_name=_('Result'),
+        blank=True, null=True,
+    )
+
+    error = models.TextField(
+        verbose_name=_('Error'),
+        blank=True,
+    )
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Created'),
+    )
+
+    started = models.DateTimeField(
+        verbose_name=_('Started'),
+        blank=True, null=True,
+    )
+
+    finished = models.DateTimeField(
+        verbose_name=_('Finished'),
+        blank=True, null=True,
+    )
+
+    class Meta:
+        ordering = ['-created', ]
+
+    def __str__(self):
+        return '{0} - {1}/{2:02d} ({3})'.format(
+            self.employee or self.company, self.year, self.month,
+            self.get_status_display())
@@ -0,0 +1,93 @@
+"""Profiling of the requests of the ``payslip`` app."""
+import cProfile
+import os
+import pstats
+import tempfile
+from timeit import default_timer
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from . import app_settings
+
+#: Query parameter, which turns on the profiling of a request.
+PROFILE_PARAM = '_profile'
+
+#: Query parameter, which selects the sort key of the statistics.
+SORT_PARAM = '_sort'
+
+#: Sort keys of the statistics, the first one is the default.
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'filename')
+
+#: Number of functions, which are listed in the report.
+FUNCTION_LIMIT = 80
+
+
+def is_profiling(request):
+    """
+    Returns whether a request should be profiled. Only requests of staff
+    users are profiled, if the ``PAYSLIP_PROFILING`` setting is enabled.
+
+    """
+    return bool(app_settings.PROFILING and
+                request.GET.get(PROFILE_PARAM) and
+                request.user.is_authenticated() and request.user.is_staff)
+
+
+def profile(func, *args, **kwargs):
+    """
+    Calls a function under ``cProfile`` and captures its queries.
+
+    Returns a tuple of the result, the ``pstats.Stats``, the captured queries
+    and the duration of the call in seconds.
+
+    """
+    profiler = cProfile.Profile()
+    with CaptureQueriesContext(connection) as queries:
+        started = default_timer()
+        profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.disable()
+        duration = default_timer() - started
+    return result, pstats.Stats(profiler), list(queries), duration
+
+
+def store_stats(stats):
+    """
+    Stores the statistics in ``PAYSLIP_PROFILING_DIR``, e.g. for
+    ``snakeviz``, and returns the path of the file or ``None``, if the
+    setting is empty.
+
+    """
+    if not app_settings.PROFILING_DIR:
+        return None
+    if not os.path.isdir(app_settings.PROFILING_DIR):
+        os.makedirs(app_settings.PROFILING_DIR)
+    handle, path = tempfile.mkstemp(
+        prefix='payslip_', suffix='.prof', dir=app_settings.PROFILING_DIR)
+    os.close(handle)
+    stats.dump_stats(path)
+    return path
+
+
+def get_report(request, stats, queries, duration, path=None):
+    """Returns the statistics and the queries of a request as text."""
+    sort = request.GET.get(SORT_PARAM)
+    if sort not in SORT_KEYS:
+        sort = SORT_KEYS[0]
+    lines = ['Profile of {0} {1} in {2:.4f}s'.format(
+        request.method, request.get_full_path(), duration)]
+    if path:
+        lines.append('Stored as {0}'.format(path))
+    lines += ['', '{0} queries in {1:.4f}s'.format(
+        len(queries), sum(float(query['time']) for query in queries))]
+    for query in queries:
+        lines.append('{0:>9}s  {1}'.format(query['time'], query['sql']))
+    stream = StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(FUNCTION_LIMIT)
+    lines += ['', stream.getvalue()]
+    return '\n'.join(lines)
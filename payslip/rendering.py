@@ -0,0 +1,441 @@
+"""PDF rendering of the ``payslip`` app."""
+import mimetypes
+import threading
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from multiprocessing import cpu_count
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import render_to_string
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
+from django.utils.six.moves.urllib.parse import unquote, urljoin, urlsplit
+
+from . import app_settings
+from .cache import get_cache, get_payslip_digest
+from .catalogue import get_catalogue
+from .engine import (
+    iter_prefetched,
+    prefetch_employee_extra_fields,
+    prefetch_extra_field_values,
+)
+from .timing import StageTimer
+
+try:
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:  # Python 2
+    class BrokenProcessPool(RuntimeError):
+        pass
+
+
+#: Base URL of the rendered HTML. Nothing is ever fetched from it, the URLs of
+#: the static files are only resolved against it.
+BASE_URL = 'http://payslip.invalid/'
+
+#: Path of the payslip stylesheet within the static files.
+STYLESHEET = 'payslip/css/payslip.css'
+
+_executor = None
+_render_context = None
+_local = threading.local()
+
+
+class RenderContext(object):
+    """
+    Holds everything a PDF rendering needs besides the HTML.
+
+    The static files of the app are read into memory once and the payslip
+    stylesheet is parsed once, so every process creates one context and
+    reuses it for all its renderings.
+
+    :assets: Dictionary of the static files of the app by their path.
+    :static_url: Absolute URL of the static files.
+
+    """
+    def __init__(self):
+        if not apps.ready:
+            # We are in a freshly spawned worker process
+            django.setup()
+        self.static_url = urljoin(BASE_URL, settings.STATIC_URL)
+        self.assets = {}
+        for finder in finders.get_finders():
+            try:
+                files = list(finder.list([]))
+            except OSError:
+                # A configured static files directory does not exist
+                continue
+            for path, storage in files:
+                path = path.replace('\\', '/')
+                if path.startswith('payslip/') and path not in self.assets:
+                    with storage.open(path) as f:
+                        self.assets[path] = f.read()
+
+    @cached_property
+    def font_config(self):
+        from weasyprint.fonts import FontConfiguration
+        return FontConfiguration()
+
+    @cached_property
+    def stylesheet(self):
+        """Returns the parsed payslip stylesheet."""
+        from weasyprint import CSS
+        return CSS(string=self.assets[STYLESHEET],
+                   base_url=urljoin(self.static_url, STYLESHEET),
+                   url_fetcher=self.fetch_url, font_config=self.font_config)
+
+    def fetch_url(self, url):
+        """
+        URL fetcher for WeasyPrint, which serves the static files of the app
+        from memory and refuses all other URLs.
+
+        """
+        if url.startswith('data:'):
+            from weasyprint import default_url_fetcher
+            return default_url_fetcher(url)
+        if url.startswith(self.static_url):
+            path = unquote(urlsplit(url[len(self.static_url):]).path)
+            if path == STYLESHEET:
+                # It is already applied as the parsed ``stylesheet``
+                return {'string': b'', 'mime_type': 'text/css'}
+            if path in self.assets:
+                return {'string': self.assets[path],
+                        'mime_type': mimetypes.guess_type(path)[0]}
+        raise ValueError(
+            'The URL "{0}" is not available for PDF renderings.'.format(url))
+
+    def write_pdf(self, html, timed=False):
+        """
+        Converts the given HTML into a PDF document.
+
+        With ``timed`` it returns a tuple of the document and the durations of
+        the ``layout`` and ``write_pdf`` stages.
+
+        """
+        from weasyprint import HTML
+        timer = StageTimer()
+        with timer.stage('layout'):
+            document = HTML(
+                string=html, base_url=BASE_URL, url_fetcher=self.fetch_url,
+            ).render(stylesheets=[self.stylesheet],
+                     font_config=self.font_config)
+        with timer.stage('write_pdf'):
+            pdf = document.write_pdf()
+        if timed:
+            return pdf, timer.timings
+        return pdf
+
+
+def get_render_context():
+    """Returns the ``RenderContext`` of this process."""
+    global _render_context
+    if _render_context is None:
+        _render_context = RenderContext()
+    return _render_context
+
+
+def reload_render_context():
+    """
+    Drops the ``RenderContext`` of this process and stops the worker
+    processes, so the next renderings pick up changed static files.
+
+    """
+    global _render_context
+    _render_context = None
+    shutdown_executor()
+
+
+def get_executor():
+    """
+    Returns the process pool, which is shared by all renderings of this
+    process.
+
+    Returns ``None``, if ``PAYSLIP_PDF_WORKERS`` is set to ``0``.
+
+    """
+    global _executor
+    if _executor is None and app_settings.PDF_WORKERS != 0:
+        _executor = ProcessPoolExecutor(max_workers=app_settings.PDF_WORKERS)
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    """Shuts down the process pool. It is started again when needed."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def _discard_executor(executor):
+    # A broken pool already stopped its workers. It isn't shut down, because
+    # a killed worker can still hold the lock of the result queue.
+    global _executor
+    if _executor is executor:
+        _executor = None
+
+
+@contextmanager
+def rendering_in_process():
+    """
+    Renders the PDF documents of the current thread in the current process
+    instead of the process pool meanwhile, e.g. to profile them.
+
+    """
+    _local.in_process = True
+    try:
+        yield
+    finally:
+        _local.in_process = False
+
+
+def get_pdf_window():
+    """
+    Returns the number of documents, which a batch should render at the same
+    time, so every PDF worker is busy, but no more documents are in memory.
+
+    """
+    if app_settings.PDF_WORKERS == 0:
+        return 1
+    return app_settings.PDF_WORKERS or cpu_count()
+
+
+def write_pdf(html, timed=False):
+    """
+    Converts the given HTML into a PDF document.
+
+    This function is executed in the worker processes. WeasyPrint is only
+    imported there, so processes, which never render themselves, don't load
+    it.
+
+    """
+    return get_render_context().write_pdf(html, timed)
+
+
+def _add_timings(timer, future, timed_future):
+    if timed_future.exception() is not None:
+        future.set_exception(timed_future.exception())
+        return
+    pdf, timings = timed_future.result()
+    timer.update(timings)
+    future.set_result(pdf)
+
+
+def submit_pdf(html, timer=None):
+    """
+    Returns a ``Future`` of the PDF document of the given HTML.
+
+    If a worker of the process pool died, the pool is started again. Only
+    the renderings, which were running meanwhile, fail.
+
+    :timer: Optional ``StageTimer``, which gets the durations of the
+      ``layout`` and ``write_pdf`` stages of the worker, before the future is
+      done.
+
+    """
+    timed = timer is not None
+    executor = None
+    if not getattr(_local, 'in_process', False):
+        executor = get_executor()
+    if executor is not None:
+        try:
+            future = executor.submit(write_pdf, html, timed)
+        except BrokenProcessPool:
+            # A worker died, e.g. of an OOM kill. The pool can't be used
+            # anymore, so it is replaced once.
+            _discard_executor(executor)
+            future = get_executor().submit(write_pdf, html, timed)
+    else:
+        future = Future()
+        try:
+            future.set_result(write_pdf(html, timed))
+        except Exception as exc:
+            future.set_exception(exc)
+    if not timed:
+        return future
+    pdf_future = Future()
+    future.add_done_callback(partial(_add_timings, timer, pdf_future))
+    return pdf_future
+
+
+def render_pdf(html):
+    """Returns the PDF document of the given HTML."""
+    return submit_pdf(html).result()
+
+
+def get_payslip_context(result, payment_extra_fields=None, timer=None):
+    """
+    Returns the context of the ``payslip/payslip.html`` template for the
+    given ``PayslipResult``.
+
+    The content of the payslip is taken from the cache, if possible.
+
+    :timer: Optional ``StageTimer``, which gets the durations of the
+      ``query`` and ``render_html`` stages.
+
+    """
+    if timer is None:
+        timer = StageTimer()
+    if payment_extra_fields is None:
+        payment_extra_fields = get_catalogue().get_extra_field_types(
+            'Payment')
+    with timer.stage('query'):
+        prefetch_employee_extra_fields([result.employee])
+        prefetch_extra_field_values(result.payments)
+    context = {
+        'employee': result.employee,
+        'date_start': result.date_start,
+        'date_end': result.date_end,
+        'payments': result.payments,
+        'payment_extra_fields': payment_extra_fields,
+        'sum_year': result.sum_year,
+        'sum_year_neg': result.sum_year_net,
+        'sum': result.sum,
+        'sum_neg': result.sum_neg,
+        'currency': app_settings.CURRENCY,
+    }
+    cache = get_cache()
+    with timer.stage('render_html'):
+        if cache is not None:
+            key = get_payslip_digest(result, payment_extra_fields, 'html')
+            content = cache.get(key)
+        if cache is None or content is None:
+            content = render_to_string(
+                'payslip/partials/payslip_content.html',
+                context).encode('utf-8')
+            if cache is not None:
+                cache.set(key, content)
+    context['payslip_content'] = mark_safe(content.decode('utf-8'))
+    return context
+
+
+def render_payslip_html(result, payment_extra_fields=None, timer=None):
+    """Returns the HTML of the given ``PayslipResult`` for a PDF."""
+    if timer is None:
+        timer = StageTimer()
+    context = get_payslip_context(result, payment_extra_fields, timer)
+    with timer.stage('render_html'):
+        return render_to_string('payslip/payslip.html', context)
+
+
+def _cache_pdf(cache, key, future):
+    if future.exception() is None:
+        cache.set(key, future.result())
+
+
+def submit_payslip_pdf(result, payment_extra_fields=None, timer=None):
+    """
+    Returns a ``Future`` of the PDF document of the given ``PayslipResult``.
+
+    The document is taken from the cache, if possible, and stored in the
+    cache once it is rendered.
+
+    :timer: Optional ``StageTimer``, which gets the durations of the stages
+      of the rendering. A cached document passes none of them.
+
+    """
+    if payment_extra_fields is None:
+        payment_extra_fields = get_catalogue().get_extra_field_types(
+            'Payment')
+    cache = get_cache()
+    if cache is None:
+        return submit_pdf(render_payslip_html(
+            result, payment_extra_fields, timer), timer)
+    key = get_payslip_digest(result, payment_extra_fields, 'pdf',
+                             get_render_context().assets[STYLESHEET])
+    pdf = cache.get(key)
+    if pdf is not None:
+        future = Future()
+        future.set_result(pdf)
+        return future
+    future = submit_pdf(render_payslip_html(
+        result, payment_extra_fields, timer), timer)
+    future.add_done_callback(partial(_cache_pdf, cache, key))
+    return future
+
+
+def get_payslip_filename(result):
+    """
+    Returns the file name of the PDF of the given ``PayslipResult``.
+
+    The HR number is only unique within a company and optional, so the name
+    ends with the primary key of the employee.
+
+    """
+    employee = result.employee
+    if employee.hr_number:
+        name = '{0}-{1}'.format(employee.hr_number, employee.pk)
+    else:
+        name = 'employee-{0}'.format(employee.pk)
+    return '{0}_{1}_{2:02d}.pdf'.format(
+        name, result.date_start.year, result.date_start.month)
+
+
+def get_archive_filename(company, year, month):
+    """Returns the file name of the ZIP archive of a payroll run."""
+    return 'payslips_{0}_{1}_{2:02d}.zip'.format(
+        company.pk, int(year), int(month))
+
+
+class ZipBuffer(object):
+    """
+    Write-only file object for a ``ZipFile``, which holds the written data
+    only until it is popped.
+
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """Returns and forgets the data written since the last call."""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_payslip_archive(payslips):
+    """
+    Yields a ZIP archive with the PDF documents of the given
+    ``PayslipResult`` objects, e.g. of ``PayrollRun.iter_payslips``.
+
+    Every document is yielded as soon as it is rendered. There are never
+    more documents in memory than PDF workers and the payslips are consumed
+    in batches, so the archive can be streamed regardless of the number of
+    employees.
+
+    """
+    window = get_pdf_window()
+    payment_extra_fields = get_catalogue().get_extra_field_types('Payment')
+    buffer = ZipBuffer()
+    archive = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED)
+    pending = deque()
+    for payslip in iter_prefetched(payslips):
+        pending.append((get_payslip_filename(payslip), submit_payslip_pdf(
+            payslip, payment_extra_fields)))
+        if len(pending) >= window:
+            filename, future = pending.popleft()
+            archive.writestr(filename, future.result())
+            yield buffer.pop()
+    while pending:
+        filename, future = pending.popleft()
+        archive.writestr(filename, future.result())
+        yield buffer.pop()
+    archive.close()
+    yield buffer.pop()
@@ -0,0 +1,265 @@
+"""Synthetic payroll data of the ``payslip`` app for performance tests."""
+import random
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.timezone import make_aware
+
+from .bulk import BATCH_SIZE
+from .models import (
+    Company,
+    Employee,
+    ExtraField,
+    ExtraFieldType,
+    Payment,
+    PaymentType,
+)
+
+FIRST_NAMES = ('Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta',
+               'Hans', 'Ida', 'Jonas', 'Lena', 'Max', 'Nina', 'Paul')
+
+LAST_NAMES = ('Bauer', 'Becker', 'Fischer', 'Hoffmann', 'Koch', 'Meyer',
+              'Richter', 'Schmidt', 'Schneider', 'Wagner', 'Weber')
+
+#: Payment types of the seeded payments as ``(name, rrule)``.
+PAYMENT_TYPES = (
+    ('Salary', 'MONTHLY'),
+    ('Health insurance', 'MONTHLY'),
+    ('Holiday pay', 'YEARLY'),
+    ('Bonus', ''),
+    ('Overtime', ''),
+    ('Deduction', ''),
+)
+
+#: Extra field types of the seeded data as ``(name, model, fixed values)``.
+#: Types without fixed values get one value per employee.
+EXTRA_FIELD_TYPES = (
+    ('Tax class', 'Employee', ['1', '2', '3', '4', '5', '6']),
+    ('Personnel file', 'Employee', None),
+    ('Cost centre', 'Payment', ['CC-{0}'.format(x) for x in range(100, 110)]),
+)
+
+SeedResult = namedtuple('SeedResult', [
+    'companies', 'employees', 'payments', 'duration'])
+
+
+class Seeder(object):
+    """
+    Generates companies with employees, extra fields and years of payment
+    history.
+
+    The same arguments generate the same data, as long as the seeding starts
+    with the same database. The primary keys are assigned by the seeder, so
+    the objects can be linked without fetching them again and nothing else
+    may write to the seeded tables meanwhile.
+
+    Usage::
+
+        result = Seeder(companies=10, employees=1000, years=5).run()
+
+    :companies: Number of companies.
+    :employees: Number of employees per company.
+    :years: Number of years of payment history until ``end_year``.
+    :payments: Number of single payments per employee and year, in addition
+      to the recurring salary, insurance and holiday pay.
+    :end_year: The last year of the payment history.
+    :seed: Seed of the random numbers.
+    :chunk_size: Number of objects per bulk insert and transaction.
+
+    """
+    def __init__(self, companies=1, employees=100, years=3, payments=12,
+                 end_year=None, seed=0, chunk_size=BATCH_SIZE):
+        self.companies = companies
+        self.employees = employees
+        self.years = years
+        self.payments = payments
+        self.end_year = end_year or datetime.now().year
+        self.start_year = self.end_year - years + 1
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.user_model = get_user_model()
+        self.next_pks = {}
+        self.pending = OrderedDict()
+        self.payment_count = 0
+
+    def next_pk(self, model):
+        """Returns the next free primary key of a model."""
+        if model not in self.next_pks:
+            self.next_pks[model] = (model.objects.aggregate(
+                pk__max=Max('pk'))['pk__max'] or 0) + 1
+        pk = self.next_pks[model]
+        self.next_pks[model] += 1
+        return pk
+
+    def add(self, obj):
+        """Queues an object and inserts the queue, once it is full."""
+        objs = self.pending.setdefault(type(obj), [])
+        objs.append(obj)
+        if len(objs) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserts all queued objects with one transaction. The models are
+        inserted in the order, in which they were queued first. Databases
+        like MySQL check the foreign keys of every insert right away, so the
+        first object of a model must be queued after the first objects of
+        the models it references.
+
+        """
+        with transaction.atomic():
+            for model, objs in self.pending.items():
+                if objs:
+                    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+                    del objs[:]
+
+    def get_payment_types(self):
+        return dict(
+            (name, PaymentType.objects.get_or_create(
+                name=name, rrule=rrule)[0])
+            for name, rrule in PAYMENT_TYPES)
+
+    def get_extra_fields(self):
+        """
+        Returns the extra field types and their fixed values as
+        ``{name: (field_type, [ExtraField, ...])}``.
+
+        """
+        extra_fields = {}
+        for name, model, values in EXTRA_FIELD_TYPES:
+            field_type = ExtraFieldType.objects.get_or_create(
+                name=name, model=model,
+                defaults={'fixed_values': values is not None})[0]
+            fields = []
+            for value in values or []:
+                fields.append(ExtraField.objects.get_or_create(
+                    field_type=field_type, value=value)[0])
+            extra_fields[name] = (field_type, fields)
+        return extra_fields
+
+    def aware(self, year, month, day):
+        return make_aware(datetime(year, month, day))
+
+    def seed_employee(self, company, password):
+        user = self.user_model(
+            pk=self.next_pk(self.user_model),
+            first_name=self.random.choice(FIRST_NAMES),
+            last_name=self.random.choice(LAST_NAMES),
+            password=password,
+        )
+        user.username = 'seed_{0}'.format(user.pk)
+        user.email = '{0}@example.com'.format(user.username)
+        self.add(user)
+        employee = Employee(
+            pk=self.next_pk(Employee),
+            user=user,
+            company=company,
+            hr_number=user.pk,
+            title=self.random.choice(('1', '2', '3', '4')),
+            is_manager=self.random.random() < 0.05,
+        )
+        self.add(employee)
+        # Queue the extra field before the first link, so it is inserted
+        # before the links, see ``flush``
+        personnel_file = ExtraField(
+            pk=self.next_pk(ExtraField),
+            field_type=self.extra_fields['Personnel file'][0],
+            value='PF-{0:06d}'.format(employee.pk))
+        self.add(personnel_file)
+        through = Employee.extra_fields.through
+        tax_classes = self.extra_fields['Tax class'][1]
+        self.add(through(employee_id=employee.pk,
+                         extrafield_id=self.random.choice(tax_classes).pk))
+        self.add(through(employee_id=employee.pk,
+                         extrafield_id=personnel_file.pk))
+        return employee
+
+    def add_payment(self, employee, payment_type, amount, date,
+                    end_date=None, cost_centre=None):
+        payment = Payment(
+            pk=self.next_pk(Payment),
+            employee=employee,
+            payment_type=payment_type,
+            amount=amount,
+            date=date,
+            end_date=end_date,
+        )
+        payment.update_periods()
+        self.add(payment)
+        self.payment_count += 1
+        if cost_centre is not None:
+            through = Payment.extra_fields.through
+            self.add(through(payment_id=payment.pk,
+                             extrafield_id=cost_centre.pk))
+
+    def seed_payments(self, employee):
+        """
+        Adds one salary and insurance per year, which ends with the year
+        but for the last one, an open holiday pay and random single
+        payments.
+
+        """
+        hired = self.aware(self.start_year, self.random.randint(1, 12), 1)
+        salary = Decimal(self.random.randrange(2000, 6000, 50))
+        cost_centre = self.random.choice(self.extra_fields['Cost centre'][1])
+        types = self.payment_types
+        self.add_payment(employee, types['Holiday pay'], salary / 2,
+                         max(hired, self.aware(self.start_year, 6, 15)))
+        for year in range(self.start_year, self.end_year + 1):
+            start = max(hired, self.aware(year, 1, 1))
+            end = None
+            if year < self.end_year:
+                end = self.aware(year, 12, 31)
+            self.add_payment(employee, types['Salary'], salary, start, end)
+            self.add_payment(employee, types['Health insurance'],
+                             (salary * Decimal('-0.08')).quantize(
+                                 Decimal('0.01')), start, end)
+            for index in range(self.payments):
+                name = self.random.choice(('Bonus', 'Overtime', 'Deduction'))
+                amount = Decimal(self.random.randrange(1000, 50000)) / 100
+                if name == 'Deduction':
+                    amount = -amount
+                self.add_payment(
+                    employee, types[name], amount,
+                    self.aware(year, self.random.randint(1, 12),
+                               self.random.randint(1, 28)),
+                    cost_centre=cost_centre)
+            # Raise of the next year
+            salary += Decimal(self.random.randrange(0, 300, 10))
+
+    def reset_sequences(self):
+        """Moves the sequences of the database behind the assigned keys."""
+        models = list(self.next_pks)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+    def run(self):
+        """Generates the data and returns a ``SeedResult``."""
+        started = time.time()
+        self.payment_types = self.get_payment_types()
+        self.extra_fields = self.get_extra_fields()
+        # Hashing a password is slow on purpose, so all users share one
+        password = make_password(None)
+        for index in range(self.companies):
+            company = Company(pk=self.next_pk(Company))
+            company.name = 'Company {0}'.format(company.pk)
+            self.add(company)
+            for employee_index in range(self.employees):
+                employee = self.seed_employee(company, password)
+                self.seed_payments(employee)
+        self.flush()
+        self.reset_sequences()
+        return SeedResult(
+            companies=self.companies,
+            employees=self.companies * self.employees,
+            payments=self.payment_count,
+            duration=time.time() - started,
+        )
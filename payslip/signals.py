@@ -0,0 +1,8 @@
+"""Signals of the ``payslip`` app."""
+from django.dispatch import Signal
+
+#: Sent after a payslip has been generated. ``timings`` is a dictionary of
+#: the seconds spent in every stage of ``payslip.timing.STAGES``, which was
+#: passed. ``kind`` is ``html`` or ``pdf``.
+payslip_timed = Signal(providing_args=[
+    'employee_id', 'year', 'month', 'kind', 'timings'])
@@ -0,0 +1,148 @@
+"""Finalising of payroll periods of the ``payslip`` app."""
+import json
+from collections import deque
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+
+from .catalogue import get_catalogue
+from .engine import PayrollRun, iter_prefetched
+from .models import Company, Payslip
+from .rendering import (
+    get_payslip_context,
+    get_pdf_window,
+    submit_payslip_pdf,
+)
+
+#: Number of snapshots per bulk insert. Every snapshot holds its PDF
+#: document, so they are inserted in small batches.
+SNAPSHOT_BATCH_SIZE = 50
+
+
+def get_payslip_rows(result):
+    """
+    Returns the payments of a ``PayslipResult`` as JSON serializable rows.
+
+    Their extra field values must have been fetched with
+    ``prefetch_extra_field_values``.
+
+    """
+    return [{
+        'payment': payment.pk,
+        'payment_type': payment.payment_type.name,
+        'rrule': payment.payment_type.rrule,
+        'amount': payment.amount,
+        'date': payment.date,
+        'end_date': payment.end_date,
+        'description': payment.description,
+        'extra_fields': payment.extra_field_values,
+    } for payment in result.payments]
+
+
+def iter_snapshots(payslips, payment_extra_fields):
+    """
+    Yields the unsaved ``Payslip`` snapshots of the given ``PayslipResult``
+    objects.
+
+    The documents are rendered in the PDF pool, but there are never more
+    documents in memory than the pool renders at once, like in
+    ``iter_payslip_archive``.
+
+    """
+    window = get_pdf_window()
+    pending = deque()
+    for payslip in payslips:
+        pending.append((
+            payslip,
+            get_payslip_context(
+                payslip, payment_extra_fields)['payslip_content'],
+            submit_payslip_pdf(payslip, payment_extra_fields)))
+        if len(pending) >= window:
+            yield get_snapshot(*pending.popleft())
+    while pending:
+        yield get_snapshot(*pending.popleft())
+
+
+def get_snapshot(payslip, html, future):
+    """Returns the unsaved ``Payslip`` of a ``PayslipResult``."""
+    return Payslip(
+        employee=payslip.employee,
+        year=payslip.date_start.year,
+        month=payslip.date_start.month,
+        rows=json.dumps(get_payslip_rows(payslip), cls=DjangoJSONEncoder),
+        sum=payslip.sum,
+        sum_neg=payslip.sum_neg,
+        sum_year=payslip.sum_year,
+        sum_year_neg=payslip.sum_year_neg,
+        html=html,
+        pdf=future.result(),
+    )
+
+
+def save_snapshots(company, snapshots):
+    """
+    Inserts the given snapshots of one period and skips the ones of
+    employees, whose period is finalised already.
+
+    The company is only locked while the snapshots are inserted. Snapshots,
+    which another process inserted meanwhile, are skipped due to their
+    unique period.
+
+    Returns the number of inserted snapshots.
+
+    """
+    with transaction.atomic():
+        Company.objects.select_for_update().get(pk=company.pk)
+        finalised = set(Payslip.objects.filter(
+            employee__in=[snapshot.employee_id for snapshot in snapshots],
+            year=snapshots[0].year, month=snapshots[0].month).values_list(
+                'employee', flat=True))
+        snapshots = [snapshot for snapshot in snapshots
+                     if snapshot.employee_id not in finalised]
+        try:
+            with transaction.atomic():
+                Payslip.objects.bulk_create(snapshots)
+            return len(snapshots)
+        except IntegrityError:
+            pass
+        count = 0
+        for snapshot in snapshots:
+            try:
+                with transaction.atomic():
+                    snapshot.save()
+            except IntegrityError:
+                continue
+            count += 1
+        return count
+
+
+def finalise_payroll_run(company, year, month):
+    """
+    Freezes the payslips of all employees of a company for one month.
+
+    Streams the payroll run, renders the payslips in the PDF pool and stores
+    them as ``Payslip`` snapshots in batches of ``SNAPSHOT_BATCH_SIZE``, so
+    the memory doesn't grow with the number of employees. Every batch is
+    inserted in a transaction of its own, see ``save_snapshots``. Employees,
+    whose period is already finalised, are skipped, so an interrupted
+    finalisation can simply be started again.
+
+    Returns the number of created snapshots.
+
+    """
+    finalised = set(Payslip.objects.filter(
+        employee__company=company, year=int(year),
+        month=int(month)).values_list('employee', flat=True))
+    payslips = (payslip for payslip in PayrollRun(
+        company, year, month).iter_payslips()
+        if payslip.employee.pk not in finalised)
+    payment_extra_fields = get_catalogue().get_extra_field_types('Payment')
+    snapshots = iter_snapshots(
+        iter_prefetched(payslips, SNAPSHOT_BATCH_SIZE), payment_extra_fields)
+    count = 0
+    while True:
+        batch = list(islice(snapshots, SNAPSHOT_BATCH_SIZE))
+        if not batch:
+            return count
+        count += save_snapshots(company, batch)
@@ -9,7 +9,18 @@ register = Library()
 
 @register.filter(is_safe=True)
 def get_extra_field_value(field_type, payment):
-    """Returns the value of a specific field type."""
+    """
+    Returns the value of a specific field type.
+
+    Uses the values fetched by ``prefetch_extra_field_values``, if possible,
+    and queries the extra field otherwise.
+
+    """
+    values = getattr(payment, 'extra_field_values', None)
+    if values is not None:
+        if field_type.pk in values:
+            return values[field_type.pk]
+        return mark_safe('&nbsp;')
     try:
         return payment.extra_fields.get(field_type=field_type).value
     except ExtraField.DoesNotExist:
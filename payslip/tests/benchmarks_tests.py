@@ -0,0 +1,55 @@
+"""Tests for the benchmarks of the ``payslip`` app."""
+from django.test import TestCase
+
+from mixer.backend.django import mixer
+
+from .. import benchmarks
+
+
+class MeasureTestCase(TestCase):
+    """Tests for the ``measure`` function."""
+    longMessage = True
+
+    def test_measure(self):
+        calls = []
+
+        def func():
+            calls.append(mixer.blend('payslip.Company'))
+
+        result = benchmarks.measure(func, repeat=3)
+        self.assertEqual(len(calls), 6, msg=(
+            'Should warm up, count the queries, time three calls and trace'
+            ' the memory'))
+        self.assertEqual(result['queries'], 1)
+        self.assertLessEqual(result['best'], result['median'])
+
+
+class RunBenchmarksTestCase(TestCase):
+    """Tests for the ``run_benchmarks`` function."""
+    longMessage = True
+
+    def test_run_benchmarks(self):
+        datasets = [('tiny', {'employees': 2, 'years': 1, 'payments': 1})]
+        results = benchmarks.run_benchmarks(datasets=datasets, repeat=1)
+        self.assertEqual(
+            [result['benchmark'] for result in results['results']],
+            list(benchmarks.BENCHMARKS))
+        self.assertTrue(all(
+            result['dataset'] == 'tiny' and result['queries'] > 0 and
+            result['payments'] == 8 for result in results['results']),
+            msg='Should measure every benchmark against the seeded data')
+        self.assertEqual(benchmarks.compare(results, results), [])
+
+    def test_compare(self):
+        baseline = {'results': [{
+            'dataset': 'tiny', 'benchmark': 'dashboard', 'queries': 5,
+            'median': 0.1, 'peak_memory': 1000}]}
+        results = {'results': [
+            dict(baseline['results'][0], queries=6, median=0.2,
+                 peak_memory=1100),
+            dict(baseline['results'][0], benchmark='payroll_run')]}
+        self.assertEqual(benchmarks.compare(baseline, results), [
+            'tiny/dashboard: 6 queries instead of 5',
+            'tiny/dashboard: 0.2000s instead of 0.1000s',
+        ], msg=('Should report more queries and slower times, but neither'
+                ' memory within the threshold nor unknown benchmarks'))
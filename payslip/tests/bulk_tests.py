@@ -0,0 +1,69 @@
+"""Tests for the bulk helpers of the ``payslip`` app."""
+import multiprocessing
+import os
+from unittest import skipIf
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import six
+
+from mixer.backend.django import mixer
+
+from .. import bulk
+from ..models import ExtraField
+
+
+class BulkTestCase(TestCase):
+    """Tests for the functions of the ``bulk`` module."""
+    longMessage = True
+
+    def setUp(self):
+        self.field_type = mixer.blend('payslip.ExtraFieldType')
+
+    def test_bulk_create(self):
+        self.assertEqual(bulk.bulk_create(ExtraField, []), [])
+        fields = bulk.bulk_create(ExtraField, [
+            ExtraField(field_type=self.field_type, value=str(index))
+            for index in range(3)])
+        self.assertEqual(
+            [ExtraField.objects.get(pk=field.pk).value for field in fields],
+            ['0', '1', '2'], msg='Should set the primary keys')
+        users = bulk.bulk_create(User, [
+            User(username=username) for username in ('foo', 'bar')],
+            key='username')
+        self.assertTrue(all(user.pk for user in users))
+
+    def test_bulk_update(self):
+        fields = [mixer.blend('payslip.ExtraField', value='old')
+                  for index in range(3)]
+        for index, field in enumerate(fields[:2]):
+            field.value = str(index)
+            field.field_type = self.field_type
+        with self.assertNumQueries(1):
+            bulk.bulk_update(ExtraField, fields[:2], ['value', 'field_type'])
+        self.assertEqual(
+            list(ExtraField.objects.order_by('pk').values_list(
+                'value', 'field_type')),
+            [('0', self.field_type.pk), ('1', self.field_type.pk),
+             ('old', fields[2].field_type_id)])
+
+    @skipIf(six.PY2, 'Python 2 cannot spawn workers on POSIX')
+    def test_hash_password(self):
+        # Spawned workers start without a configured Django
+        pool = multiprocessing.get_context('spawn').Pool(1)
+        try:
+            password = pool.apply(bulk.hash_password, ('secret', ))
+        finally:
+            pool.terminate()
+        self.assertTrue(check_password('secret', password))
+
+    def test_workers_find_settings(self):
+        self.assertTrue(bulk.workers_find_settings('fork'))
+        self.assertTrue(bulk.workers_find_settings('spawn'))
+        settings_module = os.environ.pop('DJANGO_SETTINGS_MODULE')
+        try:
+            self.assertFalse(bulk.workers_find_settings('spawn'), msg=(
+                'Spawned workers should not find configured settings'))
+        finally:
+            os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
@@ -0,0 +1,78 @@
+"""Tests for the cache of the ``payslip`` app."""
+import shutil
+import tempfile
+from datetime import datetime
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone, translation
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from .. import cache
+from ..engine import PayslipCalculator
+
+
+class DjangoCacheBackendTestCase(SimpleTestCase):
+    """Tests for the ``DjangoCacheBackend`` class."""
+    longMessage = True
+
+    def test_backend(self):
+        backend = cache.DjangoCacheBackend()
+        self.assertIsNone(backend.get('missing'))
+        backend.set('key', b'content')
+        self.assertEqual(backend.get('key'), b'content')
+
+
+class FileSystemCacheBackendTestCase(SimpleTestCase):
+    """Tests for the ``FileSystemCacheBackend`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_backend(self):
+        backend = cache.FileSystemCacheBackend(self.location)
+        self.assertIsNone(backend.get('abcdef'), msg=(
+            'Should return None for missing keys'))
+        backend.set('abcdef', b'content')
+        self.assertEqual(backend.get('abcdef'), b'content')
+        backend.set('abcdef', b'changed')
+        self.assertEqual(backend.get('abcdef'), b'changed', msg=(
+            'Should replace existing entries'))
+
+
+class GetPayslipDigestTestCase(TestCase):
+    """Tests for the ``get_payslip_digest`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee')
+        self.payment = mixer.blend(
+            'payslip.Payment', employee=self.employee,
+            payment_type__rrule='', amount=100,
+            date=make_aware(datetime(2016, 3, 10)))
+
+    def get_digest(self, kind='pdf'):
+        result = PayslipCalculator(self.employee, 2016, 3).calculate()
+        return cache.get_payslip_digest(result, [], kind)
+
+    def test_digest(self):
+        digest = self.get_digest()
+        self.assertEqual(digest, self.get_digest(), msg=(
+            'Should return the same digest for the same inputs'))
+        self.assertNotEqual(digest, self.get_digest('html'), msg=(
+            'Should depend on the kind of the document'))
+        self.payment.amount = 200
+        self.payment.save()
+        self.assertNotEqual(digest, self.get_digest(), msg=(
+            'Should change with the payments of the period'))
+        with translation.override('de'):
+            self.assertNotEqual(digest, self.get_digest(), msg=(
+                'Should depend on the language'))
+        with timezone.override(timezone.get_fixed_timezone(-300)):
+            self.assertNotEqual(digest, self.get_digest(), msg=(
+                'Should depend on the time zone'))
@@ -0,0 +1,100 @@
+"""Tests for the catalogue of the ``payslip`` app."""
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from mixer.backend.django import mixer
+
+from .. import app_settings, catalogue
+
+
+class GetCatalogueTestCase(TestCase):
+    """Tests for the ``get_catalogue`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.cache_alias = app_settings.CATALOGUE_CACHE
+        app_settings.CATALOGUE_CACHE = 'default'
+        catalogue.invalidate_catalogue()
+        self.payment_type = mixer.blend('payslip.PaymentType')
+        self.field_types = [
+            mixer.blend('payslip.ExtraFieldType', model='Payment'),
+            mixer.blend('payslip.ExtraFieldType', model=None),
+            mixer.blend('payslip.ExtraFieldType', model='Employee'),
+        ]
+
+    def tearDown(self):
+        catalogue.invalidate_catalogue()
+        app_settings.CATALOGUE_CACHE = self.cache_alias
+
+    def test_get_catalogue(self):
+        current = catalogue.get_catalogue()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogue.get_catalogue(), current, msg=(
+                'Should reuse the catalogue of the process'))
+        self.assertEqual(current.payment_types, (self.payment_type, ))
+        self.assertEqual(current.get_extra_field_types('Payment'),
+                         [self.field_types[0]])
+        self.assertEqual(
+            set(current.get_extra_field_types(
+                'Payment', include_general=True)),
+            set(self.field_types[:2]))
+
+        self.payment_type.name = 'Changed'
+        self.payment_type.save()
+        self.assertEqual(
+            catalogue.get_catalogue().payment_types[0].name, 'Changed',
+            msg='Should reload the catalogue after a change')
+        self.payment_type.delete()
+        self.assertEqual(catalogue.get_catalogue().payment_types, ())
+
+    def test_other_process(self):
+        current = catalogue.get_catalogue()
+        catalogue.bump_version()
+        self.assertNotEqual(catalogue.get_catalogue(), current, msg=(
+            'Should reload the catalogue, if another process changed it'))
+
+    def test_lazy_tables(self):
+        current = catalogue.Catalogue(None)
+        with self.assertNumQueries(1, msg=(
+                'Should only load the table, which is used')):
+            self.assertEqual(current.payment_types_by_pk,
+                             {self.payment_type.pk: self.payment_type})
+
+
+class InvalidateCatalogueTestCase(TransactionTestCase):
+    """Tests for the ``invalidate_catalogue`` function."""
+    longMessage = True
+
+    def setUp(self):
+        # The callbacks of on_commit only run, if the transaction is committed
+        self.cache_alias = app_settings.CATALOGUE_CACHE
+        app_settings.CATALOGUE_CACHE = 'default'
+        catalogue.invalidate_catalogue()
+        self.payment_type = mixer.blend('payslip.PaymentType', name='Salary')
+
+    def tearDown(self):
+        catalogue.invalidate_catalogue()
+        app_settings.CATALOGUE_CACHE = self.cache_alias
+
+    def test_invalidate_catalogue(self):
+        # Catalogue of another process, which shares the cache
+        other = catalogue.get_catalogue()
+        self.assertEqual(other.payment_types[0].name, 'Salary')
+        with transaction.atomic():
+            self.payment_type.name = 'Wage'
+            self.payment_type.save()
+            version = catalogue.get_version()
+            self.assertNotEqual(version, other.version, msg=(
+                'Should change the version, when a type is saved'))
+        self.assertNotEqual(catalogue.get_version(), version, msg=(
+            'Should change the version again after the commit'))
+
+        catalogue._catalogue = other
+        self.assertEqual(
+            catalogue.get_catalogue().payment_types[0].name, 'Wage', msg=(
+                'Should reload the catalogue of the other process'))
+        other = catalogue.get_catalogue()
+        self.payment_type.delete()
+        catalogue._catalogue = other
+        self.assertEqual(catalogue.get_catalogue().payment_types, (), msg=(
+            'Should reload the catalogue, when a type is deleted'))
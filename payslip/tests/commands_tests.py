@@ -0,0 +1,166 @@
+"""Tests for the management commands of the ``payslip`` app."""
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from ..models import PayslipJob
+
+
+class PayslipPayrollRunTestCase(TestCase):
+    """Tests for the ``payslip_payroll_run`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        mixer.blend('payslip.Payment', employee=self.employee,
+                    payment_type__rrule='MONTHLY',
+                    date=make_aware(datetime(2016, 1, 1)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('payslip_payroll_run', str(self.employee.company.pk),
+                     '2016', '3', stdout=out)
+        self.assertIn('Calculated 1 payslips from 1 payments', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('payslip_payroll_run', '0', '2016', '3', stdout=out)
+
+
+class PayslipFinaliseTestCase(TestCase):
+    """Tests for the ``payslip_finalise`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee')
+        mixer.blend('payslip.Payment', employee=self.employee,
+                    payment_type__rrule='MONTHLY',
+                    date=make_aware(datetime(2016, 1, 1)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('payslip_finalise', str(self.employee.company.pk),
+                     '2016', '3', stdout=out)
+        self.assertIn('Finalised 1 payslips.', out.getvalue())
+        call_command('payslip_finalise', str(self.employee.company.pk),
+                     '2016', '3', stdout=out)
+        self.assertIn('Finalised 0 payslips.', out.getvalue(), msg=(
+            'Should skip finalised periods'))
+        with self.assertRaises(CommandError):
+            call_command('payslip_finalise', '0', '2016', '3', stdout=out)
+
+
+class PayslipWorkerTestCase(TestCase):
+    """Tests for the ``payslip_worker`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.job = mixer.blend('payslip.PayslipJob', employee=None,
+                               year=2016, month=3)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('payslip_worker', once=True, stdout=out)
+        self.assertIn('{0}\tDone'.format(self.job.pk), out.getvalue())
+        self.assertEqual(
+            PayslipJob.objects.get(pk=self.job.pk).status, PayslipJob.DONE)
+
+
+class PayslipExplainTestCase(TestCase):
+    """Tests for the ``payslip_explain`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee')
+        mixer.blend('payslip.Payment', employee=self.employee,
+                    payment_type__rrule='MONTHLY',
+                    date=make_aware(datetime(2016, 1, 1)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('payslip_explain', str(self.employee.company.pk),
+                     '2016', '3', repeat=1, stdout=out)
+        # Two queries and the payment types of the catalogue
+        self.assertIn('PayslipCalculator: 3 queries', out.getvalue())
+        self.assertIn('PayrollRun: 3 queries', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('payslip_explain', str(mixer.blend(
+                'payslip.Company').pk), '2016', '3', stdout=out)
+
+
+class PayslipImportEmployeesTestCase(TestCase):
+    """Tests for the ``payslip_import_employees`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.company = mixer.blend('payslip.Company')
+        self.path = os.path.join(tempfile.mkdtemp(), 'employees.csv')
+        with open(self.path, 'w') as f:
+            f.write('first_name,last_name,email,password,title\n'
+                    'Foo,Bar,foo@example.com,secret,1\n')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('payslip_import_employees', str(self.company.pk),
+                     self.path, workers=0, stdout=out)
+        self.assertIn('Imported 1 employees in', out.getvalue())
+        self.assertEqual(self.company.employees.count(), 1)
+        with self.assertRaisesRegexp(CommandError, 'already exists'):
+            call_command('payslip_import_employees', str(self.company.pk),
+                         self.path, workers=0, stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('payslip_import_employees', '0', self.path,
+                         stdout=out)
+
+
+class PayslipImportPaymentsTestCase(TestCase):
+    """Tests for the ``payslip_import_payments`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        mixer.blend('payslip.PaymentType', name='Bonus')
+        self.path = os.path.join(tempfile.mkdtemp(), 'payments.csv')
+        with open(self.path, 'w') as f:
+            f.write('hr_number,payment_type,amount,date\n'
+                    '42,Bonus,100,2016-03-01\n'
+                    '43,Bonus,100,2016-03-01\n')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('payslip_import_payments',
+                     str(self.employee.company.pk), self.path, stdout=out,
+                     stderr=err)
+        self.assertIn('Created 1 and updated 0 payments', out.getvalue())
+        self.assertIn('Skipped 1 invalid rows.', out.getvalue())
+        self.assertIn('Row 2: There is no employee', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('payslip_import_payments', '0', self.path,
+                         stdout=out)
+
+
+class PayslipSeedTestCase(TestCase):
+    """Tests for the ``payslip_seed`` management command."""
+    longMessage = True
+
+    def test_command(self):
+        out = StringIO()
+        call_command('payslip_seed', '--employees=2', '--years=1',
+                     '--payments=1', '--end-year=2016', stdout=out)
+        self.assertIn('Created 1 companies, 2 employees and 8 payments',
+                      out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('payslip_seed', '--employees=0', stdout=out)
@@ -0,0 +1,197 @@
+"""Tests for the calculation engine of the ``payslip`` app."""
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import make_aware
+
+from dateutil import rrule
+from hypothesis import given, strategies
+from mixer.backend.django import mixer
+
+from .. import engine
+
+
+def aware(*args):
+    return make_aware(datetime(*args))
+
+
+class PayslipCalculatorTestCase(TestCase):
+    """Tests for the ``PayslipCalculator`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee')
+        self.single = mixer.blend('payslip.PaymentType', rrule='')
+        self.monthly = mixer.blend('payslip.PaymentType', rrule='MONTHLY')
+        self.yearly = mixer.blend('payslip.PaymentType', rrule='YEARLY')
+        self.salary = mixer.blend(
+            'payslip.Payment', employee=self.employee,
+            payment_type=self.monthly, amount=1000, date=aware(2015, 6, 1))
+        self.insurance = mixer.blend(
+            'payslip.Payment', employee=self.employee,
+            payment_type=self.monthly, amount=-100, date=aware(2016, 2, 1),
+            end_date=aware(2016, 4, 15))
+        self.bonus = mixer.blend(
+            'payslip.Payment', employee=self.employee,
+            payment_type=self.single, amount=500, date=aware(2016, 3, 10))
+        mixer.blend('payslip.Payment', employee=self.employee,
+                    payment_type=self.single, amount=-50,
+                    date=aware(2016, 1, 10))
+        self.fee = mixer.blend(
+            'payslip.Payment', employee=self.employee,
+            payment_type=self.yearly, amount=300, date=aware(2014, 2, 1))
+        # Payments of other years and employees must not be considered
+        mixer.blend('payslip.Payment', employee=self.employee,
+                    payment_type=self.single, amount=700,
+                    date=aware(2015, 3, 10))
+        mixer.blend('payslip.Payment', payment_type=self.single, amount=900,
+                    date=aware(2016, 3, 10))
+
+    def test_calculate(self):
+        # The third query loads the payment types, because the tests don't
+        # cache the catalogue
+        with self.assertNumQueries(3):
+            result = engine.PayslipCalculator(
+                self.employee, 2016, 3).calculate()
+        with self.assertNumQueries(0, msg=(
+                'Should take the payment types from the catalogue')):
+            for payment in result.payments:
+                payment.payment_type.rrule
+        self.assertEqual(result.employee, self.employee)
+        self.assertEqual(result.date_start, datetime(2016, 3, 1))
+        self.assertEqual(result.date_end, datetime(2016, 3, 31))
+        self.assertEqual(
+            set(result.payments),
+            {self.salary, self.insurance, self.bonus, self.fee},
+            msg=('Should return the recurring payments and the single'
+                 ' payments of the period'))
+        self.assertEqual(result.sum, Decimal('1800'))
+        self.assertEqual(result.sum_neg, Decimal('-100'))
+        self.assertEqual(result.sum_year, Decimal('3800'), msg=(
+            'Should contain three salaries, one bonus and one yearly'
+            ' payment'))
+        self.assertEqual(result.sum_year_neg, Decimal('-250'))
+        self.assertEqual(result.sum_year_net, Decimal('3550'))
+
+    def test_query_joins(self):
+        with CaptureQueriesContext(connection) as queries:
+            engine.PayslipCalculator(self.employee, 2016, 3).calculate()
+        for query in queries:
+            self.assertNotIn('auth_user', query['sql'], msg=(
+                'Should not join the users for the default ordering'))
+
+    def test_calculate_ended_recurring_payment(self):
+        result = engine.PayslipCalculator(self.employee, 2016, 5).calculate()
+        self.assertEqual(set(result.payments), {self.salary, self.fee}, msg=(
+            'Should not contain recurring payments, which ended before the'
+            ' period'))
+        self.assertEqual(result.sum_year_neg, Decimal('-350'))
+
+    def test_time_zone(self):
+        # 23:30 on March 30th in the default time zone is already after the
+        # end of the period in the active time zone
+        employee = mixer.blend('payslip.Employee')
+        payment = mixer.blend(
+            'payslip.Payment', employee=employee, payment_type=self.single,
+            amount=200, date=aware(2016, 3, 30, 23, 30))
+        with timezone.override(timezone.get_fixed_timezone(60)):
+            march = engine.PayslipCalculator(employee, 2016, 3)
+            result = march.calculate()
+            self.assertEqual(result.payments, (payment,), msg=(
+                'Should compare the dates in the default time zone'))
+            self.assertEqual(result, march.calculate_from_payments(
+                march.get_payments_year().select_related('payment_type')),
+                msg='Should calculate the same result from the payments')
+            result = engine.PayslipCalculator(employee, 2016, 4).calculate()
+            self.assertEqual(result.payments, (), msg=(
+                'Should not count the payment in the next month'))
+            self.assertEqual(result.sum_year, 200)
+
+    def test_result_is_immutable(self):
+        result = engine.PayslipCalculator(self.employee, 2016, 3).calculate()
+        with self.assertRaises(AttributeError):
+            result.sum = 0
+
+
+class PayrollRunTestCase(TestCase):
+    """Tests for the ``PayrollRun`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.company = mixer.blend('payslip.Company')
+        self.employees = mixer.cycle(3).blend('payslip.Employee',
+                                              company=self.company)
+        for employee in self.employees:
+            mixer.cycle(2).blend(
+                'payslip.Payment', employee=employee,
+                payment_type__rrule=mixer.sequence('', 'MONTHLY'),
+                date=mixer.sequence(aware(2016, 3, 10), aware(2015, 5, 31)))
+        mixer.blend('payslip.Payment', payment_type__rrule='',
+                    date=aware(2016, 3, 10))
+
+    def test_run(self):
+        # The third query loads the payment types of the catalogue
+        with self.assertNumQueries(3):
+            result = engine.PayrollRun(self.company, 2016, 3).run()
+        self.assertEqual(len(result.payslips), 3)
+        self.assertEqual(result.payment_count, 6)
+        for payslip in result.payslips:
+            expected = engine.PayslipCalculator(
+                payslip.employee, 2016, 3).calculate()
+            self.assertEqual(payslip, expected, msg=(
+                'Should calculate the same payslips as the calculator'))
+
+    def test_get_payments(self):
+        run = engine.PayrollRun(self.company, 2016, 3)
+        sql = str(run.get_payments(engine.PayslipCalculator(
+            None, 2016, 3)).query)
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('payslip_company', sql, msg=(
+            'Should not join the tables of the ordering of the employees'))
+        self.assertNotIn('"payslip_paymenttype"."name"', sql, msg=(
+            'Should not select the payment types'))
+
+    def test_iter_payslips(self):
+        run = engine.PayrollRun(self.company, 2016, 3)
+        with self.assertNumQueries(3):
+            payslips = list(run.iter_payslips(chunk_size=1))
+        self.assertEqual(
+            payslips,
+            sorted(run.run().payslips, key=lambda x: x.employee.pk), msg=(
+                'Should yield the same payslips as run ordered by employee'))
+
+
+class CountOccurrencesTestCase(SimpleTestCase):
+    """Tests for the ``count_occurrences`` function."""
+    longMessage = True
+
+    def test_skipped_days(self):
+        self.assertEqual(engine.count_occurrences(
+            'MONTHLY', datetime(2016, 1, 31), datetime(2016, 12, 31)), 7,
+            msg=('Should skip the months without a 31st like dateutil'
+                 ' does'))
+        self.assertEqual(engine.count_occurrences(
+            'YEARLY', datetime(2000, 2, 29), datetime(2016, 2, 29)), 5,
+            msg='Should only count leap years')
+
+    def test_until(self):
+        self.assertEqual(engine.count_occurrences(
+            'MONTHLY', datetime(2016, 1, 15, 12), datetime(2016, 3, 15)), 2,
+            msg='Should not count an occurrence later on the last day')
+        self.assertEqual(engine.count_occurrences(
+            'MONTHLY', datetime(2016, 3, 1), datetime(2016, 2, 1)), 0)
+
+    @given(freq=strategies.sampled_from(['MONTHLY', 'YEARLY']),
+           start=strategies.datetimes(min_value=datetime(1990, 1, 1),
+                                      max_value=datetime(2040, 12, 31)),
+           until=strategies.datetimes(min_value=datetime(1990, 1, 1),
+                                      max_value=datetime(2040, 12, 31)))
+    def test_parity_with_dateutil(self, freq, start, until):
+        self.assertEqual(
+            engine.count_occurrences(freq, start, until),
+            rrule.rrule(rrule._rrulestr._freq_map[freq], dtstart=start,
+                        until=until).count())
@@ -0,0 +1,62 @@
+"""Tests for the streaming exports of the ``payslip`` app."""
+import json
+from datetime import date, datetime
+
+from django.test import TestCase
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from .. import exports
+
+
+class ExportsTestCase(TestCase):
+    """Tests for the functions of the ``exports`` module."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        self.company = self.employee.company
+        mixer.blend('payslip.Payment', employee=self.employee, amount=100,
+                    payment_type__name='Salary',
+                    payment_type__rrule='MONTHLY',
+                    date=make_aware(datetime(2016, 1, 1)))
+        mixer.blend('payslip.Payment', employee=self.employee, amount=-30,
+                    payment_type__name='Fine', payment_type__rrule='',
+                    date=make_aware(datetime(2016, 2, 10)))
+        mixer.blend('payslip.Employee', company=self.company)
+
+    def test_iter_months(self):
+        self.assertEqual(list(exports.iter_months((2015, 11), (2016, 2))), [
+            (2015, 11), (2015, 12), (2016, 1), (2016, 2)])
+
+    def test_iter_journal(self):
+        rows = list(exports.iter_journal(self.company, (2016, 1), (2016, 2)))
+        payments = [(row['month'], row['payment_type'], row['amount'])
+                    for row in rows if row['kind'] == 'payment']
+        self.assertEqual(payments, [
+            (1, 'Salary', 100), (2, 'Fine', -30), (2, 'Salary', 100)], msg=(
+                'Should repeat the recurring payments every month'))
+        self.assertEqual(rows[1], {
+            'kind': 'total', 'year': 2016, 'month': 1, 'hr_number': 42,
+            'employee': str(self.employee), 'amount': 100, 'earnings': 100,
+            'deductions': 0})
+        self.assertEqual(rows[0]['date'], date(2016, 1, 1))
+        self.assertEqual(len([row for row in rows if row['kind'] == 'total']),
+                         5, msg='Should add totals per employee and month')
+        self.assertEqual(rows[-1], {
+            'kind': 'total', 'amount': 170, 'earnings': 200,
+            'deductions': -30})
+
+    def test_iter_journal_export(self):
+        content = ''.join(exports.iter_journal_export(
+            self.company, (2016, 1), (2016, 1), 'csv'))
+        lines = content.splitlines()
+        self.assertEqual(lines[0], ','.join(exports.JOURNAL_FIELDS))
+        self.assertEqual(lines[1], 'payment,2016,1,42,{0},Salary,2016-01-01,'
+                         ',100.00,,'.format(self.employee))
+        lines = ''.join(exports.iter_journal_export(
+            self.company, (2016, 1), (2016, 1), 'jsonl')).splitlines()
+        self.assertEqual(json.loads(lines[-1]), {
+            'kind': 'total', 'amount': '100.00', 'earnings': '100.00',
+            'deductions': '0.00'})
@@ -1,9 +1,12 @@
 """Tests for the forms of the ``payslip`` app."""
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from mixer.backend.django import mixer
 
 from .. import forms
+from ..models import ExtraFieldType
 
 
 class EmployeeFormTestCase(TestCase):
@@ -22,7 +25,9 @@ class EmployeeFormTestCase(TestCase):
         }
         form = forms.EmployeeForm(company=manager.company, data=data)
         self.assertFalse(form.errors)
-        form.save()
+        employee = form.save()
+        self.assertEqual(employee.user.username, 'test@example.com', msg=(
+            'Should use the email as username'))
         form = forms.EmployeeForm(company=manager.company, data=data)
         self.assertFalse(form.is_valid())
         data.update({'password': 'test_fail', 'email': 'test2@example.com'})
@@ -34,3 +39,91 @@ class EmployeeFormTestCase(TestCase):
         self.user.username = forms.generate_username(self.user.email)
         self.user.save()
         self.assertIsNotNone(forms.generate_username(self.user.email))
+
+    def test_generate_username_taken(self):
+        email = 'test@example.com'
+        for index in range(forms.USERNAME_CANDIDATES + 2):
+            mixer.blend('auth.User', username=forms.get_md5_hexdigest(
+                '{0}{1}'.format(email, 'a' * index)))
+        with self.assertNumQueries(2, msg=(
+                'Should check the candidates in batches')):
+            username = forms.generate_username(email)
+        self.assertEqual(username, forms.get_md5_hexdigest(
+            '{0}{1}'.format(email, 'a' * (forms.USERNAME_CANDIDATES + 2))))
+        self.assertEqual(
+            forms.generate_username('foo@example.com', exclude=[
+                forms.get_md5_hexdigest('foo@example.com')]),
+            forms.get_md5_hexdigest('foo@example.coma'), msg=(
+                'Should skip excluded usernames'))
+
+
+class PaymentFormTestCase(TestCase):
+    """Tests for the ``PaymentForm`` model form."""
+    longMessage = True
+
+    def setUp(self):
+        self.payment = mixer.blend('payslip.Payment')
+        self.fixed_type = mixer.blend('payslip.ExtraFieldType', name='Fixed',
+                                      model='Payment', fixed_values=True)
+        self.fixed_values = mixer.cycle(2).blend(
+            'payslip.ExtraField', field_type=self.fixed_type,
+            value=mixer.sequence('A', 'B'))
+        self.free_type = mixer.blend('payslip.ExtraFieldType', name='Free',
+                                     model=None, fixed_values=False)
+
+    def get_data(self, **kwargs):
+        data = {
+            'payment_type': self.payment.payment_type.pk,
+            'employee': self.payment.employee.pk,
+            'amount': '100',
+            'date': '2016-03-01 00:00:00',
+        }
+        data.update(kwargs)
+        return data
+
+    def save(self, **kwargs):
+        form = forms.PaymentForm(instance=self.payment, initial={},
+                                 data=self.get_data(**kwargs))
+        self.assertFalse(form.errors)
+        return form.save()
+
+    def test_form(self):
+        self.save(Fixed='A', Free='foo')
+        self.assertEqual(
+            sorted(self.payment.extra_fields.values_list('value', flat=True)),
+            ['A', 'foo'])
+        form = forms.PaymentForm(instance=self.payment, initial={})
+        self.assertEqual(form.initial['Fixed'], 'A')
+        self.assertEqual(form.initial['Free'], 'foo')
+        self.assertEqual(
+            sorted(form.fields['Fixed'].choices),
+            [('', '-----'), ('A', 'A'), ('B', 'B')])
+
+        self.save(Fixed='B', Free='bar')
+        self.assertEqual(
+            sorted(self.payment.extra_fields.values_list('value', flat=True)),
+            ['B', 'bar'], msg=(
+                'Should exchange the fixed value and change the free value'))
+        self.assertEqual(self.fixed_type.extra_fields.count(), 2, msg=(
+            'Should not change the shared fixed values'))
+
+    def get_query_count(self, value):
+        """Returns the queries needed to set all free values to ``value``."""
+        data = dict((field_type.name, value) for field_type in
+                    ExtraFieldType.objects.filter(fixed_values=False))
+        self.save(Fixed='A', **data)
+        with CaptureQueriesContext(connection) as queries:
+            forms.PaymentForm(instance=self.payment, initial={}).initial
+            self.save(Fixed='B', **dict(
+                (name, value + 'changed') for name in data))
+        return len(queries)
+
+    def test_query_count(self):
+        count = self.get_query_count('foo')
+        mixer.cycle(5).blend('payslip.ExtraFieldType', model='Payment',
+                             fixed_values=False)
+        mixer.cycle(5).blend('payslip.ExtraField',
+                             field_type__model='Payment',
+                             field_type__fixed_values=True)
+        self.assertEqual(self.get_query_count('bar'), count, msg=(
+            'Should not need more queries for more extra field types'))
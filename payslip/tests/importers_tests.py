@@ -0,0 +1,217 @@
+"""Tests for the bulk imports of the ``payslip`` app."""
+import json
+from io import BytesIO
+
+from django.contrib.auth.hashers import check_password
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from mixer.backend.django import mixer
+
+from .. import importers
+from ..models import Employee, ExtraField, Payment
+
+
+class ImportersTestCase(TestCase):
+    """Tests for the functions of the ``importers`` module."""
+    longMessage = True
+
+    def setUp(self):
+        self.company = mixer.blend('payslip.Company')
+        self.tax_class = mixer.blend('payslip.ExtraFieldType',
+                                     name='Tax class', model='Employee',
+                                     fixed_values=True)
+        self.tax_class_1 = mixer.blend('payslip.ExtraField',
+                                       field_type=self.tax_class, value='1')
+        self.nickname = mixer.blend('payslip.ExtraFieldType',
+                                    name='Nickname', model='Employee',
+                                    fixed_values=False)
+        self.rows = [{
+            'first_name': 'Foo',
+            'last_name': 'Bar',
+            'email': 'foo@example.com',
+            'password': 'secret',
+            'hr_number': '1',
+            'title': '1',
+            'Tax class': '1',
+            'Nickname': 'Foobar',
+        }, {
+            'first_name': 'Baz',
+            'last_name': 'Qux',
+            'email': 'baz@example.com',
+            'password': 'secret2',
+            'title': '3',
+            'is_manager': 'true',
+        }]
+
+    def test_read_rows(self):
+        self.assertEqual(importers.get_format('employees.CSV'), 'csv')
+        self.assertIsNone(importers.get_format('employees.txt'))
+        rows = importers.read_rows(BytesIO(
+            b'first_name,email\nFoo,foo@example.com\n'), 'csv')
+        self.assertEqual(rows, [{'first_name': 'Foo',
+                                 'email': 'foo@example.com'}])
+        rows = importers.read_rows(BytesIO(json.dumps(self.rows).encode(
+            'utf-8')), 'json')
+        self.assertEqual(rows, self.rows)
+        with self.assertRaises(ValidationError):
+            importers.read_rows(BytesIO(b'{}'), 'json')
+        with self.assertRaisesMessage(ValidationError,
+                                      'Line 2 is not encoded as UTF-8.'):
+            importers.read_rows(BytesIO(
+                u'first_name\nJ\xfcrgen\n'.encode('latin-1')), 'csv')
+        with self.assertRaisesMessage(ValidationError,
+                                      'Line 2 is not encoded as UTF-8.'):
+            importers.read_rows(BytesIO(
+                u'[\n{"first_name": "J\xfcrgen"}]'.encode('cp1252')), 'json')
+        with self.assertRaisesMessage(ValidationError, 'Line 2: '):
+            importers.read_rows(BytesIO(b'first_name\nFoo\0\n'), 'csv')
+
+    def test_clean_employee_rows(self):
+        mixer.blend('auth.User', email='Baz@example.com')
+        mixer.blend('payslip.Employee', company=self.company, hr_number=7)
+        rows = self.rows + [
+            dict(self.rows[0], **{'Tax class': '2'}),
+            dict(self.rows[0], email='new@example.com', hr_number='2', **{
+                'Tax class': '2', 'Unknown': 'x'}),
+            dict(self.rows[0], email='new2@example.com'),
+            dict(self.rows[1], email='new3@example.com', hr_number='7'),
+            {'email': 'invalid'},
+        ]
+        with self.assertRaises(ValidationError) as cm:
+            importers.clean_employee_rows(rows, self.company)
+        messages = cm.exception.messages
+        self.assertEqual(messages[:6], [
+            'Row 2: A user with that email already exists.',
+            'Row 3: The email is already used in row 1.',
+            'Row 4: Unknown column "Unknown".',
+            'Row 4: "2" is not a valid choice for Tax class.',
+            'Row 5: The HR number is already used in row 1.',
+            'Row 6: An employee with the HR number 7 already exists.',
+        ])
+        self.assertTrue(all(message.startswith('Row 7: ')
+                            for message in messages[6:]))
+
+    def test_import_employees(self):
+        with self.assertNumQueries(20, msg=(
+                'Should validate and insert the rows in bulk')):
+            result = importers.import_employees(
+                self.company, self.rows, chunk_size=1, workers=0)
+        self.assertEqual(result.count, 2)
+        employee = Employee.objects.get(user__email='foo@example.com')
+        self.assertEqual(employee.company, self.company)
+        self.assertEqual(employee.hr_number, 1)
+        self.assertTrue(check_password('secret', employee.user.password))
+        self.assertEqual(
+            sorted(employee.extra_fields.values_list('field_type', 'value')),
+            [(self.tax_class.pk, '1'), (self.nickname.pk, 'Foobar')])
+        self.assertIn(self.tax_class_1, employee.extra_fields.all(), msg=(
+            'Should share the fixed values'))
+        employee = Employee.objects.get(user__email='baz@example.com')
+        self.assertTrue(employee.is_manager)
+        self.assertFalse(employee.extra_fields.exists())
+
+    def test_import_employees_workers(self):
+        result = importers.import_employees(self.company, self.rows,
+                                            workers=1)
+        self.assertEqual(result.count, 2)
+        self.assertTrue(check_password(
+            'secret2', Employee.objects.get(
+                user__email='baz@example.com').user.password), msg=(
+                    'Should hash the passwords in the pool'))
+
+
+class PaymentImporterTestCase(TestCase):
+    """Tests for the ``PaymentImporter`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        self.company = self.employee.company
+        self.bonus = mixer.blend('payslip.PaymentType', name='Bonus')
+        self.cost_centre = mixer.blend(
+            'payslip.ExtraFieldType', name='Cost centre', model='Payment',
+            fixed_values=True)
+        self.cost_centres = [
+            mixer.blend('payslip.ExtraField', field_type=self.cost_centre,
+                        value=value) for value in ('A', 'B')]
+        self.note = mixer.blend('payslip.ExtraFieldType', name='Note',
+                                model='Payment', fixed_values=False)
+        self.header = ('hr_number,payment_type,amount,date,end_date,'
+                       'description,Cost centre,Note\n')
+
+    def run_import(self, content, **kwargs):
+        return importers.import_payments(
+            self.company, BytesIO(content.encode('utf-8')), **kwargs)
+
+    def get_extra_fields(self, payment):
+        return sorted(payment.extra_fields.values_list('field_type', 'value'))
+
+    def test_import_payments(self):
+        result = self.run_import(
+            self.header +
+            '42,Bonus,100.00,2016-03-01,,March,A,Late\n' +
+            '42,Bonus,50,2016-04-01,,April,,\n' +
+            '43,Bonus,10,2016-03-01,,,,\n' +
+            '42,Overtime,10,2016-03-01,,,C,\n' +
+            '42,Bonus,abc,2016-03-01,,,,\n', chunk_size=2)
+        self.assertEqual(result[:4], (5, 2, 0, 3))
+        self.assertEqual(result.errors, [
+            'Row 3: There is no employee with the HR number 43.',
+            'Row 4: There is no payment type "Overtime".',
+            'Row 4: "C" is not a valid choice for Cost centre.',
+            'Row 5: amount: Enter a number.',
+        ])
+        payment = Payment.objects.get(description='March')
+        self.assertEqual(payment.employee, self.employee)
+        self.assertEqual(payment.amount, 100)
+        self.assertEqual(payment.start_period, 2016 * 12 + 3, msg=(
+            'Should set the period keys'))
+        self.assertEqual(self.get_extra_fields(payment), [
+            (self.cost_centre.pk, 'A'), (self.note.pk, 'Late')])
+
+        extra_field_count = ExtraField.objects.count()
+        result = self.run_import(
+            self.header +
+            '42,Bonus,100.00,2016-03-01,,March,A,Late\n' +
+            '42,Bonus,55,2016-04-01,,April,B,Early\n' +
+            '42,Bonus,60,2016-03-01,,March,B,Very late\n')
+        self.assertEqual(result[:4], (3, 0, 2, 0), msg=(
+            'Should update the payments of a reimport'))
+        self.assertEqual(Payment.objects.count(), 2)
+        payment = Payment.objects.get(pk=payment.pk)
+        self.assertEqual(payment.amount, 60, msg=(
+            'The last row of a payment should win'))
+        self.assertEqual(self.get_extra_fields(payment), [
+            (self.cost_centre.pk, 'B'), (self.note.pk, 'Very late')])
+        self.assertEqual(self.get_extra_fields(Payment.objects.get(
+            description='April')), [
+                (self.cost_centre.pk, 'B'), (self.note.pk, 'Early')])
+        self.assertEqual(ExtraField.objects.count(), extra_field_count + 1,
+                         msg='Should share the fixed values')
+
+        result = self.run_import(
+            self.header + '42,Bonus,60,2016-03-01,,March,B,Very late\n')
+        self.assertEqual(result[:4], (1, 0, 0, 0), msg=(
+            'Should not write unchanged payments'))
+
+        with self.assertRaises(ValidationError):
+            self.run_import('hr_number,foo\n42,1\n')
+
+    def test_invalid_file(self):
+        content = (self.header + '42,Bonus,100,2016-03-01\n' +
+                   u'42,Bonus,50,2016-04-01,,B\xfcro\n').encode('latin-1')
+        with self.assertRaisesMessage(ValidationError,
+                                      'Line 3 is not encoded as UTF-8.'):
+            importers.import_payments(self.company, BytesIO(content),
+                                      chunk_size=1)
+        self.assertFalse(Payment.objects.exists(), msg=(
+            'Should not import the chunks before the error'))
+
+    def test_ambiguous_hr_number(self):
+        mixer.blend('payslip.Employee', company=self.company, hr_number=42)
+        result = self.run_import(self.header + '42,Bonus,100,2016-03-01\n')
+        self.assertEqual(result.errors, [
+            'Row 1: The HR number 42 is ambiguous.'])
+        self.assertFalse(Payment.objects.exists(), msg=(
+            'Should not guess the employee of a shared HR number'))
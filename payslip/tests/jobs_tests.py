@@ -0,0 +1,86 @@
+"""Tests for the background jobs of the ``payslip`` app."""
+import zipfile
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from .. import app_settings, jobs
+from ..models import PayslipJob
+
+
+class JobsTestCase(TestCase):
+    """Tests for the functions of the ``jobs`` module."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        mixer.blend('payslip.Payment', employee=self.employee,
+                    payment_type__rrule='MONTHLY',
+                    date=make_aware(datetime(2016, 1, 1)))
+
+    def test_claim_job(self):
+        self.assertIsNone(jobs.claim_job('test'))
+        first = jobs.enqueue_job(self.employee.company, 2016, 3)
+        second = jobs.enqueue_job(self.employee.company, 2016, 4)
+        job = jobs.claim_job('test')
+        self.assertEqual(job, first, msg='Should claim the oldest job')
+        self.assertEqual(job.status, PayslipJob.RUNNING)
+        self.assertEqual(job.worker, 'test')
+        self.assertEqual(jobs.claim_job('test'), second, msg=(
+            'Should not claim a job twice'))
+        self.assertIsNone(jobs.claim_job('test'))
+
+    def test_claim_stale_job(self):
+        job = jobs.enqueue_job(self.employee.company, 2016, 3)
+        dead = jobs.claim_job('dead')
+        self.assertIsNone(jobs.claim_job('test'), msg=(
+            'Should not claim a job, which was claimed recently'))
+
+        PayslipJob.objects.filter(pk=job.pk).update(
+            started=timezone.now() - timedelta(hours=2))
+        timeout = app_settings.JOB_TIMEOUT
+        app_settings.JOB_TIMEOUT = None
+        try:
+            self.assertIsNone(jobs.claim_job('test'), msg=(
+                'Should not claim running jobs without a timeout'))
+        finally:
+            app_settings.JOB_TIMEOUT = timeout
+        job = jobs.claim_job('test')
+        self.assertEqual(job, dead, msg=(
+            'Should claim a job, whose worker did not finish in time'))
+        self.assertEqual(job.worker, 'test')
+
+        jobs.run_job(dead)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PayslipJob.RUNNING, msg=(
+            'Should discard the result of the worker, which lost the job'))
+        jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PayslipJob.DONE, msg=job.error)
+
+    def test_run_job(self):
+        jobs.enqueue_job(self.employee.company, 2016, 3,
+                         employee=self.employee)
+        job = jobs.run_job(jobs.claim_job())
+        self.assertEqual(job.status, PayslipJob.DONE, msg=job.error)
+        self.assertEqual(job.filename,
+                         '42-{0}_2016_03.pdf'.format(self.employee.pk))
+        self.assertTrue(job.result)
+
+        jobs.enqueue_job(self.employee.company, 2016, 3)
+        job = jobs.run_job(jobs.claim_job())
+        self.assertEqual(job.status, PayslipJob.DONE, msg=job.error)
+        self.assertEqual(
+            zipfile.ZipFile(BytesIO(bytes(job.result))).namelist(),
+            ['42-{0}_2016_03.pdf'.format(self.employee.pk)])
+
+        jobs.enqueue_job(self.employee.company, 2016, 13)
+        job = jobs.run_job(jobs.claim_job())
+        self.assertEqual(job.status, PayslipJob.FAILED, msg=(
+            'Should store the error of a failed job'))
+        self.assertIn('Traceback', job.error)
@@ -1,6 +1,9 @@
 """Tests for the models of the ``payslip`` app."""
+from datetime import datetime
+
 from django.test import TestCase
-from django.utils.timezone import now
+from django.utils import timezone
+from django.utils.timezone import make_aware, now
 
 from mixer.backend.django import mixer
 
@@ -15,6 +18,34 @@ class PaymentTestCase(TestCase):
     def test_model(self):
         self.assertTrue(str(self.payment))
 
+    def test_save(self):
+        self.payment.date = make_aware(datetime(2016, 3, 31, 23, 30))
+        self.payment.end_date = None
+        self.payment.save()
+        self.assertEqual(self.payment.start_period, 2016 * 12 + 3, msg=(
+            'Should store the month of the date in the local time zone'))
+        self.assertIsNone(self.payment.end_period)
+        self.payment.end_date = make_aware(datetime(2017, 1, 1))
+        self.payment.save()
+        self.assertEqual(self.payment.end_period, 2017 * 12 + 1)
+
+    def test_save_time_zone(self):
+        self.payment.date = make_aware(datetime(2016, 3, 31, 23, 30))
+        # It is already April in UTC, the time zone of the user
+        with timezone.override(timezone.utc):
+            self.payment.save()
+        self.assertEqual(self.payment.start_period, 2016 * 12 + 3, msg=(
+            'Should not depend on the active time zone'))
+
     def test_get_end_date_without_tz(self):
         self.assertIsNone(self.payment.get_end_date_without_tz().tzinfo, msg=(
             'Should return the end date without timezone attribute'))
+
+
+class PayslipJobTestCase(TestCase):
+    """Tests for the ``PayslipJob`` model."""
+    longMessage = True
+
+    def test_model(self):
+        job = mixer.blend('payslip.PayslipJob', year=2016, month=3)
+        self.assertTrue(str(job))
@@ -0,0 +1,55 @@
+"""Tests for the profiling of the ``payslip`` app."""
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+
+from mixer.backend.django import mixer
+
+from .. import app_settings, profiling
+
+
+class ProfilingTestCase(TestCase):
+    """Tests for the functions of the ``profiling`` module."""
+    longMessage = True
+
+    def setUp(self):
+        self.request = RequestFactory().get('/', {'_profile': 1,
+                                                  '_sort': 'tottime'})
+        self.request.user = mixer.blend('auth.User', is_staff=True)
+        app_settings.PROFILING = True
+
+    def tearDown(self):
+        app_settings.PROFILING = False
+        app_settings.PROFILING_DIR = None
+
+    def test_is_profiling(self):
+        self.assertTrue(profiling.is_profiling(self.request))
+        self.request.user = AnonymousUser()
+        self.assertFalse(profiling.is_profiling(self.request), msg=(
+            'Should only profile requests of staff users'))
+
+    def test_profile(self):
+        result, stats, queries, duration = profiling.profile(
+            mixer.blend, 'payslip.Company')
+        self.assertEqual(result.__class__.__name__, 'Company')
+        self.assertIsInstance(stats, pstats.Stats)
+        self.assertTrue(queries, msg='Should capture the queries')
+        report = profiling.get_report(self.request, stats, queries, duration)
+        self.assertIn('{0} queries in'.format(len(queries)), report)
+        self.assertIn('Ordered by: internal time', report, msg=(
+            'Should sort the statistics by the given key'))
+
+    def test_store_stats(self):
+        stats = profiling.profile(len, [])[1]
+        self.assertIsNone(profiling.store_stats(stats))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        app_settings.PROFILING_DIR = os.path.join(directory, 'profiles')
+        path = profiling.store_stats(stats)
+        self.assertTrue(path.endswith('.prof'))
+        self.assertIsInstance(pstats.Stats(path), pstats.Stats, msg=(
+            'Should store the statistics in the format of pstats'))
@@ -0,0 +1,198 @@
+"""Query budgets of the views of the ``payslip`` app."""
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from .. import urls
+
+#: Number of queries of every request as ``{label: budget}``. The label is
+#: the name of the URL, the method and the variant of the request. Every
+#: view needs a budget and must not need more queries for more objects.
+#: Lower a budget, if a change saves queries.
+QUERY_BUDGETS = {
+    'payslip_archive': 4,
+    'payslip_archive post': 10,
+    'payslip_company_create': 3,
+    'payslip_company_delete': 5,
+    'payslip_company_update': 7,
+    'payslip_dashboard': 14,
+    'payslip_employee_create': 5,
+    'payslip_employee_create post': 15,
+    'payslip_employee_delete': 5,
+    'payslip_employee_update': 8,
+    'payslip_employee_update post': 16,
+    'payslip_extra_field_create': 3,
+    'payslip_extra_field_delete': 4,
+    'payslip_extra_field_type_create': 2,
+    'payslip_extra_field_type_delete': 3,
+    'payslip_extra_field_type_update': 3,
+    'payslip_extra_field_update': 5,
+    'payslip_generator': 4,
+    'payslip_generator post': 12,
+    'payslip_generator post download': 12,
+    'payslip_job': 5,
+    'payslip_journal_export': 4,
+    'payslip_journal_export post': 7,
+    'payslip_payment_create': 7,
+    'payslip_payment_create post': 15,
+    'payslip_payment_delete': 7,
+    'payslip_payment_import': 3,
+    'payslip_payment_import post': 10,
+    'payslip_payment_type_create': 3,
+    'payslip_payment_type_delete': 4,
+    'payslip_payment_type_update': 4,
+    'payslip_payment_update': 12,
+    'payslip_payment_update post': 15,
+    'payslip_payroll_run': 4,
+    'payslip_payroll_run post': 8,
+}
+
+#: Number of objects per model, which are added for every step.
+STEPS = (1, 10)
+
+
+class QueryBudgetTestCase(TestCase):
+    """Tests the query budgets of all views with growing fixtures."""
+    longMessage = True
+
+    def setUp(self):
+        self.manager = mixer.blend('payslip.Employee', is_manager=True,
+                                   user__is_staff=True)
+        self.company = self.manager.company
+        self.fixed_field = mixer.blend('payslip.ExtraField',
+                                       field_type__fixed_values=True,
+                                       field_type__model=None)
+        self.fixed_type = self.fixed_field.field_type
+        self.employee_type = mixer.blend('payslip.ExtraFieldType',
+                                         fixed_values=False, model='Employee')
+        self.payment_type = mixer.blend('payslip.PaymentType', name='Bonus',
+                                        rrule='MONTHLY')
+        self.job = mixer.blend('payslip.PayslipJob', company=self.company,
+                               employee=None, year=2016, month=3)
+        self.client.force_login(self.manager.user)
+        self.calls = 0
+
+    def populate(self, size):
+        """Adds ``size`` objects of every model."""
+        mixer.cycle(size).blend('payslip.Company')
+        mixer.cycle(size).blend('payslip.PaymentType')
+        mixer.cycle(size).blend('payslip.ExtraField',
+                                field_type=self.fixed_type)
+        employees = mixer.cycle(size).blend('payslip.Employee',
+                                            company=self.company)
+        for employee in employees + [self.manager]:
+            employee.extra_fields.add(self.fixed_field, mixer.blend(
+                'payslip.ExtraField', field_type=self.employee_type))
+            payments = mixer.cycle(size).blend(
+                'payslip.Payment', employee=employee,
+                payment_type=self.payment_type,
+                date=make_aware(datetime(2016, 3, 1)))
+            for payment in payments:
+                payment.extra_fields.add(self.fixed_field)
+        self.payment = payments[0]
+
+    def get_requests(self):
+        """Returns the requests as ``(label, method, path, data)``."""
+        self.calls += 1
+        period = {'company': self.company.pk, 'year': 2016, 'month': 3}
+        employee = {
+            'first_name': 'Foo',
+            'last_name': 'Bar',
+            'email': 'foo{0}@example.com'.format(self.calls),
+            'password': 'test',
+            'retype_password': 'test',
+            'title': '1',
+            self.fixed_type.name: self.fixed_field.value,
+            self.employee_type.name: 'Value {0}'.format(self.calls),
+        }
+        payment = {
+            'payment_type': self.payment_type.pk,
+            'employee': self.manager.pk,
+            'amount': 100,
+            'date': '2016-03-01 00:00:00',
+            self.fixed_type.name: self.fixed_field.value,
+        }
+        upload = SimpleUploadedFile(
+            'payments.csv', 'hr_number,payment_type,amount,date\n{0},Bonus,'
+            '100,2016-03-01\n'.format(self.manager.hr_number).encode('utf-8'))
+        objects = {
+            'company': self.company,
+            'employee': self.manager,
+            'extra_field': self.fixed_field,
+            'extra_field_type': self.fixed_type,
+            'payment': self.payment,
+            'payment_type': self.payment_type,
+            'job': self.job,
+        }
+        requests = []
+        for pattern in urls.urlpatterns:
+            kwargs = {}
+            if '<pk>' in pattern.regex.pattern:
+                name = pattern.name[len('payslip_'):].rsplit('_', 1)[0]
+                kwargs['pk'] = objects[name].pk
+            requests.append((pattern.name, 'get', reverse(
+                pattern.name, kwargs=kwargs), None))
+        requests += [
+            ('payslip_employee_create post', 'post',
+             reverse('payslip_employee_create'), employee),
+            ('payslip_employee_update post', 'post',
+             reverse('payslip_employee_update', kwargs={
+                 'pk': self.manager.pk}),
+             dict(employee, email='m@e.com', is_manager='on')),
+            ('payslip_payment_create post', 'post',
+             reverse('payslip_payment_create'), payment),
+            ('payslip_payment_update post', 'post',
+             reverse('payslip_payment_update', kwargs={
+                 'pk': self.payment.pk}), payment),
+            ('payslip_payment_import post', 'post',
+             reverse('payslip_payment_import'), {
+                 'company': self.company.pk, 'file': upload}),
+            ('payslip_generator post', 'post', reverse('payslip_generator'),
+             dict(period, employee=self.manager.pk)),
+            ('payslip_generator post download', 'post',
+             reverse('payslip_generator'),
+             dict(period, employee=self.manager.pk, download=1)),
+            ('payslip_payroll_run post', 'post',
+             reverse('payslip_payroll_run'), period),
+            ('payslip_journal_export post', 'post',
+             reverse('payslip_journal_export'),
+             dict(period, end_year=2016, end_month=3, format='csv')),
+            ('payslip_archive post', 'post', reverse('payslip_archive'),
+             period),
+        ]
+        return requests
+
+    def count_queries(self):
+        """Returns the number of queries of every request."""
+        counts = {}
+        for label, method, path, data in self.get_requests():
+            # Measure the renderings, not the hits of the payslip cache
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(path, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, msg=label)
+            counts[label] = len(queries)
+        return counts
+
+    def test_query_budgets(self):
+        counts = []
+        for size in STEPS:
+            self.populate(size)
+            counts.append(self.count_queries())
+        for label, count in counts[0].items():
+            self.assertIn(label, QUERY_BUDGETS, msg=(
+                'Every view needs a query budget'))
+            self.assertEqual(count, QUERY_BUDGETS[label], msg=label)
+            self.assertEqual(counts[-1][label], count, msg=(
+                '{0} should not need more queries for more objects'.format(
+                    label)))
@@ -0,0 +1,174 @@
+"""Tests for the PDF rendering of the ``payslip`` app."""
+import os
+import signal
+import time
+import zipfile
+from datetime import datetime
+from io import BytesIO
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import six
+from django.utils import translation
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from .. import rendering
+from ..engine import PayslipCalculator
+from ..models import Employee
+
+
+class RenderingTestCase(TestCase):
+    """Tests for the PDF rendering functions."""
+    longMessage = True
+
+    def tearDown(self):
+        rendering.shutdown_executor()
+
+    def test_get_executor(self):
+        executor = rendering.get_executor()
+        self.assertIsNotNone(executor)
+        self.assertEqual(rendering.get_executor(), executor, msg=(
+            'Should reuse the process pool'))
+        rendering.shutdown_executor()
+        self.assertNotEqual(rendering.get_executor(), executor, msg=(
+            'Should start a new process pool after a shutdown'))
+
+    def test_render_pdf(self):
+        pdf = rendering.render_pdf('<p>Foo</p>')
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_rendering_in_process(self):
+        with rendering.rendering_in_process():
+            pdf = rendering.render_pdf('<p>Foo</p>')
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertIsNone(rendering._executor, msg=(
+            'Should not start the process pool'))
+
+    @skipIf(six.PY2, 'The pools of Python 2 do not detect dead workers')
+    def test_broken_pool(self):
+        executor = rendering.get_executor()
+        executor.submit(os.getpid).result()
+        for pid in list(executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        # The pool notices the dead workers in the background
+        for attempt in range(100):
+            if executor._broken:
+                break
+            time.sleep(0.05)
+        pdf = rendering.render_pdf('<p>Foo</p>')
+        self.assertTrue(pdf.startswith(b'%PDF'), msg=(
+            'Should render with a new pool, once a worker died'))
+        self.assertNotEqual(rendering.get_executor(), executor)
+
+
+class GetPayslipContextTestCase(TestCase):
+    """Tests for the ``get_payslip_context`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.employee = mixer.blend('payslip.Employee')
+        self.field_types = mixer.cycle(3).blend('payslip.ExtraFieldType',
+                                                model='Payment')
+
+    def add_payments(self, count):
+        for payment in mixer.cycle(count).blend(
+                'payslip.Payment', employee=self.employee,
+                payment_type__rrule='MONTHLY',
+                date=make_aware(datetime(2016, 1, 1))):
+            for field_type in self.field_types:
+                payment.extra_fields.add(mixer.blend(
+                    'payslip.ExtraField', field_type=field_type))
+
+    def get_query_count(self):
+        cache.clear()
+        # Every request loads the employee again
+        employee = Employee.objects.get(pk=self.employee.pk)
+        result = PayslipCalculator(employee, 2016, 3).calculate()
+        with CaptureQueriesContext(connection) as queries:
+            rendering.get_payslip_context(result)
+        return len(queries)
+
+    def test_query_count(self):
+        self.add_payments(1)
+        count = self.get_query_count()
+        self.add_payments(9)
+        self.assertEqual(self.get_query_count(), count, msg=(
+            'Should render the extra fields of all payments with a fixed'
+            ' number of queries'))
+
+    def test_languages(self):
+        self.add_payments(1)
+        cache.clear()
+        result = PayslipCalculator(self.employee, 2016, 3).calculate()
+        with translation.override('en'):
+            english = rendering.get_payslip_context(result)['payslip_content']
+        with translation.override('de'):
+            german = rendering.get_payslip_context(result)['payslip_content']
+        self.assertIn('March', english)
+        self.assertIn(u'M\xe4rz', german, msg=(
+            'Should not serve the cached payslip of another language'))
+
+
+class RenderContextTestCase(TestCase):
+    """Tests for the ``RenderContext`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.context = rendering.RenderContext()
+
+    def test_fetch_url(self):
+        resp = self.context.fetch_url(
+            'http://payslip.invalid/static/payslip/js/payslip.js')
+        self.assertEqual(resp['string'],
+                         self.context.assets['payslip/js/payslip.js'])
+        self.assertEqual(self.context.fetch_url(
+            'http://payslip.invalid/static/payslip/css/payslip.css')[
+                'string'], b'', msg=(
+            'Should not serve the stylesheet, which is applied already'))
+        with self.assertRaises(ValueError):
+            self.context.fetch_url('https://example.com/payslip.js')
+
+    def test_reload_render_context(self):
+        context = rendering.get_render_context()
+        self.assertEqual(rendering.get_render_context(), context)
+        rendering.reload_render_context()
+        self.assertNotEqual(rendering.get_render_context(), context)
+
+
+class ZipBufferTestCase(TestCase):
+    """Tests for the ``ZipBuffer`` class."""
+    longMessage = True
+
+    def test_buffer(self):
+        buffer = rendering.ZipBuffer()
+        archive = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr('foo.pdf', b'Foo')
+        data = buffer.pop()
+        self.assertTrue(data)
+        self.assertEqual(buffer.pop(), b'', msg=(
+            'Should forget the data, which has been popped'))
+        archive.writestr('bar.pdf', b'Bar')
+        archive.close()
+        data += buffer.pop()
+        archive = zipfile.ZipFile(BytesIO(data))
+        self.assertEqual(archive.read('foo.pdf'), b'Foo')
+        self.assertEqual(archive.read('bar.pdf'), b'Bar')
+
+
+class GetPayslipFilenameTestCase(TestCase):
+    """Tests for the ``get_payslip_filename`` function."""
+    longMessage = True
+
+    def test_function(self):
+        employee = mixer.blend('payslip.Employee', hr_number=42)
+        result = PayslipCalculator(employee, 2016, 3).calculate()
+        self.assertEqual(rendering.get_payslip_filename(result),
+                         '42-{0}_2016_03.pdf'.format(employee.pk))
+        employee.hr_number = None
+        self.assertEqual(rendering.get_payslip_filename(result),
+                         'employee-{0}_2016_03.pdf'.format(employee.pk))
@@ -0,0 +1,78 @@
+"""Tests for the seeding of the ``payslip`` app."""
+from django.test import TestCase
+
+from mixer.backend.django import mixer
+
+from ..engine import PayrollRun
+from ..models import Company, Employee, ExtraField, Payment
+from ..seeding import Seeder
+
+
+class SeederTestCase(TestCase):
+    """Tests for the ``Seeder`` class."""
+    longMessage = True
+
+    def get_data(self):
+        return (
+            list(Employee.objects.order_by('pk').values_list(
+                'user__first_name', 'user__last_name', 'title')),
+            list(Payment.objects.order_by('pk').values_list(
+                'payment_type__name', 'amount', 'date', 'end_date')),
+        )
+
+    def test_run(self):
+        # Existing objects must keep their primary keys
+        mixer.blend('payslip.Payment')
+        result = Seeder(companies=2, employees=3, years=2, payments=2,
+                        end_year=2016).run()
+        self.assertEqual(result.companies, 2)
+        self.assertEqual(result.employees, 6)
+        # One holiday pay, two salaries, two insurances and four single
+        # payments per employee
+        self.assertEqual(result.payments, 54)
+        self.assertEqual(Company.objects.count(), 3)
+        self.assertEqual(Payment.objects.count(), 55)
+        employee = Employee.objects.order_by('-pk')[0]
+        self.assertEqual(employee.extra_fields.count(), 2, msg=(
+            'Should link a tax class and a personnel file'))
+        self.assertEqual(
+            Payment.objects.filter(extra_fields__isnull=False).count(), 24,
+            msg='Should link the single payments to a cost centre')
+        self.assertEqual(Payment.objects.filter(
+            employee=employee, end_date__isnull=True,
+            payment_type__rrule='MONTHLY').count(), 2, msg=(
+            'Should only keep the salary and insurance of the last year'
+            ' open'))
+        payslips = PayrollRun(employee.company, 2016, 12).run().payslips
+        self.assertEqual(len(payslips), 3)
+        self.assertTrue(all(payslip.sum > 0 for payslip in payslips))
+        # New objects must not collide with the assigned primary keys
+        self.assertEqual(ExtraField.objects.create(
+            field_type=employee.extra_fields.all()[0].field_type,
+            value='foo').pk, ExtraField.objects.latest('pk').pk)
+        mixer.blend('payslip.Payment')
+
+    def test_insert_order(self):
+        seeder = Seeder(employees=2, years=1, payments=1, end_year=2016)
+        seeder.run()
+        models = list(seeder.pending)
+        for index, model in enumerate(models):
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model in models:
+                    self.assertLess(
+                        models.index(field.related_model), index, msg=(
+                            '{0} should be inserted before {1}'.format(
+                                field.related_model.__name__,
+                                model.__name__)))
+
+    def test_seed(self):
+        Seeder(employees=3, years=2, payments=2, end_year=2016).run()
+        data = self.get_data()
+        Payment.objects.all().delete()
+        Employee.objects.all().delete()
+        Seeder(employees=3, years=2, payments=2, end_year=2016).run()
+        self.assertEqual(self.get_data(), data, msg=(
+            'Should generate the same data with the same seed'))
+        Seeder(employees=3, years=2, payments=2, end_year=2016,
+               seed=1).run()
+        self.assertNotEqual(self.get_data()[1][len(data[1]):], data[1])
@@ -0,0 +1,94 @@
+"""Tests for the snapshots of the ``payslip`` app."""
+from concurrent.futures import Future
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import make_aware
+
+from mixer.backend.django import mixer
+
+from .. import engine, snapshots
+from ..models import Payslip
+
+
+class FinalisePayrollRunTestCase(TestCase):
+    """Tests for the ``finalise_payroll_run`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.company = mixer.blend('payslip.Company')
+        self.employees = mixer.cycle(2).blend('payslip.Employee',
+                                              company=self.company)
+        self.field_type = mixer.blend('payslip.ExtraFieldType',
+                                      model='Payment')
+        self.payment = mixer.blend(
+            'payslip.Payment', employee=self.employees[0], amount=100,
+            payment_type__rrule='MONTHLY',
+            date=make_aware(datetime(2016, 1, 1)))
+        self.payment.extra_fields.add(mixer.blend(
+            'payslip.ExtraField', field_type=self.field_type, value='5'))
+
+    def test_finalise(self):
+        self.assertEqual(
+            snapshots.finalise_payroll_run(self.company, 2016, 3), 2)
+        snapshot = self.employees[0].payslips.get()
+        self.assertEqual((snapshot.year, snapshot.month), (2016, 3))
+        self.assertEqual(snapshot.sum, Decimal('100'))
+        self.assertEqual(snapshot.sum_year, Decimal('300'))
+        rows = snapshot.get_rows()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['payment'], self.payment.pk)
+        self.assertEqual(rows[0]['extra_fields'],
+                         {str(self.field_type.pk): '5'})
+        self.assertTrue(snapshot.html)
+
+        self.payment.amount = 200
+        self.payment.save()
+        self.assertEqual(
+            snapshots.finalise_payroll_run(self.company, 2016, 3), 0,
+            msg='Should not change finalised periods')
+        self.assertEqual(self.employees[0].payslips.get().sum,
+                         Decimal('100'))
+
+    def test_batches(self):
+        snapshots.SNAPSHOT_BATCH_SIZE = 1
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                snapshots.finalise_payroll_run(self.company, 2016, 3)
+        finally:
+            snapshots.SNAPSHOT_BATCH_SIZE = 50
+        inserts = [query for query in queries
+                   if query['sql'].startswith('INSERT INTO "payslip_payslip"')]
+        self.assertEqual(len(inserts), 2, msg=(
+            'Should insert the snapshots in batches'))
+        locks = [query for query in queries
+                 if query['sql'].startswith('SELECT "payslip_company"')]
+        self.assertEqual(len(locks), 2, msg=(
+            'Should lock the company for every batch'))
+
+    def test_save_snapshots(self):
+        payslips = list(engine.iter_prefetched(engine.PayrollRun(
+            self.company, 2016, 3).iter_payslips(), 10))
+        snapshot = snapshots.get_snapshot(
+            payslips[0], '', self.get_future(b'%PDF'))
+        duplicate = snapshots.get_snapshot(
+            payslips[0], '', self.get_future(b'%PDF'))
+        other = snapshots.get_snapshot(
+            payslips[1], '', self.get_future(b'%PDF'))
+        self.assertEqual(snapshots.save_snapshots(
+            self.company, [snapshot, duplicate, other]), 2, msg=(
+                'Should skip snapshots of periods, which have been inserted'
+                ' meanwhile'))
+        self.assertEqual(snapshots.save_snapshots(
+            self.company, [snapshots.get_snapshot(
+                payslips[0], '', self.get_future(b'%PDF'))]), 0, msg=(
+                    'Should skip finalised periods'))
+        self.assertEqual(Payslip.objects.count(), 2)
+
+    def get_future(self, result):
+        future = Future()
+        future.set_result(result)
+        return future
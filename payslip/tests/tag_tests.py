@@ -3,6 +3,7 @@ from django.test import TestCase
 
 from mixer.backend.django import mixer
 
+from ..engine import prefetch_extra_field_values
 from ..templatetags.payslip_tags import get_extra_field_value
 
 
@@ -20,3 +21,14 @@ class TemplateFilterTestCase(TestCase):
         self.payment.extra_fields.add(self.extra_field)
         self.assertEqual(get_extra_field_value(
             self.extra_field.field_type, self.payment), self.extra_field.value)
+
+    def test_get_extra_field_value_prefetched(self):
+        self.payment.extra_fields.add(self.extra_field)
+        other_type = mixer.blend('payslip.ExtraFieldType')
+        prefetch_extra_field_values([self.payment])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_extra_field_value(
+                self.extra_field.field_type, self.payment),
+                self.extra_field.value)
+            self.assertEqual(get_extra_field_value(
+                other_type, self.payment), '&nbsp;')
@@ -14,6 +14,17 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Test transactions are rolled back without any signals, so the tests
+    # always load the catalogue from the database
+    'catalogue': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.MD5PasswordHasher',
 )
@@ -73,3 +84,4 @@ SECRET_KEY = 'foobar'
 
 # Payslip settings
 PAYSLIP_CURRENCY = 'SGD'
+PAYSLIP_CATALOGUE_CACHE = 'catalogue'
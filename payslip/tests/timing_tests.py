@@ -0,0 +1,67 @@
+"""Tests for the timing of the ``payslip`` app."""
+import logging
+
+from django.test import SimpleTestCase
+
+from .. import timing
+from ..signals import payslip_timed
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class StageTimerTestCase(SimpleTestCase):
+    """Tests for the ``StageTimer`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.timer = timing.StageTimer()
+
+    def test_stage(self):
+        with self.timer.stage('query'):
+            pass
+        self.timer.add('calculate', 0.5)
+        self.timer.update({'query': 1, 'layout': 0.25})
+        self.assertEqual(list(self.timer.timings), ['query', 'calculate',
+                                                    'layout'])
+        self.assertGreater(self.timer.timings['query'], 1, msg=(
+            'Should sum up the durations of repeated stages'))
+        with self.assertRaises(ValueError):
+            with self.timer.stage('render_html'):
+                raise ValueError
+        self.assertIn('render_html', self.timer.timings, msg=(
+            'Should time failed stages as well'))
+
+    def test_get_server_timing(self):
+        self.timer.update({'query': 0.0123})
+        self.timer.update({'write_pdf': 1})
+        self.assertEqual(self.timer.get_server_timing(),
+                         'query;dur=12.3, write_pdf;dur=1000.0')
+
+    def test_send(self):
+        received = []
+
+        def receiver(**kwargs):
+            received.append(kwargs)
+
+        handler = RecordingHandler()
+        timing.logger.addHandler(handler)
+        timing.logger.setLevel(logging.INFO)
+        payslip_timed.connect(receiver)
+        self.timer.add('query', 0.5)
+        try:
+            self.timer.send(sender=None, employee_id=1, kind='pdf')
+        finally:
+            payslip_timed.disconnect(receiver)
+            timing.logger.removeHandler(handler)
+            timing.logger.setLevel(logging.NOTSET)
+        self.assertEqual(received[0]['timings'], {'query': 0.5})
+        self.assertEqual(received[0]['employee_id'], 1)
+        self.assertEqual(handler.records[0].payslip, {
+            'employee_id': 1, 'kind': 'pdf', 'timings': {'query': 0.5}})
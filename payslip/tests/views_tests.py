@@ -1,11 +1,25 @@
 """Tests for the views of the ``payslip`` app."""
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from django_libs.tests.mixins import ViewRequestFactoryTestMixin
 from mixer.backend.django import mixer
 
-from .. import views
+from .. import app_settings, views
+from ..signals import payslip_timed
 
 
 class DashboardViewTestCase(ViewRequestFactoryTestMixin, TestCase):
@@ -21,6 +35,52 @@ class DashboardViewTestCase(ViewRequestFactoryTestMixin, TestCase):
         self.user.save()
         self.is_callable(user=self.user)
 
+    def get_query_count(self, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(user=self.user, data=data).render()
+        return len(queries)
+
+    def test_query_count(self):
+        self.user.is_staff = True
+        self.user.save()
+        mixer.blend('payslip.Payment')
+        mixer.blend('payslip.ExtraField', field_type__fixed_values=True)
+        count = self.get_query_count()
+        mixer.cycle(5).blend('payslip.Payment')
+        mixer.cycle(5).blend('payslip.ExtraField',
+                             field_type__fixed_values=True)
+        self.assertEqual(self.get_query_count(), count, msg=(
+            'Should not need more queries for more objects'))
+
+    def test_pagination(self):
+        self.user.is_staff = True
+        self.user.save()
+        mixer.cycle(30).blend('payslip.PaymentType')
+        resp = self.get(user=self.user, data={'payment_types_page': 2})
+        page = resp.context_data['payment_types']
+        self.assertEqual(page.paginator.count, 30)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(page.previous_url, '?payment_types_page=1')
+        resp = self.get(user=self.user, data={'payment_types_page': 'foo'})
+        self.assertEqual(resp.context_data['payment_types'].number, 1)
+
+    def test_profiling(self):
+        data = {'_profile': 1}
+        self.user.is_staff = True
+        self.user.save()
+        resp = self.get(user=self.user, data=data)
+        self.assertIn('companies', resp.context_data, msg=(
+            'Should not profile without the setting'))
+        app_settings.PROFILING = True
+        try:
+            resp = self.get(user=self.user, data=data)
+        finally:
+            app_settings.PROFILING = False
+        self.assertEqual(resp['Content-Type'], 'text/plain; charset=utf-8')
+        content = resp.content.decode('utf-8')
+        self.assertIn('queries in', content)
+        self.assertIn('Ordered by: cumulative time', content)
+
 
 class CompanyCreateViewTestCase(ViewRequestFactoryTestMixin, TestCase):
     """Tests for the CreateView ``CompanyCreateView``."""
@@ -394,3 +454,289 @@ class PayslipGeneratorViewTestCase(ViewRequestFactoryTestMixin, TestCase):
         self.is_postable(data=data, user=self.staff, ajax=True)
         data.update({'download': True})
         self.is_postable(data=data, user=self.manager.user, ajax=True)
+
+    def test_query_count(self):
+        data = {
+            'employee': self.employee.id,
+            'year': timezone.now().year,
+            'month': timezone.now().month,
+        }
+        cache.clear()
+        # Permission, form, snapshot, employee, two for the calculation, two
+        # for the catalogue (cached in production), one for the extra fields
+        # of the employee, which the cache key and the payslip share, and one
+        # for the extra fields of the payments
+        with self.assertNumQueries(10):
+            self.post(data=data, user=self.staff, ajax=True).render()
+        # The cache key of the cached payslip needs the same queries
+        with self.assertNumQueries(10):
+            self.post(data=data, user=self.staff, ajax=True).render()
+
+    def test_timing(self):
+        timings = []
+
+        def receiver(**kwargs):
+            timings.append((kwargs['kind'], list(kwargs['timings'])))
+
+        data = {
+            'employee': self.employee.id,
+            'year': timezone.now().year,
+            'month': timezone.now().month,
+        }
+        cache.clear()
+        payslip_timed.connect(receiver)
+        app_settings.SERVER_TIMING = True
+        try:
+            resp = self.post(data=data, user=self.staff, ajax=True)
+            data.update({'download': True})
+            self.post(data=data, user=self.staff, ajax=True)
+        finally:
+            app_settings.SERVER_TIMING = False
+            payslip_timed.disconnect(receiver)
+        self.assertTrue(resp['Server-Timing'].startswith('query;dur='))
+        self.assertEqual(timings, [
+            ('html', ['query', 'calculate', 'render_html']),
+            ('pdf', ['query', 'calculate', 'render_html', 'layout',
+                     'write_pdf']),
+        ], msg='Should time the stages of the worker as well')
+
+    def test_profiling(self):
+        path = '{0}?_profile=1'.format(reverse('payslip_generator'))
+        data = {
+            'employee': self.employee2.id,
+            'year': timezone.now().year,
+            'month': timezone.now().month,
+        }
+        app_settings.PROFILING = True
+        try:
+            self.client.force_login(self.manager.user)
+            resp = self.client.post(path, data)
+            self.assertIn('payslip/payslip.html',
+                          [template.name for template in resp.templates],
+                          msg='Should not profile requests of non-staff')
+            self.client.force_login(self.staff)
+            resp = self.client.post(path, data)
+        finally:
+            app_settings.PROFILING = False
+        content = resp.content.decode('utf-8')
+        self.assertTrue(content.startswith(
+            'Profile of POST {0} in '.format(path)))
+        self.assertIn('payslip_payment', content, msg=(
+            'Should list the queries'))
+        self.assertIn('get_payslip_context', content, msg=(
+            'Should list the profiled functions'))
+
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        app_settings.PROFILING = True
+        app_settings.PROFILING_DIR = directory
+        try:
+            resp = self.client.post(path, dict(data, download=1))
+        finally:
+            app_settings.PROFILING = False
+            app_settings.PROFILING_DIR = None
+        path = resp.content.decode('utf-8').split('Stored as ')[1].split()[0]
+        functions = [
+            (os.path.basename(filename), name)
+            for filename, line, name in pstats.Stats(path).stats]
+        self.assertIn(('rendering.py', 'write_pdf'), functions, msg=(
+            'Should profile the PDF rendering instead of the PDF workers'))
+
+    def test_snapshot(self):
+        now = timezone.now()
+        snapshot = mixer.blend(
+            'payslip.Payslip', employee=self.employee, year=now.year,
+            month=now.month, html='<p>Frozen</p>', pdf=b'%PDF frozen')
+        data = {
+            'employee': self.employee.id,
+            'year': now.year,
+            'month': now.month,
+        }
+        # Permission, form and the snapshot
+        with self.assertNumQueries(3):
+            resp = self.post(data=data, user=self.staff, ajax=True).render()
+        self.assertIn(b'<p>Frozen</p>', resp.content, msg=(
+            'Should serve the content of a finalised period'))
+        data.update({'download': True})
+        resp = self.post(data=data, user=self.staff, ajax=True)
+        self.assertEqual(resp.content, b'%PDF frozen', msg=(
+            'Should serve the PDF of a finalised period'))
+        snapshot.delete()
+
+
+class PayrollRunViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the FormView ``PayrollRunView``."""
+    view_class = views.PayrollRunView
+
+    def setUp(self):
+        self.manager = mixer.blend('payslip.Employee', is_manager=True)
+        mixer.blend('payslip.Payment', employee=self.manager,
+                    payment_type__rrule='MONTHLY')
+
+    def test_view(self):
+        self.is_callable(user=self.manager.user)
+        data = {
+            'company': self.manager.company.id,
+            'year': timezone.now().year,
+            'month': timezone.now().month,
+        }
+        resp = self.is_postable(data=data, user=self.manager.user, ajax=True)
+        self.assertEqual(len(resp.context_data['result'].payslips), 1)
+        self.assertIn(b'Calculated 1 payslips', resp.render().content)
+
+    def test_finalise(self):
+        data = {
+            'company': self.manager.company.id,
+            'year': timezone.now().year,
+            'month': timezone.now().month,
+            'finalise': True,
+        }
+        self.is_postable(data=data, user=self.manager.user, ajax=True)
+        self.assertEqual(self.manager.payslips.count(), 1, msg=(
+            'Should store a snapshot of the payslip'))
+
+
+class JournalExportViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the FormView ``JournalExportView``."""
+    view_class = views.JournalExportView
+
+    def setUp(self):
+        self.manager = mixer.blend('payslip.Employee', is_manager=True)
+        mixer.blend('payslip.Payment', employee=self.manager,
+                    payment_type__rrule='MONTHLY',
+                    date=timezone.now().replace(year=2016, month=1, day=1))
+
+    def test_view(self):
+        self.is_callable(user=self.manager.user)
+        data = {
+            'company': self.manager.company.pk,
+            'year': 2016,
+            'month': 2,
+            'end_year': 2016,
+            'end_month': 3,
+            'format': 'jsonl',
+        }
+        resp = self.is_postable(data=data, user=self.manager.user,
+                                ajax=True)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 5)
+        data.update({'end_month': 1})
+        resp = self.post(data=data, user=self.manager.user)
+        self.assertTrue(resp.context_data['form'].errors, msg=(
+            'Should not accept a last month before the first one'))
+
+
+class PaymentImportViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the FormView ``PaymentImportView``."""
+    view_class = views.PaymentImportView
+
+    def setUp(self):
+        self.staff = mixer.blend('auth.User', is_staff=True)
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        mixer.blend('payslip.PaymentType', name='Bonus')
+
+    def get_file(self, content):
+        return SimpleUploadedFile('payments.csv', content,
+                                  content_type='text/csv')
+
+    def test_view(self):
+        self.is_not_callable(user=self.employee.user)
+        self.is_callable(user=self.staff)
+        resp = self.is_postable(data={
+            'company': self.employee.company.pk,
+            'file': self.get_file(b'hr_number,payment_type,amount,date\n'
+                                  b'42,Bonus,100,2016-03-01\n'),
+        }, user=self.staff, ajax=True, add_session=True)
+        self.assertEqual(resp.context_data['result'].created, 1)
+        self.assertEqual(self.employee.payments.count(), 1)
+        resp = self.post(data={
+            'company': self.employee.company.pk,
+            'file': self.get_file(b'foo\n1\n'),
+        }, user=self.staff)
+        self.assertIn('file', resp.context_data['form'].errors, msg=(
+            'Should show the errors of invalid files'))
+        resp = self.post(data={
+            'company': self.employee.company.pk,
+            'file': self.get_file(u'hr_number,payment_type,amount,date,'
+                                  u'description\n42,Bonus,100,2016-03-01,'
+                                  u'B\xfcro\n'.encode('cp1252')),
+        }, user=self.staff)
+        self.assertEqual(resp.context_data['form'].errors['file'], [
+            'Line 2 is not encoded as UTF-8.'], msg=(
+                'Should show the errors of files in other encodings'))
+
+
+class PayslipArchiveViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the FormView ``PayslipArchiveView``."""
+    view_class = views.PayslipArchiveView
+
+    def setUp(self):
+        self.staff = mixer.blend('auth.User', is_staff=True)
+        self.employee = mixer.blend('payslip.Employee', hr_number=42)
+        mixer.cycle(3).blend('payslip.Employee', company=self.employee.company,
+                             hr_number=mixer.sequence(42, None, None))
+
+    def test_view(self):
+        resp = self.is_callable(user=self.staff, data={
+            'company': self.employee.company.pk})
+        self.assertEqual(resp.context_data['form'].initial['company'],
+                         str(self.employee.company.pk))
+        now = timezone.now()
+        data = {
+            'company': self.employee.company.pk,
+            'year': now.year,
+            'month': now.month,
+        }
+        resp = self.is_postable(data=data, user=self.staff, ajax=True)
+        archive = zipfile.ZipFile(BytesIO(b''.join(resp.streaming_content)))
+        self.assertEqual(len(set(archive.namelist())), 4, msg=(
+            'Should name the documents of shared and missing HR numbers'
+            ' uniquely'))
+        self.assertIn('42-{0}_{1}_{2:02d}.pdf'.format(
+            self.employee.pk, now.year, now.month), archive.namelist())
+
+
+class PayslipJobViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the DetailView ``PayslipJobView``."""
+    view_class = views.PayslipJobView
+
+    def setUp(self):
+        self.manager = mixer.blend('payslip.Employee', is_manager=True)
+        self.job = mixer.blend('payslip.PayslipJob',
+                               company=self.manager.company, employee=None,
+                               year=2016, month=3, status='pending')
+
+    def get_view_kwargs(self):
+        return {'pk': self.job.pk}
+
+    def test_view(self):
+        self.is_callable(user=self.manager.user)
+        resp = self.get(user=self.manager.user, ajax=True)
+        self.assertEqual(json.loads(resp.content.decode('utf-8')),
+                         {'status': 'pending', 'download_url': None})
+        self.is_not_callable(user=self.manager.user, data={'download': 1})
+        self.job.status = 'done'
+        self.job.filename = 'payslips.zip'
+        self.job.result = b'ZIP'
+        self.job.save()
+        resp = self.get(user=self.manager.user, data={'download': 1})
+        self.assertEqual(resp.content, b'ZIP')
+        other = mixer.blend('payslip.Employee', is_manager=True)
+        self.is_not_callable(user=other.user, msg=(
+            'Should not show jobs of other companies'))
+
+    def test_enqueue(self):
+        self.view_class = views.PayslipGeneratorView
+        data = {
+            'employee': self.manager.id,
+            'year': 2016,
+            'month': 3,
+            'enqueue': True,
+        }
+        resp = self.post(data=data, user=self.manager.user)
+        job = self.manager.payslip_jobs.get()
+        self.assertEqual(resp['Location'], reverse(
+            'payslip_job', kwargs={'pk': job.pk}), msg=(
+                'Should redirect to the enqueued job'))
@@ -0,0 +1,71 @@
+"""Timing of the stages of the payslip generation."""
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+from .signals import payslip_timed
+
+logger = logging.getLogger(__name__)
+
+#: Stages of the payslip generation in the order they are passed.
+STAGES = ('query', 'calculate', 'render_html', 'layout', 'write_pdf')
+
+
+class StageTimer(object):
+    """
+    Measures the durations of the named stages of one payslip generation.
+
+    Usage::
+
+        timer = StageTimer()
+        with timer.stage('query'):
+            ...
+        timer.send(sender, employee_id=1, year=2016, month=3, kind='pdf')
+
+    :timings: Ordered dictionary of the seconds spent in every stage. The
+      durations of a stage, which is passed more than once, are summed up.
+
+    """
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the duration of the enclosed block to the given stage."""
+        started = default_timer()
+        try:
+            yield
+        finally:
+            self.add(name, default_timer() - started)
+
+    def add(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0) + duration
+
+    def update(self, timings):
+        """Adds the durations of another ``timings`` dictionary."""
+        for name, duration in timings.items():
+            self.add(name, duration)
+
+    def get_server_timing(self):
+        """Returns the timings as value of a ``Server-Timing`` header."""
+        return ', '.join(
+            '{0};dur={1:.1f}'.format(name, duration * 1000)
+            for name, duration in self.timings.items())
+
+    def send(self, sender, **kwargs):
+        """
+        Sends the ``payslip_timed`` signal with the timings and logs them.
+
+        The keyword arguments are passed to the receivers and added to the
+        log record as ``payslip`` dictionary together with the timings.
+
+        """
+        timings = dict(self.timings)
+        payslip_timed.send(sender=sender, timings=timings, **kwargs)
+        data = dict(kwargs, timings=timings)
+        logger.info(
+            'Generated payslip in %.4fs (%s)', sum(timings.values()),
+            ', '.join('{0}={1:.4f}s'.format(name, duration)
+                      for name, duration in self.timings.items()),
+            extra={'payslip': data})
@@ -8,6 +8,7 @@ from .views import (
     EmployeeCreateView,
     EmployeeDeleteView,
     EmployeeUpdateView,
+    JournalExportView,
     ExtraFieldCreateView,
     ExtraFieldDeleteView,
     ExtraFieldUpdateView,
@@ -17,11 +18,15 @@ from .views import (
     DashboardView,
     PaymentCreateView,
     PaymentDeleteView,
+    PaymentImportView,
     PaymentUpdateView,
     PaymentTypeCreateView,
     PaymentTypeDeleteView,
     PaymentTypeUpdateView,
+    PayrollRunView,
+    PayslipArchiveView,
     PayslipGeneratorView,
+    PayslipJobView,
 )
 
 
@@ -106,6 +111,11 @@ urlpatterns = [
         name='payslip_payment_delete',
         ),
 
+    url(r'^payment/import/$',
+        PaymentImportView.as_view(),
+        name='payslip_payment_import',
+        ),
+
     url(r'^payment-type/create/$',
         PaymentTypeCreateView.as_view(),
         name='payslip_payment_type_create',
@@ -125,4 +135,24 @@ urlpatterns = [
         PayslipGeneratorView.as_view(),
         name='payslip_generator',
         ),
+
+    url(r'^payroll-run/$',
+        PayrollRunView.as_view(),
+        name='payslip_payroll_run',
+        ),
+
+    url(r'^payslip/archive/$',
+        PayslipArchiveView.as_view(),
+        name='payslip_archive',
+        ),
+
+    url(r'^journal/$',
+        JournalExportView.as_view(),
+        name='payslip_journal_export',
+        ),
+
+    url(r'^job/(?P<pk>\d+)/$',
+        PayslipJobView.as_view(),
+        name='payslip_job',
+        ),
 ]
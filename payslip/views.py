@@ -1,30 +1,44 @@
 """Views for the ``online_docs`` app."""
-from datetime import datetime
-import os
-
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse
-from django.db.models import Q, Sum
-from django.http import Http404, HttpResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from django.utils.translation import ugettext as _
 from django.views.generic import (
     CreateView,
     DeleteView,
+    DetailView,
     FormView,
     TemplateView,
     UpdateView,
 )
 
-from dateutil import relativedelta, rrule
-from weasyprint import HTML, CSS
-
-from .app_settings import CURRENCY
+from . import app_settings
+from .app_settings import CURRENCY, DASHBOARD_PAGINATE_BY
+from .engine import PayrollRun, PayslipCalculator
 from .forms import (
+    CompanyForm,
     EmployeeForm,
     ExtraFieldForm,
+    JournalExportForm,
     PaymentForm,
+    PaymentUploadForm,
+    PayrollRunForm,
     PayslipForm,
 )
+from .exports import FORMATS, get_journal_filename, iter_journal_export
+from .importers import import_payments
+from .jobs import enqueue_job
 from .models import (
     Company,
     Employee,
@@ -32,13 +46,55 @@ from .models import (
     ExtraFieldType,
     Payment,
     PaymentType,
+    Payslip,
+    PayslipJob,
 )
+from .rendering import (
+    get_archive_filename,
+    get_payslip_context,
+    iter_payslip_archive,
+    rendering_in_process,
+    submit_payslip_pdf,
+)
+from .profiling import get_report, is_profiling, profile, store_stats
+from .snapshots import finalise_payroll_run
+from .timing import StageTimer
 
 
 # -------------#
 # Mixins       #
 # -------------#
 
+class ProfilingMixin(object):
+    """
+    Mixin to profile a request of a staff user with ``?_profile=1``.
+
+    With ``PAYSLIP_PROFILING`` the request runs under ``cProfile`` and the
+    response is replaced by the sorted statistics and the list of queries.
+    The PDF documents are rendered in the current process meanwhile, since
+    the profiler doesn't see the PDF workers.
+
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if not is_profiling(request):
+            return super(ProfilingMixin, self).dispatch(
+                request, *args, **kwargs)
+
+        def get_response():
+            with rendering_in_process():
+                response = super(ProfilingMixin, self).dispatch(
+                    request, *args, **kwargs)
+                # Render here, so the templates are profiled as well
+                if hasattr(response, 'render'):
+                    response.render()
+            return response
+
+        response, stats, queries, duration = profile(get_response)
+        report = get_report(request, stats, queries, duration,
+                            path=store_stats(stats))
+        return HttpResponse(report, content_type='text/plain; charset=utf-8')
+
+
 class PermissionMixin(object):
     """Mixin to handle security functions."""
     @method_decorator(login_required)
@@ -90,7 +146,7 @@ class CompanyPermissionMixin(object):
 
         """
         try:
-            self.company = Employee.objects.get(
+            self.company = Employee.objects.select_related('company').get(
                 user=request.user, is_manager=True).company
         except Employee.DoesNotExist:
             if not request.user.is_staff:
@@ -141,26 +197,60 @@ class PaymentTypeMixin(object):
 # Views        #
 # -------------#
 
-class DashboardView(PermissionMixin, TemplateView):
-    """Dashboard to navigate through the payslip app."""
+class DashboardView(ProfilingMixin, PermissionMixin, TemplateView):
+    """
+    Dashboard to navigate through the payslip app.
+
+    Every section is paginated on its own, e.g. with ``?payments_page=2``, so
+    the number of queries does not grow with the number of objects.
+
+    """
     template_name = 'payslip/dashboard.html'
 
+    def paginate(self, name, queryset):
+        """Returns the current page of a section."""
+        param = '{0}_page'.format(name)
+        paginator = Paginator(queryset, DASHBOARD_PAGINATE_BY)
+        try:
+            page = paginator.page(self.request.GET.get(param, 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        # Keep the pages of the other sections in the links
+        query = self.request.GET.copy()
+        if page.has_previous():
+            query[param] = page.previous_page_number()
+            page.previous_url = '?{0}'.format(query.urlencode())
+        if page.has_next():
+            query[param] = page.next_page_number()
+            page.next_url = '?{0}'.format(query.urlencode())
+        return page
+
     def get_context_data(self, **kwargs):
         return {
-            'companies': Company.objects.all(),
-            'employees': Employee.objects.all(),
-            'extra_field_types': ExtraFieldType.objects.all(),
-            'fixed_value_extra_fields': ExtraField.objects.filter(
-                field_type__fixed_values=True),
-            'payments': Payment.objects.all(),
-            'payment_types': PaymentType.objects.all(),
+            'companies': self.paginate('companies', Company.objects.all()),
+            'employees': self.paginate(
+                'employees',
+                Employee.objects.select_related('user', 'company')),
+            'extra_field_types': self.paginate(
+                'extra_field_types', ExtraFieldType.objects.all()),
+            'fixed_value_extra_fields': self.paginate(
+                'fixed_value_extra_fields', ExtraField.objects.filter(
+                    field_type__fixed_values=True).select_related(
+                        'field_type')),
+            'payments': self.paginate(
+                'payments', Payment.objects.select_related(
+                    'payment_type', 'employee__user')),
+            'payment_types': self.paginate(
+                'payment_types', PaymentType.objects.all()),
         }
 
 
 class CompanyCreateView(PermissionMixin, CreateView):
     """Classic view to create a company."""
     model = Company
-    fields = '__all__'
+    form_class = CompanyForm
 
     def get_success_url(self):
         return reverse('payslip_dashboard')
@@ -169,7 +259,7 @@ class CompanyCreateView(PermissionMixin, CreateView):
 class CompanyUpdateView(CompanyMixin, UpdateView):
     """Classic view to update a company."""
     model = Company
-    fields = '__all__'
+    form_class = CompanyForm
 
 
 class CompanyDeleteView(CompanyMixin, DeleteView):
@@ -258,8 +348,19 @@ class PaymentDeleteView(CompanyPermissionMixin, PaymentMixin, DeleteView):
     pass
 
 
-class PayslipGeneratorView(CompanyPermissionMixin, FormView):
-    """View to present a small form to generate a custom payslip."""
+class PayslipGeneratorView(ProfilingMixin, CompanyPermissionMixin,
+                           FormView):
+    """
+    View to present a small form to generate a custom payslip.
+
+    Every generated payslip sends the ``payslip_timed`` signal with the
+    durations of its stages. With ``PAYSLIP_SERVER_TIMING`` they are added to
+    the response as ``Server-Timing`` header.
+
+    Staff users can profile the view with ``?_profile=1``, see
+    ``ProfilingMixin``.
+
+    """
     template_name = 'payslip/payslip_form.html'
     form_class = PayslipForm
 
@@ -273,119 +374,219 @@ class PayslipGeneratorView(CompanyPermissionMixin, FormView):
             return ['payslip/payslip.html']
         return super(PayslipGeneratorView, self).get_template_names()
 
+    def get_snapshot(self):
+        """Returns the ``Payslip`` of a finalised period or ``None``."""
+        with self.timer.stage('query'):
+            return Payslip.objects.select_related(
+                'employee__user', 'employee__company').filter(
+                    employee=self.post_data.get('employee'),
+                    year=self.post_data.get('year'),
+                    month=self.post_data.get('month')).first()
+
+    def get_result(self):
+        """Returns the ``PayslipResult`` of the posted employee and period."""
+        with self.timer.stage('query'):
+            employee = Employee.objects.select_related('user', 'company').get(
+                pk=self.post_data.get('employee'))
+        return PayslipCalculator(
+            employee,
+            self.post_data.get('year'),
+            self.post_data.get('month'),
+        ).calculate(self.timer)
+
     def get_context_data(self, **kwargs):
         kwargs = super(PayslipGeneratorView, self).get_context_data(**kwargs)
         if hasattr(self, 'post_data'):
-            # Get form data
-            employee = Employee.objects.get(pk=self.post_data.get('employee'))
-            self.date_start = datetime.strptime(
-                '{}-{}-01'.format(
-                    self.post_data.get('year'), self.post_data.get('month')),
-                '%Y-%m-%d',
-            )
-            january_1st = datetime.strptime(
-                '{}-01-01'.format(self.post_data.get('year')),
-                '%Y-%m-%d',
-            )
-            date_end = self.date_start + relativedelta.relativedelta(
-                months=1) - relativedelta.relativedelta(days=1)
-
-            # Get payments for the selected year
-            payments_year = employee.payments.filter(
-                # Recurring payments with past date and end_date in the
-                # selected year or later
-                Q(date__lte=date_end, end_date__gte=january_1st) |
-                # Recurring payments with past date in period and open end
-                Q(date__lte=date_end, end_date__isnull=True,
-                  payment_type__rrule__isnull=False)
-            ).exclude(
-                payment_type__rrule__exact='') | employee.payments.filter(
-                # Single payments in this year
-                date__year=self.date_start.year, payment_type__rrule__exact='',
-            )
-
-            # Get payments for the selected period
-            payments = payments_year.exclude(
-                # Exclude single payments not transferred in the period
-                Q(date__lt=self.date_start) |
-                Q(date__gt=date_end),
-                Q(payment_type__rrule__exact=''),
-            ).filter(
-                # Recurring payments with past date and end_date in the period
-                Q(end_date__gte=date_end, date__lte=date_end) |
-                # Recurring payments with past date in period and open end
-                Q(date__lte=date_end, end_date__isnull=True)
-            )
-
-            # Yearly positive summary
-            sum_year = payments_year.filter(
-                amount__gt=0, payment_type__rrule__exact='').aggregate(
-                    Sum('amount')).get('amount__sum') or 0
-
-            # Yearly negative summary
-            sum_year_neg = payments_year.filter(
-                amount__lt=0, payment_type__rrule__exact='').aggregate(
-                    Sum('amount')).get('amount__sum') or 0
-
-            # Yearly summary of recurring payments
-            for payment in payments_year.exclude(
-                    payment_type__rrule__exact=''):
-                # If the recurring payment started in a year before, let's take
-                # January 1st as a start, otherwise take the original date
-                if payment.get_date_without_tz().year < self.date_start.year:
-                    start = january_1st
-                else:
-                    start = payment.get_date_without_tz()
-                # If the payments ends before the period's end date, let's take
-                # this date, otherwise we can take the period's end
-                if (payment.end_date and
-                        payment.get_end_date_without_tz() < date_end):
-                    end = payment.get_end_date_without_tz()
-                else:
-                    end = date_end
-                recurrings = rrule.rrule(
-                    rrule._rrulestr._freq_map.get(payment.payment_type.rrule),
-                    dtstart=start, until=end,
-                )
-                # Multiply amount with recurrings
-                if payment.amount > 0:
-                    sum_year += payment.amount * recurrings.count()
-                else:
-                    sum_year_neg += payment.amount * recurrings.count()
-
-            # Period summaries
-            sum = payments.filter(amount__gt=0).aggregate(
-                Sum('amount')).get('amount__sum') or 0
-            sum_neg = payments.filter(amount__lt=0).aggregate(
-                Sum('amount')).get('amount__sum') or 0
-
-            kwargs.update({
-                'employee': employee,
-                'date_start': self.date_start,
-                'date_end': date_end,
-                'payments': payments,
-                'payment_extra_fields': ExtraFieldType.objects.filter(
-                    model='Payment'),
-                'sum_year': sum_year,
-                'sum_year_neg': sum_year + sum_year_neg,
-                'sum': sum,
-                'sum_neg': sum_neg,
-                'currency': CURRENCY,
-            })
+            snapshot = self.get_snapshot()
+            if snapshot is None:
+                kwargs.update(get_payslip_context(self.get_result(),
+                                                  timer=self.timer))
+            else:
+                kwargs.update({
+                    'employee': snapshot.employee,
+                    'date_start': snapshot.date_start,
+                    'date_end': snapshot.date_end,
+                    'payslip_content': mark_safe(snapshot.html),
+                })
         return kwargs
 
     def form_valid(self, form):
         self.post_data = self.request.POST
+        if 'enqueue' in self.post_data:
+            employee = Employee.objects.get(pk=form.cleaned_data['employee'])
+            job = enqueue_job(employee.company, form.cleaned_data['year'],
+                              form.cleaned_data['month'], employee=employee)
+            return HttpResponseRedirect(
+                reverse('payslip_job', kwargs={'pk': job.pk}))
+        self.timer = StageTimer()
         if 'download' in self.post_data:
-            html = self.render_to_response(self.get_context_data(form=form))
-            f = open(os.path.join(
-                os.path.dirname(__file__), './static/payslip/css/payslip.css'))
-            html = HTML(string=html.render().content)
-            pdf = html.write_pdf(stylesheets=[CSS(string=f.read())])
-            f.close()
+            kind = 'pdf'
+            snapshot = self.get_snapshot()
+            if snapshot is None:
+                result = self.get_result()
+                pdf = submit_payslip_pdf(result, timer=self.timer).result()
+            else:
+                result = snapshot
+                pdf = bytes(snapshot.pdf)
             resp = HttpResponse(pdf, content_type='application/pdf')
             resp['Content-Disposition'] = \
                 u'attachment; filename="{}_{}.pdf"'.format(
-                    self.date_start.year, self.date_start.month)
+                    result.date_start.year, result.date_start.month)
+        else:
+            kind = 'html'
+            resp = self.render_to_response(self.get_context_data(form=form))
+            # Render here, so the rendering of the page is timed as well
+            with self.timer.stage('render_html'):
+                resp.render()
+        self.timer.send(
+            sender=self.__class__,
+            employee_id=int(form.cleaned_data['employee']),
+            year=int(form.cleaned_data['year']),
+            month=int(form.cleaned_data['month']),
+            kind=kind,
+        )
+        if app_settings.SERVER_TIMING:
+            resp['Server-Timing'] = self.timer.get_server_timing()
+        return resp
+
+
+class PayrollRunView(CompanyPermissionMixin, FormView):
+    """View to calculate the payslips of all employees of a company."""
+    template_name = 'payslip/payroll_run_form.html'
+    form_class = PayrollRunForm
+
+    def get_form_kwargs(self):
+        kwargs = super(PayrollRunView, self).get_form_kwargs()
+        kwargs.update({'company': self.company})
+        return kwargs
+
+    def form_valid(self, form):
+        if 'finalise' in self.request.POST:
+            count = finalise_payroll_run(
+                form.cleaned_data['company'],
+                form.cleaned_data['year'],
+                form.cleaned_data['month'],
+            )
+            messages.success(self.request, _(
+                'Finalised {0} payslips.').format(count))
+        result = PayrollRun(
+            form.cleaned_data['company'],
+            form.cleaned_data['year'],
+            form.cleaned_data['month'],
+        ).run()
+        return self.render_to_response(self.get_context_data(
+            form=form, result=result, currency=CURRENCY))
+
+
+class JournalExportView(PayrollRunView):
+    """View to download the payroll journal of a company."""
+    template_name = 'payslip/journal_export_form.html'
+    form_class = JournalExportForm
+
+    def form_valid(self, form):
+        company = form.cleaned_data['company']
+        start, end = form.cleaned_data['start'], form.cleaned_data['end']
+        format = form.cleaned_data['format']
+        resp = StreamingHttpResponse(
+            iter_journal_export(company, start, end, format),
+            content_type=FORMATS[format])
+        resp['Content-Disposition'] = u'attachment; filename="{}"'.format(
+            get_journal_filename(company, start, end, format))
+        return resp
+
+
+class PaymentImportView(PermissionMixin, FormView):
+    """View to import the payments of a company from a CSV file."""
+    template_name = 'payslip/payment_import_form.html'
+    form_class = PaymentUploadForm
+
+    def get_initial(self):
+        initial = super(PaymentImportView, self).get_initial()
+        if self.request.GET.get('company'):
+            initial.update({'company': self.request.GET['company']})
+        return initial
+
+    def form_valid(self, form):
+        try:
+            result = import_payments(form.cleaned_data['company'],
+                                     form.cleaned_data['file'])
+        except ValidationError as exc:
+            form.add_error('file', exc)
+            return self.form_invalid(form)
+        messages.success(self.request, _(
+            'Created {0} and updated {1} payments.').format(
+                result.created, result.updated))
+        return self.render_to_response(self.get_context_data(
+            form=form, result=result))
+
+
+class PayslipArchiveView(PayrollRunView):
+    """View to download the payslips of all employees of a company."""
+    template_name = 'payslip/payslip_archive_form.html'
+
+    def get_initial(self):
+        initial = super(PayslipArchiveView, self).get_initial()
+        if self.request.GET.get('company'):
+            initial.update({'company': self.request.GET['company']})
+        return initial
+
+    def form_valid(self, form):
+        if 'enqueue' in self.request.POST:
+            job = enqueue_job(
+                form.cleaned_data['company'],
+                form.cleaned_data['year'],
+                form.cleaned_data['month'],
+            )
+            return HttpResponseRedirect(
+                reverse('payslip_job', kwargs={'pk': job.pk}))
+        period = (
+            form.cleaned_data['company'],
+            form.cleaned_data['year'],
+            form.cleaned_data['month'],
+        )
+        resp = StreamingHttpResponse(
+            iter_payslip_archive(PayrollRun(*period).iter_payslips()),
+            content_type='application/zip')
+        resp['Content-Disposition'] = u'attachment; filename="{}"'.format(
+            get_archive_filename(*period))
+        return resp
+
+
+class PayslipJobView(CompanyPermissionMixin, DetailView):
+    """
+    View to poll a ``PayslipJob``.
+
+    Returns the state of the job as JSON for AJAX requests and its result, if
+    the parameter ``download`` is given.
+
+    """
+    model = PayslipJob
+
+    def get_queryset(self):
+        qs = super(PayslipJobView, self).get_queryset().defer('result')
+        if self.company:
+            qs = qs.filter(company=self.company)
+        return qs
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if 'download' in request.GET:
+            if self.object.status != PayslipJob.DONE:
+                raise Http404
+            content_type = 'application/zip'
+            if self.object.employee_id:
+                content_type = 'application/pdf'
+            resp = HttpResponse(bytes(self.object.result),
+                                content_type=content_type)
+            resp['Content-Disposition'] = \
+                u'attachment; filename="{}"'.format(self.object.filename)
             return resp
-        return self.render_to_response(self.get_context_data(form=form))
+        if request.is_ajax():
+            return JsonResponse({
+                'status': self.object.status,
+                'download_url': '{0}?download=1'.format(reverse(
+                    'payslip_job', kwargs={'pk': self.object.pk}))
+                if self.object.status == PayslipJob.DONE else None,
+            })
+        return self.render_to_response(self.get_context_data(
+            object=self.object))
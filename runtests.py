@@ -3,14 +3,26 @@
 This script is used to run tests, create a coverage report and output the
 statistics at the end of the tox run.
 To run this script just execute ``tox``
+
+With ``--bench`` it runs the benchmarks instead and passes all following
+arguments to the ``payslip_benchmark`` command, e.g.
+``python runtests.py --bench --output benchmark.json``.
 """
+import pipes
 import re
+import sys
 
 from fabric.api import local, warn
 from fabric.colors import green, red
 
 
 if __name__ == '__main__':
+    if '--bench' in sys.argv:
+        args = sys.argv[sys.argv.index('--bench') + 1:]
+        local('python manage.py payslip_benchmark'
+              ' --settings=payslip.tests.settings {0}'.format(
+                  ' '.join(pipes.quote(arg) for arg in args)))
+        sys.exit()
     local('flake8 --ignore=E126 --ignore=W391 --statistics'
           ' --exclude=submodules,migrations,south_migrations,build .')
     local('coverage run --source="payslip" manage.py test -v 2'
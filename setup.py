@@ -28,5 +28,6 @@ setup(
         'weasyprint',
         'django-libs',
         'python-dateutil',
+        'futures;python_version<"3.0"',
     ],
 )